@@ -0,0 +1,7 @@
+"""
+Benchmarks of the libraries on deterministic synthetic databases
+
+    python -m benchmarks.run --sizes 1000,10000 --output results.json
+
+See corpus.py for the synthetic databases and run.py for the scenarios.
+"""
@@ -0,0 +1,226 @@
+"""
+Deterministic generator of synthetic cryptobib-like databases
+
+A corpus is made of:
+  - an abbreviation file (@string macros for booktitles, publishers, series and journals),
+  - a database file with, for each (conference, year), proceedings entries (possibly in several volumes)
+    and papers crossrefing them, journal articles and ePrint reports (howpublished "Cryptology ePrint Archive, Report
+    2010/123"),
+  - a config object (confs, first_keys, types, get_conf_name) to be used as mybibtex.generator.config.
+
+Keys follow the key scheme described in header.py (e.g., C:BelRog93, EC:ABCD10a, JC:Smith99).
+Names contain LaTeX accents and non-ASCII characters that can be transliterated into LaTeX.
+The same (size, seed) always gives the same files.
+"""
+
+import itertools
+import os
+import random
+import string
+
+from mybibtex.keygen import auth_label, parse_person
+
+first_names = [
+    "Mihir", "Phillip", "Daniele", "Thomas", "Douglas", "Anne", "Chloé", "José", "Søren", "Jürgen",
+    "François", "Zoë", "Ivan", "Wei", "Yuval", "Hoeteck", "Orr", "Shai", "Rafael", "Ingrid",
+]
+last_names = [
+    "Bellare", "Rogaway", "Micciancio", "Ristenpart", "Stinson", "Canteaut", "Stehlé", "Peña", "Jørgensen",
+    "Müller", "Fran{\\c c}ois", "Dunkelman", "Damg{\\aa}rd", "Nguy{\\~{\\^e}}n", "Ishai", "Wee", "Dunkelmann",
+    "Halevi", "Pass", "Verbauwhede", "Çelik", "Škorić", "Łuczak", "Dinur", "Shamir", "Biham", "Boneh", "Naor",
+    "Goldwasser", "Micali", "Lindell", "Katz", "Gennaro", "Krawczyk", "Tessaro", "Wichs", "Vaikuntanathan",
+]
+title_words = [
+    "Secure", "Efficient", "Lattice", "Encryption", "Signatures", "Zero-Knowledge", "Proofs", "Hash", "Functions",
+    "Multiparty", "Computation", "Attacks", "on", "with", "for", "the", "of", "{AES}", "{SHA-3}", "Revisited",
+    "Tight", "Security", "Quantum", "Obfuscation", "Commitments", "Key", "Exchange", "Side-Channel", "Analysis",
+]
+
+# (key, type, name, macro of booktitle/journal, first year, papers per year (relative weight))
+venues = [
+    ("C", "conf", "CRYPTO", "ac", 1981, 4),
+    ("EC", "conf", "EUROCRYPT", "ae", 1982, 4),
+    ("AC", "conf", "ASIACRYPT", "aac", 1991, 3),
+    ("TCC", "conf", "TCC", "tcc", 2004, 2),
+    ("PKC", "conf", "PKC", "pkc", 1998, 2),
+    ("CHES", "conf", "CHES", "ches", 1999, 2),
+    ("FSE", "conf", "FSE", "fse", 1993, 2),
+    ("CCS", "conf", "ACM CCS", "ccs", 1993, 3),
+    ("JC", "journal", "Journal of Cryptology", "joc", 1988, 1),
+    ("EPRINT", "misc", "IACR Cryptology ePrint Archive", None, 1996, 6),
+]
+last_year = 2023
+
+
+class SyntheticConfig(object):
+    """ Configuration of a synthetic corpus, with the same interface as db/config.py """
+
+    def __init__(self):
+        self.confs = {
+            key: {"key": key, "type": type_, "name": name, "dblp": "conf/{0}".format(key.lower())}
+            for (key, type_, name, macro, start_year, weight) in venues
+        }
+        self.first_keys = [
+            "author", "title", "booktitle", "journal", "howpublished", "editor", "publisher", "series", "volume",
+            "number", "pages", "year", "month", "doi", "crossref"
+        ]
+        self.types = {
+            "inproceedings": "InProceedings",
+            "proceedings": "Proceedings",
+            "article": "Article",
+            "misc": "Misc",
+        }
+        self.missing_years = {}
+
+    def get_conf_name(self, key):
+        return self.confs[key]["name"] if key in self.confs else key
+
+
+def _dis_letters():
+    """ a, b, ..., z, aa, ab, ... """
+    for n in itertools.count(1):
+        for letters in itertools.product(string.ascii_lowercase, repeat=n):
+            yield "".join(letters)
+
+
+class Corpus(object):
+    def __init__(self, size, seed=0):
+        """ Generate a corpus of about size entries (papers and proceedings) """
+        self.size = size
+        self.seed = seed
+        self.config = SyntheticConfig()
+        self.abbrev = self._abbrev()
+        self.db = self._db()
+
+    def _abbrev(self):
+        lines = [
+            '@string{lncs = "Lecture Notes in Computer Science"}',
+            '@string{spring = "Springer, Heidelberg"}',
+            '@string{acmp = "ACM Press"}',
+        ]
+        for (key, type_, name, macro, start_year, weight) in venues:
+            if macro is None:
+                continue
+            if type_ == "journal":
+                lines.append('@string{{{0} = "{1}"}}'.format(macro, name))
+            else:
+                lines.append('@string{{{0} = "Advances in Cryptology -- {1}"}}'.format(macro, name))
+        return "\n".join(lines) + "\n"
+
+    def _persons(self, r):
+        n = min(1 + int(r.expovariate(0.6)), 8)
+        return [
+            "{0} {1}".format(r.choice(first_names), r.choice(last_names))
+            for _ in range(n)
+        ]
+
+    def _title(self, r):
+        return " ".join(r.choice(title_words) for _ in range(r.randint(3, 10)))
+
+    def _db(self):
+        r = random.Random(self.seed)
+        total_weight = sum(weight * (last_year - start_year + 1) for (_, _, _, _, start_year, weight) in venues)
+        per_weight = max(self.size / total_weight, 0.01)
+
+        papers = []
+        """ list of (confkey, short year, author label, entry type, lines of the fields) """
+        proceedings = []
+        for (confkey, type_, name, macro, start_year, weight) in venues:
+            for year in range(start_year, last_year + 1):
+                n = int(per_weight * weight * r.uniform(0.8, 1.2) + r.random())
+                if n == 0:
+                    continue
+                short_year = year % 100
+
+                # proceedings, possibly split into several volumes
+                volumes = []
+                if type_ == "conf":
+                    nb_volumes = 1 if n < 60 else min(1 + n // 60, 4)
+                    for v in range(nb_volumes):
+                        pkey = "{0}{1:02d}".format(confkey, short_year) + ("-{0}".format(v + 1) if nb_volumes > 1 else "")
+                        part = ", Part {0}".format("I" * (v + 1)) if nb_volumes > 1 else ""
+                        proceedings.append("\n".join([
+                            "@Proceedings{{{0},".format(pkey),
+                            '  editor = "{0}",'.format(" and ".join(self._persons(r)[:2])),
+                            '  title = {0} # " {1}{2}",'.format(macro, year, part),
+                            '  booktitle = {0} # " {1}{2}",'.format(macro, year, part),
+                            "  publisher = {0},".format("spring" if confkey != "CCS" else "acmp"),
+                            "  series = lncs," if confkey != "CCS" else '  address = "New York",',
+                            "  volume = {0},".format(r.randint(300, 14000)),
+                            "  year = {0},".format(year),
+                            "  month = {0},".format(r.choice(["may", "aug", "dec", "apr"])),
+                            '  key = "{0} {1}",'.format(name, year),
+                            "}",
+                        ]))
+                        volumes.append(pkey)
+
+                page = 1
+                for i in range(n):
+                    persons = self._persons(r)
+                    label = auth_label([parse_person(p) for p in persons])
+                    fields = [
+                        '  author = "{0}",'.format(" and ".join(persons)),
+                        '  title = "{0}",'.format(self._title(r)),
+                    ]
+                    length = r.randint(8, 35)
+                    if type_ == "conf":
+                        fields.append('  pages = "{0}--{1}",'.format(page, page + length - 1))
+                        fields.append("  doi = \"10.1007/{0}_{1}\",".format(r.randint(100000, 999999), i))
+                        fields.append('  crossref = "{0}",'.format(volumes[i * len(volumes) // n]))
+                        entry_type = "InProceedings"
+                    elif type_ == "journal":
+                        fields.append("  journal = {0},".format(macro))
+                        fields.append("  volume = {0},".format(year - start_year + 1))
+                        fields.append("  number = {0},".format(r.randint(1, 4)))
+                        fields.append('  pages = "{0}--{1}",'.format(page, page + length - 1))
+                        fields.append("  year = {0},".format(year))
+                        entry_type = "Article"
+                    else:
+                        fields.append('  howpublished = "Cryptology ePrint Archive, Report {0}/{1:03d}",'.format(year, i + 1))
+                        fields.append('  note = "\\url{{https://eprint.iacr.org/{0}/{1:03d}}}",'.format(year, i + 1))
+                        fields.append("  year = {0},".format(year))
+                        entry_type = "Misc"
+                    page += length
+                    papers.append((confkey, short_year, label, entry_type, fields))
+
+        # keys: collisions get letters starting with a (see header.py)
+        groups = {}
+        for paper in papers:
+            groups.setdefault((paper[0], paper[2], paper[1]), []).append(paper)
+        entries = []
+        for ((confkey, label, short_year), group) in groups.items():
+            dis_list = [""] if len(group) == 1 else _dis_letters()
+            for (paper, dis) in zip(group, dis_list):
+                key = "{0}:{1}{2:02d}{3}".format(confkey, label, short_year, dis)
+                entries.append((key, paper[3], paper[4]))
+        r.shuffle(entries)
+
+        res = proceedings + [
+            "@{0}{{{1},\n{2}\n}}".format(entry_type, key, "\n".join(fields))
+            for (key, entry_type, fields) in entries
+        ]
+        return "\n\n".join(res) + "\n"
+
+    def bibyml(self):
+        """ Return a bibyml dictionary (as returned by bibyml.parse) with the venues and their years,
+        the venues being repeated so that the number of lines is about the size of the corpus """
+        copies = max(1, self.size // 500)
+        return {
+            "{0}{1}".format(key, i if i > 0 else ""): dict(
+                [("", name)] +
+                [(str(year), {"": "{0} {1}".format(name, year), "pages": {"": str(100 + year % 50)}})
+                 for year in range(start_year, last_year + 1)]
+            )
+            for i in range(copies)
+            for (key, type_, name, macro, start_year, weight) in venues
+        }
+
+    def write(self, dirname):
+        """ Write the corpus into dirname, return the filenames (abbrev, db) """
+        abbrev_filename = os.path.join(dirname, "abbrev0.bib")
+        db_filename = os.path.join(dirname, "crypto_db.bib")
+        with open(abbrev_filename, "w", encoding="utf8") as f:
+            f.write(self.abbrev)
+        with open(db_filename, "w", encoding="utf8") as f:
+            f.write(self.db)
+        return (abbrev_filename, db_filename)
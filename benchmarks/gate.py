@@ -0,0 +1,159 @@
+"""
+Performance regression gate
+
+    python -m benchmarks.gate            # compare to benchmarks/baseline.json, exit 1 on regression
+    python -m benchmarks.gate --update   # regenerate benchmarks/baseline.json
+
+Runs a fixed subset of the scenarios of run.py (parse, sort, bibtex_gen with crossrefs and with expansion,
+bibyml round-trip) and compares them to the committed baseline:
+  - times are the minimum over the repetitions, normalized by a calibration loop run before the scenarios,
+    so that a baseline recorded on another machine is still meaningful,
+  - a scenario is slower if its normalized time exceeds the baseline time by more than the time threshold
+    (or by more than 3 times the spread of the repetitions, if larger, up to max_time_threshold)
+    and by more than min_delta seconds,
+  - a scenario uses more memory if its peak memory exceeds the baseline one by more than the memory threshold
+    and by more than min_memory_delta bytes.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import run
+
+scenarios = [
+    "parse",
+    "sort_cold",
+    "bibtex_gen_crossref",
+    "bibtex_gen_expand",
+    "bibtex_gen_expand_values",
+    "bibyml_roundtrip",
+]
+size = 5000
+repeat = 5
+seed = 0
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+time_threshold = 0.20
+""" maximum relative slowdown """
+spread_factor = 3
+""" the time threshold is at least spread_factor times the relative spread (max - min) / min of the repetitions """
+max_time_threshold = 0.35
+""" maximum time threshold, whatever the spread (noisy runs cannot hide large slowdowns) """
+min_delta = 0.005
+""" slowdowns below min_delta seconds are ignored """
+memory_threshold = 0.10
+""" maximum relative memory growth """
+min_memory_delta = 1 << 20
+""" memory growths below min_memory_delta bytes are ignored """
+
+
+def calibrate(repeat=5):
+    """ Return the minimum time of a fixed pure-Python workload (dictionaries, strings, sorting) """
+    def workload():
+        d = {}
+        for i in range(200000):
+            d["key{0}".format(i % 5000)] = d.get("key{0}".format(i % 5000), 0) + i
+        sorted(d.items(), key=lambda item: (item[1] % 97, item[0]))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        workload()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure():
+    """ Run the gate scenarios and return the results (as run.run) with the calibration time """
+    results = run.run([size], scenarios, repeat=repeat, seed=seed, memory=True)
+    results["calibration"] = calibrate()
+    return results
+
+
+def _spread(res):
+    return (max(res["wall"]) - min(res["wall"])) / min(res["wall"])
+
+
+def compare(baseline, current):
+    """ Return the list of (scenario, message, is_regression) comparing current results to baseline results """
+    scale = baseline["calibration"] / current["calibration"]
+    baseline_results = {(res["scenario"], res["size"]): res for res in baseline["results"]}
+
+    report = []
+    for res in current["results"]:
+        base = baseline_results.get((res["scenario"], res["size"]))
+        if base is None:
+            report.append((res["scenario"], "not in baseline", False))
+            continue
+
+        messages = []
+        regression = False
+
+        base_time = base["wall_min"]
+        cur_time = res["wall_min"] * scale
+        threshold = min(max(time_threshold, spread_factor * max(_spread(base), _spread(res))), max_time_threshold)
+        delta = cur_time - base_time
+        messages.append("time {0:.4f}s -> {1:.4f}s ({2:+.1%}, threshold {3:.0%})".format(
+            base_time, cur_time, delta / base_time, threshold))
+        if delta > threshold * base_time and delta > min_delta:
+            regression = True
+
+        if base["peak_bytes"] is not None and res["peak_bytes"] is not None:
+            mem_delta = res["peak_bytes"] - base["peak_bytes"]
+            messages.append("memory {0:.1f} MiB -> {1:.1f} MiB ({2:+.1%})".format(
+                base["peak_bytes"] / 2**20, res["peak_bytes"] / 2**20, mem_delta / max(base["peak_bytes"], 1)))
+            if mem_delta > memory_threshold * base["peak_bytes"] and mem_delta > min_memory_delta:
+                regression = True
+
+        report.append((res["scenario"], ", ".join(messages), regression))
+    return report
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Compare benchmarks to the stored baseline")
+    p.add_argument("--baseline", default=default_baseline, help="baseline JSON file (default: benchmarks/baseline.json)")
+    p.add_argument("--update", action="store_true", help="store the results as the new baseline instead of comparing")
+    p.add_argument("--output", default=None, help="also store the current results in this JSON file")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    current = measure()
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+
+    if args.update:
+        with open(args.baseline, "w", encoding="utf8") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+        print("baseline {0} updated".format(args.baseline))
+        return 0
+
+    try:
+        with open(args.baseline, encoding="utf8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("no baseline {0}: run with --update to create it".format(args.baseline), file=sys.stderr)
+        return 2
+
+    report = compare(baseline, current)
+    for (scenario, message, regression) in report:
+        print("{0:<6} {1:<26} {2}".format("FAIL" if regression else "ok", scenario, message))
+
+    nb_regressions = sum(1 for (_, _, regression) in report if regression)
+    if nb_regressions > 0:
+        print("{0} scenario(s) regressed".format(nb_regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Run the benchmark scenarios on synthetic corpora (see corpus.py) and output the results as JSON
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --repeat 3 --output results.json
+
+For each scenario and size, the wall-clock and CPU times of each repetition are recorded,
+as well as the peak memory allocated during one additional run under tracemalloc (unless --no-memory).
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bibyml
+import confs_years
+from mybibtex import generator, parser
+from mybibtex.query import QueryFilter
+
+from .corpus import Corpus
+
+results_version = 1
+
+
+class Context(object):
+    """ Data shared by the scenarios of a given size """
+
+    def __init__(self, size, seed, dirname):
+        self.size = size
+        self.corpus = Corpus(size, seed)
+        (self.abbrev_filename, self.db_filename) = self.corpus.write(dirname)
+        generator.config = self.corpus.config
+        self.db = parse(self)
+        self.bibyml_tree = self.corpus.bibyml()
+        self.bibyml_text = bibyml.write_str(self.bibyml_tree)
+        self.sort = generator.SortConfYearPage()
+        self.sort.sort(generator.FilterPaper().filter(self.db.entries))  # warm cache for sort_warm
+
+
+def parse(ctx):
+    p = parser.Parser()
+    p.parse_file(ctx.abbrev_filename)
+    return p.parse_file(ctx.db_filename)
+
+
+def sort_cold(ctx):
+    """ sort with a new SortConfYearPage, whose caches (conference names, disambiguation strings) are empty """
+    generator.SortConfYearPage().sort(generator.FilterPaper().filter(ctx.db.entries))
+
+
+def sort_warm(ctx):
+    ctx.sort.sort(generator.FilterPaper().filter(ctx.db.entries))
+
+
+def sort_reference(ctx):
+    """ sort with the reference string key of SortConfYearPage, to compare with sort_cold and sort_warm """
+    sort = generator.SortConfYearPage()
+    sorted(generator.FilterPaper().filter(ctx.db.entries), key=sort.key)
+
+
+def filter_paper(ctx):
+    list(generator.FilterPaper().filter(ctx.db.entries))
+
+
+def filter_query(ctx):
+    list(QueryFilter("conf:C,EC,AC year:2005-2015 paper").filter(ctx.db.entries))
+
+
+def _bibtex_gen(**kwargs):
+    def run(ctx):
+        out = io.StringIO()
+        generator.bibtex_gen(out, ctx.db, entry_sort=generator.SortConfYearPage(), **kwargs)
+    return run
+
+
+def bibyml_parse(ctx):
+    bibyml.parse(io.StringIO(ctx.bibyml_text))
+
+
+def bibyml_write(ctx):
+    bibyml.write_str(ctx.bibyml_tree)
+
+
+def bibyml_roundtrip(ctx):
+    bibyml.write_str(bibyml.parse(io.StringIO(ctx.bibyml_text)))
+
+
+def get_confs_years(ctx):
+    confs_years.get_confs_years_inter(ctx.db, ctx.corpus.config.missing_years)
+
+
+scenarios = {
+    "parse": parse,
+    "sort_cold": sort_cold,
+    "sort_warm": sort_warm,
+    "sort_reference": sort_reference,
+    "filter_paper": filter_paper,
+    "filter_query": filter_query,
+    "bibtex_gen": _bibtex_gen(),
+    "bibtex_gen_crossref": _bibtex_gen(include_crossrefs=True),
+    "bibtex_gen_expand": _bibtex_gen(expand_crossrefs=True),
+    "bibtex_gen_expand_values": _bibtex_gen(expand_crossrefs=True, expand_values=True, remove_empty_fields=True),
+    "bibyml_parse": bibyml_parse,
+    "bibyml_write": bibyml_write,
+    "bibyml_roundtrip": bibyml_roundtrip,
+    "get_confs_years": get_confs_years,
+}
+
+
+def measure(fn, ctx, repeat=3, memory=True):
+    """ Return the measures of fn(ctx): times of each repetition (seconds) and peak traced memory (bytes) """
+    walls = []
+    cpus = []
+    for _ in range(repeat):
+        gc.collect()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        fn(ctx)
+        cpus.append(time.process_time() - cpu)
+        walls.append(time.perf_counter() - wall)
+
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "wall": walls,
+        "cpu": cpus,
+        "wall_min": min(walls),
+        "wall_median": statistics.median(walls),
+        "cpu_min": min(cpus),
+        "peak_bytes": peak,
+    }
+
+
+def run(sizes, names=None, repeat=3, seed=0, memory=True, log=None):
+    """ Run the scenarios names (all if None) for each size and return the results (dictionary, see main) """
+    if names is None:
+        names = list(scenarios)
+    unknown = [name for name in names if name not in scenarios]
+    if len(unknown) > 0:
+        raise ValueError("unknown scenarios: {0}".format(", ".join(unknown)))
+
+    results = []
+    old_config = generator.config
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as dirname:
+                ctx = Context(size, seed, dirname)
+                for name in names:
+                    res = measure(scenarios[name], ctx, repeat, memory)
+                    res["scenario"] = name
+                    res["size"] = size
+                    res["entries"] = len(ctx.db.entries)
+                    results.append(res)
+                    if log is not None:
+                        log(res)
+    finally:
+        generator.config = old_config
+
+    return {
+        "version": results_version,
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def format_result(res):
+    return "{0:<26} {1:>8} {2:>10.4f} {3:>10.4f} {4:>10.4f} {5:>12}".format(
+        res["scenario"],
+        res["size"],
+        res["wall_min"],
+        res["wall_median"],
+        res["cpu_min"],
+        "{0:.1f} MiB".format(res["peak_bytes"] / 2**20) if res["peak_bytes"] is not None else "-"
+    )
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Run benchmarks on synthetic corpora")
+    p.add_argument("--sizes", default="1000,10000", help="comma-separated sizes of the corpora (default: 1000,10000)")
+    p.add_argument("--scenarios", default=None, help="comma-separated scenarios (default: all): " + ", ".join(scenarios))
+    p.add_argument("--repeat", type=int, default=3, help="number of timed repetitions (default: 3)")
+    p.add_argument("--seed", type=int, default=0, help="seed of the corpora (default: 0)")
+    p.add_argument("--no-memory", action="store_true", help="do not measure peak memory with tracemalloc")
+    p.add_argument("--output", default=None, help="JSON output file (default: standard output)")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    names = args.scenarios.split(",") if args.scenarios is not None else None
+
+    print("{0:<26} {1:>8} {2:>10} {3:>10} {4:>10} {5:>12}".format(
+        "scenario", "size", "wall min", "wall med", "cpu min", "peak"), file=sys.stderr)
+    results = run(sizes, names, args.repeat, args.seed, not args.no_memory,
+                  log=lambda res: print(format_result(res), file=sys.stderr))
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
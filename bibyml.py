@@ -22,13 +22,18 @@ corresponds to the dictionnary:
 }
 """
 
+import marshal
+import os
 import re
 import io
-from collections import OrderedDict
+import tempfile
 import typing
 
-_parser_re = re.compile(r'^(\s*)([^:]+):(.*)$')
-_spaces_re = re.compile(r'^ *$')
+_parser_re = re.compile(r'^( *)([^:]+):(.*)$')
+
+cache_suffix = "c"
+""" suffix of the compiled cache of a bibyml file (see parse_path) """
+_cache_version = 1
 
 
 class ParserError(Exception):
@@ -44,7 +49,7 @@ def dict_get_path(d: dict, p: list, make=False):
     cur = d
     for i in p:
         if make and i not in cur:
-            cur[i] = OrderedDict()
+            cur[i] = {}
         cur = cur[i]
 
     return cur
@@ -52,74 +57,349 @@ def dict_get_path(d: dict, p: list, make=False):
 
 def parse(f: typing.TextIO) -> dict:
     """ Parse a bibyml file f intro a dictionnary """
-    res = OrderedDict()
-    # `path` is the path of the current element
-    path = []
-    # `path_indent` stores the indentation of all the elements along the path
-    #   + the indentation of the children in the path
-    # it can end by -1 if the indentation of the children is not yet known (i.e., before the first children)
-    path_indent = [0]
+    res = {}
+    # `stack` contains the open dictionnaries along the path of the current element,
+    # with the indentation of their children
+    stack = [(0, res)]
+    # `last` is the last element with its indentation: it is opened if the next line is more indented
+    last = None
+    match = _parser_re.match
 
     for line in f:
-        if line.strip() == "":
-            continue
-        r = _parser_re.match(line)
+        r = match(line)
         if r is None:
+            if line.strip() == "":
+                continue
             raise ParserError(line)
 
         (spaces_indent, key, value) = r.groups()
-        if _spaces_re.match(spaces_indent) is None:
+        if key[0].isspace() and key.lstrip(" ")[:1].isspace():
             raise ParserError(line, "only spaces are accepted")
-        value = value.strip()
-        key = key.strip()
         indent = len(spaces_indent)
 
-        if path_indent[-1] == -1:
-            if indent > path_indent[-2]:
+        if last is not None:
+            if indent > last[0]:
                 # new indentation level
-                path_indent[-1] = indent
-            else:
-                # no new indentation level
-                path_indent.pop()
-                path.pop()
+                stack.append((indent, last[1]))
+            last = None
 
         # find indentation level
-        while len(path_indent) > 1 and path_indent[-1] > indent:
-            path_indent.pop()
-            path.pop()
+        while len(stack) > 1 and stack[-1][0] > indent:
+            stack.pop()
 
-        if indent != path_indent[-1]:
+        if indent != stack[-1][0]:
             raise ParserError(line, "indentation problem")
 
-        d = dict_get_path(res, path)
-
-        d[key] = OrderedDict([("", value)]) if value != "" else OrderedDict()
-        path_indent.append(-1)  # we do not know the next indentation level
-        path.append(key)
+        value = value.strip()
+        d = {"": value} if value != "" else {}
+        stack[-1][1][key.strip()] = d
+        last = (indent, d)
 
     return res
 
 
-def write(out: typing.TextIO, d: dict, indent_key=4, indent_value=24, cur_indent=0) -> None:
+def _read_cache(cache_path: str, st: os.stat_result):
+    """ Return the tree stored in the cache if it is valid for the source file with stat st, None otherwise """
+    try:
+        with open(cache_path, "rb") as f:
+            (version, mtime_ns, size, tree) = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if version != _cache_version or mtime_ns != st.st_mtime_ns or size != st.st_size:
+        return None
+    return tree
+
+
+def _write_cache(cache_path: str, st: os.stat_result, tree: dict) -> None:
+    """ Atomically write the cache (errors are ignored, e.g., for read-only directories) """
+    try:
+        (fd, tmp_path) = tempfile.mkstemp(
+            prefix=".{0}.".format(os.path.basename(cache_path)),
+            dir=os.path.dirname(os.path.abspath(cache_path))
+        )
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump((_cache_version, st.st_mtime_ns, st.st_size, tree), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def parse_path(path: str, cache=True) -> dict:
+    """ Parse the bibyml file path intro a dictionnary.
+    If cache is True, the parsed dictionnary is stored in a compiled binary form in the file path + cache_suffix,
+    which is used instead of parsing as long as the modification time and the size of the file do not change """
+    st = os.stat(path)
+    cache_path = path + cache_suffix
+    if cache:
+        tree = _read_cache(cache_path, st)
+        if tree is not None:
+            return tree
+
+    with open(path, "r", encoding="utf8") as f:
+        tree = parse(f)
+
+    if cache:
+        _write_cache(cache_path, st, tree)
+    return tree
+
+
+def _format_line(indent: int, k: str, value: str, indent_value=24) -> str:
+    """ Return the line of the key k with value at indentation indent (number of spaces), as written by write """
+    if value != "":
+        return "{}{}: {}{}\n".format(
+            " "*indent,
+            k,
+            " "*(max(0, indent_value-(len(k)+2+indent))),
+            value
+        )
+    return "{}{}: \n".format(" "*indent, k)
+
+
+def _write_lines(lines: list, d: dict, indent_key: int, indent_value: int, indent: int) -> None:
+    """ Append to lines the lines of d at indentation indent (number of spaces) """
     for (k, v) in d.items():
         if k == "":
             continue
-        if "" in v and v[""] != "":
-            out.write("{}{}: {}{}\n".format(
-                " "*indent_key*cur_indent,
-                k,
-                " "*(max(0, indent_value-(len(k)+2+indent_key*cur_indent))),
-                v[""]
-            ))
-        else:
-            out.write("{}{}: \n".format(
-                " "*indent_key*cur_indent,
-                k
-            ))
-        write(out, v, cur_indent=cur_indent+1)
+        lines.append(_format_line(indent, k, v.get("", ""), indent_value))
+        _write_lines(lines, v, indent_key, indent_value, indent + indent_key)
+
+
+def write(out: typing.TextIO, d: dict, indent_key=4, indent_value=24, cur_indent=0) -> None:
+    lines = []
+    _write_lines(lines, d, indent_key, indent_value, indent_key*cur_indent)
+    out.write("".join(lines))
 
 
 def write_str(d: dict, *args, **kwargs) -> str:
     out = io.StringIO()
     write(out, d, *args, **kwargs)
     return out.getvalue()
+
+
+class _Node(object):
+    """ Position of a key in the lines of a bibyml file """
+    __slots__ = ("line", "end", "indent", "child_indent", "value")
+
+    def __init__(self, line, indent, value):
+        self.line = line
+        """ index of the line of the key (None for the root) """
+        self.end = line + 1 if line is not None else 0
+        """ index following the last line of the key and its descendants """
+        self.indent = indent
+        self.child_indent = None
+        """ indentation of the children, None if there is no child """
+        self.value = value
+
+
+def index_lines(lines: list) -> dict:
+    """ Return a dictionnary associating each path (tuple of keys) of the bibyml lines to its _Node
+    (the root being the empty path), following the same rules as parse """
+    root = _Node(None, -1, "")
+    root.child_indent = 0
+    index = {(): root}
+    # stack of the open elements (path, node), as in parse
+    stack = [((), root)]
+    last = None
+    match = _parser_re.match
+
+    for (i, line) in enumerate(lines):
+        r = match(line)
+        if r is None:
+            if line.strip() == "":
+                continue
+            raise ParserError(line)
+
+        (spaces_indent, key, value) = r.groups()
+        if key[0].isspace() and key.lstrip(" ")[:1].isspace():
+            raise ParserError(line, "only spaces are accepted")
+        indent = len(spaces_indent)
+
+        if last is not None:
+            if indent > last[1].indent:
+                last[1].child_indent = indent
+                stack.append(last)
+            last = None
+
+        while len(stack) > 1 and stack[-1][1].child_indent > indent:
+            stack.pop()
+
+        if indent != stack[-1][1].child_indent:
+            raise ParserError(line, "indentation problem")
+
+        for (_, node) in stack:
+            node.end = i + 1
+        path = stack[-1][0] + (key.strip(),)
+        node = _Node(i, indent, value.strip())
+        index[path] = node
+        last = (path, node)
+
+    root.end = len(lines)
+    return index
+
+
+class Patch(object):
+    """ Batched in-place updates of a bibyml file, rewriting only the affected lines.
+
+    >>> with Patch("confs.bibyml") as patch:
+    ...     patch.set(["eurocrypt", "2016"], "cc")
+    ...     patch.delete(["eurocrypt", "2013"])
+
+    Paths are lists of keys. Edits are applied in one atomic replacement of the file by apply
+    (called when leaving the with block without exception).
+    Rewritten and inserted lines follow the alignment rules of write (indent_key, indent_value),
+    new children of an existing key use the indentation of its existing children if any.
+    """
+
+    def __init__(self, filename: str, indent_key=4, indent_value=24):
+        self.filename = filename
+        self.indent_key = indent_key
+        self.indent_value = indent_value
+        with open(filename, "r", encoding="utf8", newline="") as f:
+            self.lines = f.readlines()
+        self.index = index_lines(self.lines)
+        self._replaced = {}
+        """ line index -> new line """
+        self._deleted = {}
+        """ path of deleted existing keys -> their node """
+        self._inserted = {}
+        """ path of an existing key -> dictionnary (as returned by parse) of the new keys to insert below it """
+
+    def _is_deleted(self, path: tuple) -> bool:
+        return any(path[:i] in self._deleted for i in range(1, len(path) + 1))
+
+    def _existing(self, path: tuple):
+        """ Return the node of path if it exists in the file and has not been deleted, None otherwise """
+        node = self.index.get(path)
+        if node is None or self._is_deleted(path):
+            return None
+        return node
+
+    def line_of(self, path: list):
+        """ Return the index of the line of the key path in the file, None if it does not exist """
+        node = self._existing(tuple(path))
+        return node.line if node is not None else None
+
+    def get(self, path: list):
+        """ Return the value of the key path after the edits, None if the key does not exist """
+        path = tuple(path)
+        node = self._existing(path)
+        if node is not None:
+            line = self._replaced.get(node.line)
+            return _parser_re.match(line).group(3).strip() if line is not None else node.value
+        for i in range(len(path) - 1, -1, -1):
+            if path[:i] in self._inserted and self._existing(path[:i]) is not None:
+                try:
+                    return dict_get_path(self._inserted[path[:i]], path[i:]).get("", "")
+                except KeyError:
+                    return None
+        return None
+
+    def set(self, path: list, value: str = "") -> None:
+        """ Set the value of the key path, creating it (and its missing parents) at the end of its parent """
+        path = tuple(path)
+        if len(path) == 0:
+            raise ValueError("empty path")
+        value = value.strip()
+        node = self._existing(path)
+        if node is not None:
+            if value == node.value:
+                self._replaced.pop(node.line, None)
+            else:
+                self._replaced[node.line] = _format_line(node.indent, path[-1], value, self.indent_value)
+            return
+
+        # deepest existing ancestor
+        i = len(path) - 1
+        while self._existing(path[:i]) is None:
+            i -= 1
+        d = dict_get_path(self._inserted.setdefault(path[:i], {}), path[i:], make=True)
+        if value != "":
+            d[""] = value
+        else:
+            d.pop("", None)
+
+    def delete(self, path: list) -> None:
+        """ Delete the key path and all its descendants """
+        path = tuple(path)
+        if len(path) == 0:
+            raise ValueError("empty path")
+        node = self._existing(path)
+        if node is None:
+            for i in range(len(path) - 1, -1, -1):
+                if path[:i] in self._inserted and self._existing(path[:i]) is not None:
+                    try:
+                        parent = dict_get_path(self._inserted[path[:i]], path[i:-1])
+                        del parent[path[-1]]
+                        return
+                    except KeyError:
+                        break
+            raise KeyError(path)
+
+        self._deleted[path] = node
+        for line in range(node.line, node.end):
+            self._replaced.pop(line, None)
+        for anchor in [p for p in self._inserted if p[:len(path)] == path]:
+            del self._inserted[anchor]
+
+    def render(self) -> str:
+        """ Return the content of the file after the edits """
+        deleted_lines = set()
+        for node in self._deleted.values():
+            deleted_lines.update(range(node.line, node.end))
+
+        # new lines to insert before each line index, deepest keys first
+        insertions = {}
+        for (anchor, d) in sorted(self._inserted.items(), key=lambda item: -len(item[0])):
+            node = self.index[anchor]
+            indent = node.child_indent if node.child_indent is not None else node.indent + self.indent_key
+            lines = insertions.setdefault(node.end, [])
+            _write_lines(lines, d, self.indent_key, self.indent_value, indent)
+
+        res = []
+        for (i, line) in enumerate(self.lines):
+            if i in insertions:
+                res.extend(insertions[i])
+            if i not in deleted_lines:
+                res.append(self._replaced.get(i, line))
+        if len(self.lines) in insertions:
+            if len(res) > 0 and not res[-1].endswith("\n"):
+                res[-1] += "\n"
+            res.extend(insertions[len(self.lines)])
+        return "".join(res)
+
+    def apply(self) -> bool:
+        """ Atomically replace the file if there are edits. Return True if the file has been replaced. """
+        if len(self._replaced) == 0 and len(self._deleted) == 0 and all(len(d) == 0 for d in self._inserted.values()):
+            return False
+        content = self.render()
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        (fd, tmp_filename) = tempfile.mkstemp(prefix=".{0}.".format(os.path.basename(self.filename)), dir=dirname)
+        try:
+            with os.fdopen(fd, "w", encoding="utf8", newline="") as f:
+                f.write(content)
+            os.chmod(tmp_filename, os.stat(self.filename).st_mode & 0o7777)
+            os.replace(tmp_filename, self.filename)
+        except BaseException:
+            os.remove(tmp_filename)
+            raise
+
+        # the file has been replaced: edits are now part of the lines
+        self.lines = content.splitlines(True)
+        self.index = index_lines(self.lines)
+        self._replaced = {}
+        self._deleted = {}
+        self._inserted = {}
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.apply()
@@ -2,50 +2,63 @@
 This library enables to get the list of confs with years from a mybibtex.database
 """
 
+from mybibtex import diagnostics
 from mybibtex import tools
 
-import logging
 
+def _years_to_bits(years) -> int:
+    """ Return the bitset of a set of years, or the bitset itself if years is already an int """
+    if isinstance(years, int):
+        return years
+    bits = 0
+    for year in years:
+        bits |= tools.year_bit(year)
+    return bits
+
+
+def get_confs_years_bits(db) -> dict:
+    """ Return a dict associating a conference key to the bitset of years (see tools.year_bit) present in db
+    This coverage is maintained by db, so this takes constant time (the result must not be modified) """
+    if hasattr(db, "confs_years"):
+        return db.confs_years()
 
-def get_confs_years(db) -> dict:
-    """ Return a dict associating a conference key to the set of years present in db """
     confs = {}
-    for (key, entry) in db.entries.items():
+    for key in db.entries:
         if key.auth is None:
             continue  # we are only interested in papers !
-        conf = key.confkey
-        if conf not in confs:
-            confs[conf] = set()
-        confs[conf].add(tools.short_to_full_year(key.year))
-
+        confs[key.confkey] = confs.get(key.confkey, 0) | tools.year_bit(tools.short_to_full_year(key.year))
     return confs
 
 
+def get_confs_years(db) -> dict:
+    """ Return a dict associating a conference key to the set of years present in db """
+    return {
+        conf: set(tools.bits_to_years(bits))
+        for (conf, bits) in get_confs_years_bits(db).items()
+    }
+
+
 def get_confs_years_inter_from_set(confs: dict, missing_years) -> dict:
-    """ Convert a dictionnary of conferences (keys) with set of years
+    """ Convert a dictionnary of conferences (keys) with set of years (or bitsets of years)
     to a dictionnary of conferences with intervals, i.e., tuples (start year, end year)
     If some years are missing, log it except if missing_years[conf] contain this year """
 
-    def get_missing_years(conf):
-        if conf in missing_years:
-            return missing_years[conf]
-        else:
-            return set()
-
     def set_to_tuple(conf, years):
-        min_year = min(years)
-        max_year = max(years)
-        years = years | get_missing_years(conf)
-        if not (set(range(min_year, max_year + 1)) <= years):
-            mis_years = set(range(min_year, max_year + 1)) - years
-            min_year = max(mis_years) + 1
-            logging.warning(
-                "For conference \"{}\", years {} are missing - so min year={} "
-                "- to add an exception please modify db/config.py - variable missing_years".format(
-                    conf,
-                    ", ".join([str(y) for y in sorted(list(mis_years))]),
-                    min_year
-                ))
+        years = _years_to_bits(years)
+        min_bit = (years & -years).bit_length() - 1
+        max_bit = years.bit_length() - 1
+        min_year = tools.BASE_YEAR + min_bit
+        max_year = tools.BASE_YEAR + max_bit
+        full = ((1 << (max_bit + 1)) - 1) ^ ((1 << min_bit) - 1)
+        mis_years = full & ~(years | _years_to_bits(missing_years.get(conf, 0)))
+        if mis_years != 0:
+            min_year = tools.BASE_YEAR + mis_years.bit_length()  # highest missing year + 1
+            diagnostics.report(
+                diagnostics.MISSING_YEARS,
+                conf,
+                years=", ".join([str(y) for y in tools.bits_to_years(mis_years)]),
+                min_year=min_year
+            )
         return min_year, max_year
 
     confs_inter = {
@@ -56,4 +69,4 @@ def get_confs_years_inter_from_set(confs: dict, missing_years) -> dict:
 
 
 def get_confs_years_inter(db, confs_missing_years):
-    return get_confs_years_inter_from_set(get_confs_years(db), confs_missing_years)
+    return get_confs_years_inter_from_set(get_confs_years_bits(db), confs_missing_years)
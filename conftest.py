@@ -0,0 +1,66 @@
+"""
+Fixtures shared by the tests of mybibtex/tests and tests
+"""
+
+import functools
+import io
+
+import pytest
+
+from benchmarks.corpus import Corpus
+from mybibtex import diagnostics, generator, parser
+
+
+class Config(object):
+    """ Minimal configuration (see db/config.py) """
+
+    def __init__(self, confs=None):
+        self.confs = confs if confs is not None else {
+            "C": {"key": "C", "type": "conf", "name": "CRYPTO", "dblp": "conf/crypto"},
+            "EC": {"key": "EC", "type": "conf", "name": "EUROCRYPT", "dblp": "conf/eurocrypt"},
+            "JC": {"key": "JC", "type": "journal", "name": "Journal of Cryptology"},
+        }
+        self.first_keys = ["author", "title"]
+        self.types = {}
+
+    def get_conf_name(self, confkey):
+        return self.confs[confkey]["name"]
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """ Config() as generator.config """
+    config = Config()
+    monkeypatch.setattr(generator, "config", config)
+    return config
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    """ new diagnostics collector, replacing the default one """
+    collector = diagnostics.Collector()
+    monkeypatch.setattr(diagnostics, "collector", collector)
+    return collector
+
+
+@functools.lru_cache(maxsize=None)
+def get_corpus(size, seed):
+    """ Corpus(size, seed), generated once per test session (corpora must not be modified) """
+    return Corpus(size, seed)
+
+
+def parse_corpus(corpus):
+    """ Return the database of the corpus (its abbreviations parsed first) """
+    p = parser.Parser()
+    p.parse_stream(io.StringIO(corpus.abbrev))
+    return p.parse_stream(io.StringIO(corpus.db))
+
+
+@pytest.fixture
+def corpus_db(monkeypatch):
+    """ corpus_db(size, seed) returns the parsed database of Corpus(size, seed), its config being generator.config """
+    def make(size, seed=0):
+        corpus = get_corpus(size, seed)
+        monkeypatch.setattr(generator, "config", corpus.config)
+        return parse_corpus(corpus)
+    return make
@@ -1,4 +1,5 @@
 import datetime
+import re
 from string import Template
 
 header_template = """% File generated by "$script"
@@ -87,6 +88,11 @@ ${conf_labels}%
 """
 
 
+timestamp_line_re = re.compile(r"^%      \d{4}-\d{2}-\d{2}$")
+""" regular expression matching the line of the header containing the timestamp
+(to ignore it when comparing generated files, see mybibtex.output.AtomicOutput) """
+
+
 def get_header(config, script, conf_years=None):
     timestamp = datetime.date.today().isoformat()
 
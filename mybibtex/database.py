@@ -20,8 +20,10 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import re
+import hashlib
 
 from collections.abc import Mapping
+from types import MappingProxyType
 from functools import total_ordering
 
 from pybtex.exceptions import PybtexError
@@ -33,6 +35,7 @@ from pybtex.errors import report_error
 from pybtex import textutils
 
 from .month_names import month_names
+from . import tools
 
 _whitespace_re = re.compile(r'\s+')
 
@@ -44,10 +47,39 @@ class BibliographyDataError(PybtexError):
     pass
 
 
+def add_coverage(conf_year_counts, confs_years, confkey, year, delta):
+    """ Add delta papers to (confkey, full year) in the dictionaries conf_year_counts ((confkey, year) -> number of
+    papers) and confs_years (confkey -> bitset of the years having papers), see BibliographyData.confs_years """
+    count = conf_year_counts.get((confkey, year), 0) + delta
+    if count > 0:
+        conf_year_counts[(confkey, year)] = count
+        confs_years[confkey] = confs_years.get(confkey, 0) | tools.year_bit(year)
+        return
+    del conf_year_counts[(confkey, year)]
+    bits = confs_years[confkey] & ~tools.year_bit(year)
+    if bits == 0:
+        del confs_years[confkey]
+    else:
+        confs_years[confkey] = bits
+
+
+class EntryDict(dict):
+    """ Dictionary key -> entry of a BibliographyData, with a counter of the mutations done through
+    BibliographyData (add_entry, replace_entry, remove_entry), used to check that indexes are up to date """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.mutations = 0
+
+
 class BibliographyData(object):
     def __init__(self, entries=None, preamble=None):
-        self.entries = dict() #OrderedCaseInsensitiveDict()
+        self.entries = EntryDict() #OrderedCaseInsensitiveDict()
         self._preamble = []
+        self._conf_year_counts = {}
+        """ number of papers per (conference key, full year) """
+        self._confs_years = {}
+        """ coverage: dictionary conference key -> bitset of the full years having papers (bit y set iff year y) """
         if entries:
             if isinstance(entries, Mapping):
                 entries = iter(entries.items())
@@ -76,6 +108,11 @@ class BibliographyData(object):
     def preamble(self):
         return ''.join(self._preamble)
 
+    @property
+    def mutations(self):
+        """ number of entries added, replaced or removed since the creation of the database """
+        return self.entries.mutations
+
     def add_entry(self, key, entry):
         if not isinstance(key, EntryKey):
             key = EntryKey.from_string(key)
@@ -84,12 +121,51 @@ class BibliographyData(object):
             return
         entry.collection = self
         entry.key = key
+        entry.invalidate()
         self.entries[key] = entry
+        self.entries.mutations += 1
+        if key.auth is not None:
+            self._add_coverage(key.confkey, tools.short_to_full_year(key.year), 1)
 
     def add_entries(self, entries):
         for key, entry in entries:
             self.add_entry(key, entry)
 
+    def replace_entry(self, key, entry):
+        """ Replace the entry key (which has to exist) by entry, keeping its position, and return the old entry """
+        if not isinstance(key, EntryKey):
+            key = EntryKey.from_string(key)
+        old = self.entries[key]
+        old.collection = None
+        old.invalidate()
+        entry.collection = self
+        entry.key = key
+        entry.invalidate()
+        self.entries[key] = entry
+        self.entries.mutations += 1
+        return old
+
+    def remove_entry(self, key):
+        """ Remove the entry key from the database and return it """
+        if not isinstance(key, EntryKey):
+            key = EntryKey.from_string(key)
+        entry = self.entries.pop(key)
+        self.entries.mutations += 1
+        entry.collection = None
+        entry.invalidate()
+        if key.auth is not None:
+            self._add_coverage(key.confkey, tools.short_to_full_year(key.year), -1)
+        return entry
+
+    def _add_coverage(self, confkey, year, delta):
+        add_coverage(self._conf_year_counts, self._confs_years, confkey, year, delta)
+
+    def confs_years(self):
+        """ Return the coverage of the papers of the database, maintained by add_entry and remove_entry:
+        dictionary conference key -> bitset of the full years having papers (see tools.year_bit).
+        The dictionary must not be modified. """
+        return self._confs_years
+
 class FieldDict(dict):
     def __init__(self, parent, *args, **kwargw):
         self.parent = parent
@@ -103,6 +179,26 @@ class FieldDict(dict):
         else:
             raise KeyError(key)
 
+    # modifications of the fields invalidate the cached data of the parent entry (e.g., its fingerprint)
+    def __setitem__(self, key, value):
+        self.parent.invalidate()
+        dict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        self.parent.invalidate()
+        dict.__delitem__(self, key)
+    def update(self, *args, **kwargs):
+        self.parent.invalidate()
+        dict.update(self, *args, **kwargs)
+    def pop(self, *args):
+        self.parent.invalidate()
+        return dict.pop(self, *args)
+    def setdefault(self, key, default=None):
+        self.parent.invalidate()
+        return dict.setdefault(self, key, default)
+    def clear(self):
+        self.parent.invalidate()
+        dict.clear(self)
+
 
 class Entry(object):
     """Bibliography entry. Important members are:
@@ -115,6 +211,8 @@ class Entry(object):
             fields = {}
         if persons is None:
             persons = {}
+        self._fingerprint = None
+        self._inheritable_fields = None
         self.type = type_
         self.fields = FieldDict(self, fields)
         self.persons = dict(persons)
@@ -143,8 +241,41 @@ class Entry(object):
         return self.collection.entries[EntryKey.from_string(self.fields['crossref'].expand())]
 
     def add_person(self, person, role):
+        self.invalidate()
         self.persons.setdefault(role, []).append(person)
 
+    def invalidate(self):
+        """ Invalidate cached data (fingerprint, ...)
+        Has to be called if the entry is modified without using fields or add_person (e.g., values modified in place) """
+        self._fingerprint = None
+        self._inheritable_fields = None
+
+    def inheritable_fields(self):
+        """ Return the (read-only) fields inherited by entries crossrefing this entry when crossrefs are expanded,
+        i.e., all the fields except "key".
+        The result is cached until the entry is modified. """
+        if self._inheritable_fields is None:
+            fields = dict(self.fields)
+            fields.pop("key", None) # a bit of a hack TODO...
+            self._inheritable_fields = MappingProxyType(fields)
+        return self._inheritable_fields
+
+    def fingerprint(self):
+        """ Return a digest (hex string) of the entry: its key, type, fields (including macro values) and persons.
+        Two entries with the same fingerprint are written the same way.
+        The fingerprint is cached until the entry is modified. """
+        if self._fingerprint is None:
+            parts = [str(getattr(self, "key", "")), self.type]
+            for name in sorted(self.fields.keys()):
+                parts.append(name)
+                for value_part in self.fields[name]:
+                    parts.append(value_part.fingerprint_str())
+            for role in sorted(self.persons.keys()):
+                parts.append(role)
+                parts.extend(str(person) for person in self.persons[role])
+            self._fingerprint = hashlib.blake2b("\x00".join(parts).encode("utf8"), digest_size=16).hexdigest()
+        return self._fingerprint
+
 
 class Person(object):
     """Represents a person (usually human).
@@ -328,39 +459,6 @@ class Person(object):
     def lineage(self, abbr=False):
         return self.get_part('lineage', abbr)
 
-        self.entries[key] = entry
-        try:
-            crossref = entry.fields['crossref'].expand()
-        except KeyError:
-            pass
-        else:
-            self.crossref_count[crossref] += 1
-            if self.crossref_count[crossref] >= self.min_crossrefs:
-                if self.wanted_entries is not None:
-                    self.wanted_entries.add(crossref)
-
-    def add_entries(self, entries):
-        for key, entry in entries:
-            self.add_entry(key, entry)
-
-class FieldDict(dict):
-    def __init__(self, parent, *args, **kwargw):
-        self.parent = parent
-        dict.__init__(self, *args, **kwargw)
-    def __missing__(self, key):
-        if key in self.parent.persons:
-            persons = self.parent.persons[key]
-            return ' and '.join(str(person) for person in persons)
-        elif 'crossref' in self:
-            return self.parent.get_crossref().fields[key]
-        else:
-            raise KeyError(key)
-        self.entries[key] = entry
-
-    def add_entries(self, entries):
-        for key, entry in entries:
-            self.add_entry(key, entry)
-
 class EntryKeyParsingError(Exception):
     def __init__(self, key):
         self.key = key
@@ -410,6 +508,8 @@ class EntryKey(object):
 class Value(list):
     """ Model a value in bibtex, i.e., a concatenation of value parts """
     def expand(self):
+        if len(self) == 1:
+            return self[0].expand()
         return ''.join([value_part.expand() for value_part in self])
 
     def __repr__(self):
@@ -438,6 +538,10 @@ class ValuePart(object):
     def to_bib(self, expand=False):
         return str(self)
 
+    def fingerprint_str(self):
+        """ Return a string identifying the value part (used for Entry.fingerprint) """
+        return type(self).__name__ + ":" + self.val
+
 class ValuePartNumber(ValuePart):
     pass
 
@@ -466,6 +570,9 @@ class ValuePartMacro(ValuePart):
     def expand(self):
         return self.macro_val.expand()
 
+    def fingerprint_str(self):
+        return "Macro:" + self.macro_name + "=" + self.macro_val.to_bib(expand=True)
+
     def to_bib(self, expand=False):
         if expand==False or self.macro_name in month_names:
             return self.macro_name
@@ -0,0 +1,276 @@
+"""
+Streaming importer of the DBLP XML dump (dblp.xml)
+
+>>> db_new = dblp.import_dblp("dblp.xml", db)
+
+The dump is fed by chunks to an XML parser whose target only keeps the record being parsed,
+so memory does not depend on the size of the dump but only on the number of imported records: the entries of the
+imported venues are kept until the end of the dump, since paper keys are generated all at once and the dump does not
+order papers after their proceedings (for the IACR venues, a few tens of thousands of entries).
+Records (inproceedings, proceedings, article) are filtered by venue: the prefix of their DBLP key
+(e.g., "conf/crypto" for "conf/crypto/BellareR93") is mapped to a conference key using the field "dblp"
+of config.confs (or an explicit dictionary).
+
+Imported entries follow our conventions:
+  - proceedings keys are confkey + 2 digits of the year of the conference (+ "-1", "-2"... for multi-volume
+    proceedings), e.g., C93 for "conf/crypto/1993", C20-1 for "conf/crypto/2020-1",
+  - papers crossref their proceedings, and their keys are generated with keygen.KeyGenerator
+    (against the existing database if given, all at once so that collisions get letters).
+Papers whose proceedings is neither imported nor in the existing database are skipped (diagnostics.DBLP_SKIPPED),
+so that imported crossrefs always resolve.
+
+HTML entities used by the dump (e.g., &uuml;) are resolved without reading dblp.dtd: the parser gets the table
+html.entities.name2codepoint, and never loads external entities (expat does not fetch them).
+Entities declared in an internal DTD subset are still expanded (expat >= 2.4.1 limits their amplification,
+i.e., "billion laughs" documents), and the target discards all the content outside the fields of the kept records:
+the dump is expected to come from DBLP, not from untrusted users.
+"""
+
+import collections
+import html.entities
+import re
+import xml.etree.ElementTree as ET
+
+from .database import BibliographyData, Entry, EntryKey, Value, ValuePartNumber, ValuePartQuote
+from .keygen import EntryKeyGenerationError, KeyGenerator
+from . import diagnostics
+from . import generator
+from . import tools
+
+record_types = ("inproceedings", "proceedings", "article")
+
+DblpRecord = collections.namedtuple("DblpRecord", ["type", "key", "fields"])
+""" record of the dump: type (tag), DBLP key and dictionary field name -> list of values (strings) """
+
+
+def dblp_prefix(dblp_key):
+    """ conf/crypto/BellareR93 -> conf/crypto """
+    return dblp_key.rsplit("/", 1)[0]
+
+
+class _Target(object):
+    """ Target of the XML parser keeping only the current record """
+
+    def __init__(self, prefixes=None):
+        self.prefixes = prefixes
+        self.records = collections.deque()
+        self.depth = 0
+        self.record = None
+        self.field = None
+        self.text = []
+
+    def start(self, tag, attrib):
+        self.depth += 1
+        if self.depth == 2:
+            key = attrib.get("key")
+            if tag in record_types and key is not None and (self.prefixes is None or dblp_prefix(key) in self.prefixes):
+                self.record = DblpRecord(tag, key, {})
+        elif self.depth == 3 and self.record is not None:
+            self.field = tag
+            self.text = []
+
+    def data(self, data):
+        if self.field is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        if self.depth == 3 and self.field is not None:
+            self.record.fields.setdefault(self.field, []).append("".join(self.text))
+            self.field = None
+        elif self.depth == 2 and self.record is not None:
+            self.records.append(self.record)
+            self.record = None
+        self.depth -= 1
+
+    def close(self):
+        pass
+
+
+def iter_records(source, prefixes=None, chunk_size=1 << 20):
+    """ Iterate over the records of the dump source (filename or binary file),
+    only keeping the ones whose key prefix is in prefixes (if not None) """
+    target = _Target(prefixes)
+    parser = ET.XMLParser(target=target)
+    parser.entity.update((name, chr(codepoint)) for (name, codepoint) in html.entities.name2codepoint.items())
+
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            while target.records:
+                yield target.records.popleft()
+        parser.close()
+        while target.records:
+            yield target.records.popleft()
+    finally:
+        if f is not source:
+            f.close()
+
+
+_proceedings_year_re = re.compile(r"^(\d{4})(-\d+)?$")
+_name_number_re = re.compile(r"\s+\d{4}$")
+_doi_re = re.compile(r"^https?://(?:dx\.)?doi\.org/(.+)$")
+
+
+def proceedings_key(confkey, dblp_key, year=None):
+    """ Return the EntryKey of proceedings from its DBLP key (conf/crypto/2020-1 -> C20-1),
+    year being used if the DBLP key does not end with the year """
+    r = _proceedings_year_re.match(dblp_key.rsplit("/", 1)[-1])
+    if r is not None:
+        return EntryKey(confkey, int(r.group(1)), None, r.group(2) or "")
+    if year is None:
+        raise ValueError("no year for proceedings {0}".format(dblp_key))
+    return EntryKey(confkey, int(year), None, "")
+
+
+def _quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+def _number_or_quote(s):
+    return Value([ValuePartNumber(s)]) if s.isdigit() else _quote(s)
+
+
+def _first(record, name):
+    values = record.fields.get(name)
+    return values[0].strip() if values else None
+
+
+def _person_names(record, role):
+    return [_name_number_re.sub("", name.strip()) for name in record.fields.get(role, [])]
+
+
+def _title(s):
+    s = s.strip()
+    return s[:-1] if s.endswith(".") and not s.endswith("..") else s
+
+
+def _doi(record):
+    for ee in record.fields.get("ee", []):
+        r = _doi_re.match(ee.strip())
+        if r is not None:
+            return r.group(1)
+    return None
+
+
+def record_to_entry(record, confkey):
+    """ Return the Entry of a record of the venue confkey (keys of crossrefs already converted) """
+    fields = {}
+    year = _first(record, "year")
+
+    if record.type == "proceedings":
+        entry = Entry("proceedings")
+        editors = _person_names(record, "editor")
+        if editors:
+            fields["editor"] = _quote(" and ".join(editors))
+        title = _first(record, "title")
+        if title is not None:
+            fields["title"] = _quote(_title(title))
+            fields["booktitle"] = _quote(_title(title))
+        for name in ("publisher", "series"):
+            value = _first(record, name)
+            if value is not None:
+                fields[name] = _quote(value)
+        volume = _first(record, "volume")
+        if volume is not None:
+            fields["volume"] = _number_or_quote(volume)
+        if year is not None:
+            fields["year"] = _number_or_quote(year)
+        conf_year = proceedings_key(confkey, record.key, year).year
+        fields["key"] = _quote("{0} {1}".format(
+            generator.config.get_conf_name(confkey),
+            tools.short_to_full_year(conf_year)
+        ))
+    else:
+        entry = Entry(record.type)
+        authors = _person_names(record, "author")
+        if authors:
+            fields["author"] = _quote(" and ".join(authors))
+        title = _first(record, "title")
+        if title is not None:
+            fields["title"] = _quote(_title(title))
+        if record.type == "article":
+            journal = _first(record, "journal")
+            if journal is not None:
+                fields["journal"] = _quote(journal)
+            for name in ("volume", "number"):
+                value = _first(record, name)
+                if value is not None:
+                    fields[name] = _number_or_quote(value)
+        pages = _first(record, "pages")
+        if pages is not None:
+            fields["pages"] = _quote(pages.replace("--", "-").replace("-", "--"))
+        if record.type == "article" or "crossref" not in record.fields:
+            if year is not None:
+                fields["year"] = _number_or_quote(year)
+        doi = _doi(record)
+        if doi is not None:
+            fields["doi"] = _quote(doi)
+        crossref = _first(record, "crossref")
+        if crossref is not None:
+            fields["crossref"] = _quote(str(proceedings_key(confkey, crossref, year)))
+
+    for (name, value) in fields.items():
+        entry.fields[name] = value
+    return entry
+
+
+def default_venues():
+    """ Return the dictionary DBLP key prefix -> conference key from the field "dblp" of config.confs """
+    return {
+        conf["dblp"]: confkey
+        for (confkey, conf) in generator.config.confs.items()
+        if conf.get("dblp")
+    }
+
+
+def import_dblp(source, db=None, venues=None, chunk_size=1 << 20):
+    """ Import the records of the venues of the DBLP dump source (filename or binary file)
+    into a new BibliographyData, which is returned.
+
+    @arg db: existing database: its proceedings are not imported again, and keys of new papers do not collide with it
+    @arg venues: dictionary DBLP key prefix (e.g., "conf/crypto") -> conference key (default: default_venues())
+    """
+    if venues is None:
+        venues = default_venues()
+    res = BibliographyData()
+    existing = db.entries if db is not None else {}
+
+    papers = {}
+    """ conference key -> list of pairs (DBLP key, entry) of papers (keys are generated at the end, all at once,
+    so all the imported papers are kept in memory until the end of the dump) """
+    for record in iter_records(source, venues, chunk_size):
+        confkey = venues[dblp_prefix(record.key)]
+        try:
+            entry = record_to_entry(record, confkey)
+        except ValueError as e:
+            diagnostics.report(diagnostics.DBLP_SKIPPED, record.key, reason=str(e))
+            continue
+        if record.type == "proceedings":
+            key = proceedings_key(confkey, record.key, _first(record, "year"))
+            if key not in existing and key not in res.entries:
+                res.add_entry(key, entry)
+        else:
+            papers.setdefault(confkey, []).append((record.key, entry))
+
+    keygen = KeyGenerator(db)
+    for (confkey, entries) in papers.items():
+        valid = []
+        for (dblp_key, entry) in entries:
+            if "crossref" in entry.fields:
+                crossref = EntryKey.from_string(entry.fields["crossref"].expand())
+                if crossref not in res.entries and crossref not in existing:
+                    diagnostics.report(diagnostics.DBLP_SKIPPED, dblp_key, reason="missing proceedings {0}".format(crossref))
+                    continue
+            try:
+                keygen.label(entry, confkey)
+                valid.append(entry)
+            except EntryKeyGenerationError as e:
+                diagnostics.report(diagnostics.DBLP_SKIPPED, dblp_key, reason=str(e))
+        for (key, entry) in zip(keygen.generate(valid, confkey), valid):
+            res.add_entry(key, entry)
+
+    return res
@@ -0,0 +1,211 @@
+"""
+Aggregated diagnostics (warnings about entries, conferences...)
+
+Diagnostics have a typed code (Code) and optionally the entry key and the field they are about:
+
+>>> diagnostics.report(diagnostics.INCORRECT_PAGES, key, "pages", pages="1-2-3")
+
+Messages are only formatted when they are actually output (by the logging handler),
+and each code is rate-limited: only the first `limit` diagnostics of a code are logged, the others are only counted.
+The counters of a run are available in `collector.counts` and can be logged as a summary table.
+
+Logging to the console can be made non-blocking with ConsoleSink, which moves the handlers of the root logger
+(e.g., the colored StreamHandler of logging_colorer) behind a queue and logs the summary table when stopped:
+
+>>> with diagnostics.ConsoleSink():
+...     bibtex_gen(out, db)
+"""
+
+import collections
+import logging
+import logging.handlers
+import queue
+
+logger = logging.getLogger("mybibtex")
+
+codes = {}
+""" registered codes: name -> Code """
+
+
+def get_code(name):
+    return codes[name]
+
+
+class Code(object):
+    """ Type of diagnostic: name, logging level and message template
+    (formatted with the arguments of the diagnostic, key and field included) """
+
+    def __init__(self, name, template, level=logging.WARNING, limited=True):
+        self.name = name
+        self.template = template
+        self.level = level
+        self.limited = limited
+        """ if False, all the diagnostics of this code are logged (rare diagnostics that must all be seen) """
+        codes[name] = self
+
+    def __repr__(self):
+        return "Code({0})".format(self.name)
+
+    def __reduce__(self):
+        # codes are unique: unpickling (e.g., from a worker process) returns the registered code
+        return (get_code, (self.name,))
+
+
+INCORRECT_PAGES = Code(
+    "incorrect-pages",
+    "Problem in entry \"{key}\": incorrect pages !"
+)
+INCORRECT_YEAR = Code(
+    "incorrect-year",
+    "Problem in entry \"{key}\": incorrect year \"{year}\" (not exported as a date) !"
+)
+UNMAPPED_CHARACTERS = Code(
+    "unmapped-characters",
+    "Problem in entry \"{key}\": character(s) {chars} of field {field} could not be transliterated into LaTeX "
+    "and were replaced with '?'"
+)
+NON_ASCII_VALUE = Code(
+    "non-ascii-value",
+    "Problem of encoding in entry \"{key}\", key \"{field}\", value {value} -> replace bad caracter(s) with '?'"
+)
+UNMAPPED_CHARACTERS_TOTAL = Code(
+    "unmapped-characters-total",
+    "{total} character(s) cannot be transliterated into LaTeX and are replaced with '?' in exports: {chars}",
+    limited=False
+)
+DBLP_SKIPPED = Code(
+    "dblp-skipped",
+    "Problem in DBLP record \"{key}\": {reason} - record skipped"
+)
+MISSING_YEARS = Code(
+    "missing-years",
+    "For conference \"{key}\", years {years} are missing - so min year={min_year} "
+    "- to add an exception please modify db/config.py - variable missing_years",
+    limited=False
+)
+
+
+class Diagnostic(object):
+    """ A diagnostic, formatted lazily by str() """
+    __slots__ = ("code", "key", "field", "args")
+
+    def __init__(self, code, key=None, field=None, args=None):
+        self.code = code
+        self.key = key
+        self.field = field
+        self.args = args if args is not None else {}
+
+    def __str__(self):
+        return self.code.template.format(key=self.key, field=self.field, **self.args)
+
+
+class Collector(object):
+    def __init__(self, limit=10):
+        self.limit = limit
+        """ maximum number of logged diagnostics per code (for limited codes) """
+        self.counts = collections.Counter()
+        """ number of diagnostics per code """
+        self.buffering = False
+        """ if True, diagnostics to be logged are kept in buffer instead (see drain) """
+        self.buffer = []
+
+    def report(self, code, key=None, field=None, **args):
+        """ Report a diagnostic (only counted if the limit of its code is reached) """
+        n = self.counts[code] + 1
+        self.counts[code] = n
+        if n > self.limit and code.limited:
+            return
+        if self.buffering:
+            self.buffer.append(Diagnostic(code, key, field, args))
+        elif logger.isEnabledFor(code.level):
+            logger.log(code.level, "%s", Diagnostic(code, key, field, args))
+
+    def drain(self):
+        """ Return (counts, diagnostics buffered) and reset the collector
+        (used to send the diagnostics of a worker process to the parent process, see merge) """
+        res = (dict(self.counts), self.buffer)
+        self.counts = collections.Counter()
+        self.buffer = []
+        return res
+
+    def merge(self, drained):
+        """ Add diagnostics drained from another collector, logging them within the limits of this collector """
+        (counts, diagnostics) = drained
+        for diagnostic in diagnostics:
+            self.report(diagnostic.code, diagnostic.key, diagnostic.field, **diagnostic.args)
+            counts[diagnostic.code] -= 1
+        self.counts.update(counts)
+
+    def clear(self):
+        self.counts.clear()
+        self.buffer = []
+
+    def summary(self):
+        """ Return the summary table of the diagnostics (empty string if there is no diagnostic) """
+        if len(self.counts) == 0:
+            return ""
+        lines = ["{0:<30} {1:<8} {2:>10} {3:>10}".format("code", "level", "count", "logged")]
+        for (code, n) in sorted(self.counts.items(), key=lambda item: (-item[0].level, item[0].name)):
+            lines.append("{0:<30} {1:<8} {2:>10} {3:>10}".format(
+                code.name,
+                logging.getLevelName(code.level),
+                n,
+                min(n, self.limit) if code.limited else n
+            ))
+        return "\n".join(lines)
+
+    def log_summary(self):
+        """ Log the summary table of the diagnostics, if any """
+        if len(self.counts) > 0:
+            logger.warning("Diagnostics summary:\n%s", self.summary())
+
+
+collector = Collector()
+""" default collector """
+
+
+def report(code, key=None, field=None, **args):
+    """ Report a diagnostic to the default collector """
+    collector.report(code, key, field, **args)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # the queue is in-process: records are formatted by the listener thread, not by the caller
+        return record
+
+
+class ConsoleSink(object):
+    """ Non-blocking logging: the handlers of the root logger are moved behind a queue, and records are emitted
+    by a background thread. When stopped, the summary of the collector is logged. """
+
+    def __init__(self, collector=collector, summary=True):
+        self.collector = collector
+        self.summary = summary
+        self._listener = None
+        self._handlers = None
+
+    def start(self):
+        root = logging.getLogger()
+        self._handlers = root.handlers[:]
+        handlers = self._handlers if len(self._handlers) > 0 else [logging.StreamHandler()]
+        q = queue.Queue()
+        self._listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+        root.handlers = [_QueueHandler(q)]
+        self._listener.start()
+
+    def stop(self):
+        if self._listener is None:
+            return
+        if self.summary:
+            self.collector.log_summary()
+        self._listener.stop()
+        logging.getLogger().handlers = self._handlers
+        self._listener = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
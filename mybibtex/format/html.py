@@ -1,18 +1,139 @@
+import html
+import itertools
+
+from .. import tools
+from ..database import EntryKey
+from ..generator import RenderCache, SortConfYearPage
+from ..query import Conf, Paper, Index
+
 def format_title(t):
-  """ Format a bibtex title in a html title """
-
-  # Lower case except parts between {} (does not support nested {})
-  i = 1
-  j = t.find("{",i)
-  while j != -1:
-    # i...j{...k}...
-    k = t.find("}",j)
-    if k == -1:
-      # error
-      break
-    t = t[:i] + t[i:j].lower() + t[j+1:k] + t[k+1:]
-    i = k
-    j = t.find("{",i)
-  if i != -1:
-    t = t[:i] + t[i:].lower()
-  return t
+  """ Format a bibtex title in a html title
+
+  Lower case except the first character and parts between {} (which can be nested), braces are removed.
+  Linear time in the length of the title. """
+
+  res = []
+  depth = 0
+  start = 0 # start of the current run of characters without braces
+  for (i, c) in enumerate(t):
+    if c == "{" or c == "}":
+      res.append(t[start:i].lower() if depth == 0 else t[start:i])
+      start = i + 1
+      if c == "{":
+        depth += 1
+      elif depth > 0:
+        depth -= 1
+  res.append(t[start:].lower() if depth == 0 else t[start:])
+
+  # the first character keeps its case
+  if len(t) > 0 and t[0] != "{":
+    res[0] = t[0] + res[0][1:]
+  return "".join(res)
+
+def remove_braces(s):
+  return s.replace("{", "").replace("}", "")
+
+def format_authors(entry):
+  """ Format the authors of an entry in html: "A, B and C" """
+  if "author" in entry.persons:
+    names = [str(person) for person in entry.persons["author"]]
+  elif "author" in entry.fields:
+    names = entry.fields["author"].expand().split(" and ")
+  else:
+    return ""
+  names = [html.escape(remove_braces(" ".join(name.split()))) for name in names]
+  if len(names) == 1:
+    return names[0]
+  return ", ".join(names[:-1]) + " and " + names[-1]
+
+def _get_field(entry, name, crossref=None):
+  """ Return the expanded field name of entry (inherited from the entry crossref if needed) or None
+
+  The crossref is given explicitly: entries of snapshots and mapped databases cannot resolve it by themselves. """
+  # dict.get does not go through the FieldDict fallback on the collection of the entry
+  value = dict.get(entry.fields, name)
+  if value is None and crossref is not None:
+    value = crossref.inheritable_fields().get(name)
+  return value.expand() if value is not None else None
+
+def get_crossref(db, entry):
+  """ Return the entry of db crossrefed by entry, None if there is none """
+  if "crossref" not in entry.fields:
+    return None
+  return db.entries.get(EntryKey.from_string(entry.fields["crossref"].expand()))
+
+def format_venue(entry, crossref=None):
+  """ Format the venue of an entry in html: booktitle or journal, volume, number, pages and year """
+  parts = []
+  venue = (_get_field(entry, "booktitle", crossref) or _get_field(entry, "journal", crossref) or
+           _get_field(entry, "howpublished", crossref))
+  if venue:
+    parts.append('<span class="venue">{0}</span>'.format(html.escape(remove_braces(venue))))
+  if "journal" in entry.fields:
+    volume = _get_field(entry, "volume", crossref)
+    number = _get_field(entry, "number", crossref)
+    if volume:
+      parts.append("vol. {0}".format(html.escape(volume)) + ("({0})".format(html.escape(number)) if number else ""))
+  pages = _get_field(entry, "pages", crossref)
+  if pages:
+    parts.append("pp. {0}".format(html.escape(pages).replace("--", "&ndash;")))
+  year = _get_field(entry, "year", crossref)
+  if year:
+    parts.append(html.escape(year))
+  return ", ".join(parts)
+
+def format_entry(key, entry, crossref=None):
+  """ Format an entry in html (as a list item), crossref being the entry it crossrefs (if any) """
+  res = ['<li id="{0}">'.format(html.escape(str(key)))]
+  authors = format_authors(entry)
+  if authors:
+    res.append('<span class="authors">{0}</span>: '.format(authors))
+  title = _get_field(entry, "title", crossref)
+  if title:
+    res.append('<span class="title">{0}</span>. '.format(html.escape(format_title(title))))
+  res.append(format_venue(entry, crossref))
+  doi = _get_field(entry, "doi", crossref)
+  if doi:
+    res.append(' <a class="doi" href="https://doi.org/{0}">doi</a>'.format(html.escape(doi)))
+  res.append("</li>\n")
+  return "".join(res)
+
+class HTMLRenderer(object):
+  """ Batch html renderer of a database, with a per-entry output cache
+  (a generator.RenderCache keyed by the fingerprints of the entry and of its crossref) """
+
+  def __init__(self, db, entry_sort=None, max_entries=1 << 16):
+    """ @arg max_entries: maximum number of rendered entries kept in the cache (see generator.RenderCache) """
+    self.db = db
+    self.entry_sort = entry_sort if entry_sort is not None else SortConfYearPage()
+    self.index = None
+    self.cache = RenderCache(max_entries=max_entries)
+
+  def render_entry(self, key, entry):
+    crossref = get_crossref(self.db, entry)
+    cache_key = (entry.fingerprint(), crossref.fingerprint() if crossref is not None else "")
+    s = self.cache.get(cache_key)
+    if s is None:
+      s = format_entry(key, entry, crossref)
+      self.cache.set(cache_key, s)
+    return s
+
+  def render_entries(self, entries):
+    """ Render a list of (key, entry) as a html list (entries have to be sorted) """
+    return "<ul>\n" + "".join(self.render_entry(key, entry) for (key, entry) in entries) + "</ul>\n"
+
+  def render_conference(self, confkey):
+    """ Render all the papers of the conference confkey, grouped by year (most recent first) """
+    if self.index is None or not self.index.is_valid(self.db.entries):
+      self.index = Index(self.db.entries)
+    entries = self.entry_sort.sort((Conf(confkey) & Paper()).run(self.db.entries, self.index))
+
+    res = []
+    for (year, group) in itertools.groupby(entries, key=lambda ke: ke[0].year):
+      res.append('<h3 id="{0}{1}">{1}</h3>\n'.format(html.escape(confkey), tools.short_to_full_year(year)))
+      res.append(self.render_entries(group))
+    return "".join(res)
+
+  def render_conferences(self, confkeys):
+    """ Render the listings of multiple conferences, as a dictionary confkey -> html """
+    return {confkey: self.render_conference(confkey) for confkey in confkeys}
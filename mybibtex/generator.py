@@ -1,13 +1,21 @@
-
-
-import codecs
-
 from .database import *
+from .keygen import entry_persons
+from .month_names import month_names
+from . import latex
+from . import diagnostics
+from . import stats
 from . import tools
+from .output import AtomicOutput
 
+import collections
 import io
 from abc import ABCMeta, abstractmethod
-import logging
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
 
 # WARNING: do not forge to set this variable to the correct config module when loading this module
 # FIXME: need to remove this dirty hack!
@@ -54,6 +62,27 @@ class EntrySort(object, metaclass=ABCMeta):
         return sorted(entries, key=self.key)
 
 class SortConfYearPage(EntrySort):
+    """ Sort entries by conference, year (most recent first), volume of the conference, eprint number, volume, number and pages.
+
+    The ordering is given by the string key `key`.
+    `sort` uses `fast_key`, which returns the same string but caches the formatted conference labels
+    and the disambiguation strings of crossrefs (both bounded by the number of conferences and proceedings).
+    Conference labels are cached for the current config.confs object: the cache is rebuilt when config.confs is
+    replaced (clear_cache has to be called if it is modified in place).
+    The caches only hold values computed from their keys, so that an instance can be shared by threads.
+    """
+
+    def __init__(self):
+        self._confkeys = (None, {})
+        """ cache of padded conference labels: pair (config.confs, dictionary confkey -> label) """
+        self._dis = {}
+        """ cache of padded disambiguation strings of crossrefs """
+
+    def clear_cache(self):
+        """ to be called if config.confs is modified in place """
+        self._confkeys = (None, {})
+        self._dis = {}
+
     def get_pages(self, key, entry):
         if "pages" in entry.fields:
             try:
@@ -63,10 +92,10 @@ class SortConfYearPage(EntrySort):
                 elif len(pages) == 2:
                     return (pages[0], pages[1])
                 else:
-                    logging.warning("Problem in entry \"{0}\": incorrect pages !".format(key))
+                    diagnostics.report(diagnostics.INCORRECT_PAGES, key, "pages")
                     return ("0","0")
             except ValueError as e:
-                logging.warning("Problem in entry \"{0}\": incorrect pages !".format(key))
+                diagnostics.report(diagnostics.INCORRECT_PAGES, key, "pages")
                 return ("0","0")
         else:
             return ("0","0")
@@ -110,7 +139,7 @@ class SortConfYearPage(EntrySort):
             return 0
         if not val.isdigit():
             # Convert the value into an integer, looking at the value as a big-endian byte-array
-            val = int(codecs.encode(val.encode("utf8"), 'hex'), 16)
+            val = int.from_bytes(val.encode("utf8"), "big")
         return int(1e20-1) - int(val)
 
     def proc_volume(self, e):
@@ -125,14 +154,14 @@ class SortConfYearPage(EntrySort):
         else:
             return self.proc_int_descending(e.fields["number"].expand())
 
-    def key(self, ke):
-        (k,e) = ke
+    def format_key(self, k, e, confkey, dis):
+        """ Return the key of the entry e of key k, given its padded conference label and disambiguation string """
         (p1, p2) = self.get_pages(k,e)
 
-        return "{:<15}-{:0>4d}-{:<10}-{}-{:>10}-{:0>10d}-{:0>20}-{:0>20}".format(
-            self.proc_confkey(k.confkey),
+        return "{}-{:0>4d}-{}-{}-{:>10}-{:0>10d}-{:0>20}-{:0>20}".format(
+            confkey,
             self.proc_year(k.year),
-            self.proc_dis(e),
+            dis,
             self.proc_eprint(e),
             self.proc_volume(e),
             self.proc_number(e),
@@ -140,6 +169,34 @@ class SortConfYearPage(EntrySort):
             p2
         )
 
+    def key(self, ke):
+        (k,e) = ke
+        return self.format_key(k, e, "{:<15}".format(self.proc_confkey(k.confkey)), "{:<10}".format(self.proc_dis(e)))
+
+    def fast_key(self, ke):
+        """ Return key(ke), using the caches of conference labels and crossref disambiguation strings """
+        (k,e) = ke
+
+        (confs, labels) = self._confkeys
+        if confs is not config.confs:
+            (confs, labels) = self._confkeys = (config.confs, {})
+        confkey = labels.get(k.confkey)
+        if confkey is None:
+            confkey = labels[k.confkey] = "{:<15}".format(self.proc_confkey(k.confkey))
+
+        if "crossref" not in e.fields:
+            dis = "          "
+        else:
+            crossref = e.fields["crossref"].expand()
+            dis = self._dis.get(crossref)
+            if dis is None:
+                dis = self._dis[crossref] = "{:<10}".format(EntryKey.from_string(crossref).dis)
+
+        return self.format_key(k, e, confkey, dis)
+
+    def sort(self, entries):
+        return sorted(entries, key=self.fast_key)
+
 def bibtex_entry_format_fields(db, key, entry, expand_crossrefs=False, expand_values=False):
     """ Return a dictionary of formatted fields """
 
@@ -150,29 +207,168 @@ def bibtex_entry_format_fields(db, key, entry, expand_crossrefs=False, expand_va
         res = author.expand().replace(" and ", " and\n" + " "*18)
         return Value([ValuePartQuote(res, normalize=False)])
 
-    fields = entry.fields.copy()
+    own_fields = entry.fields
+
+    # expand crossrefs: overlay the fields of the entry on the inheritable fields of the crossref
+    if expand_crossrefs and "crossref" in own_fields:
+        crossref = db.entries[EntryKey.from_string(own_fields["crossref"].expand())]
+        fields = dict(crossref.inheritable_fields())
+        fields.update(own_fields)
+        del fields["crossref"]
+    else:
+        fields = own_fields.copy()
 
     # expand persons
     for (role, persons) in entry.persons.items():
-        if role not in fields:
+        if role not in own_fields:
             fields[role] = format_persons(persons)
 
     # format author
-    if "author" in fields:
+    if "author" in own_fields or "author" in entry.persons:
         fields["author"] = format_author(fields["author"])
 
-    # expand crossrefs
-    if expand_crossrefs:
-        if "crossref" in fields:
-            crossref_fields = db.entries[EntryKey.from_string(fields["crossref"].expand())].fields.copy()
-            del crossref_fields["key"] # a bit of a hack TODO...
-            fields = dict(list(crossref_fields.items()) + list(fields.items()))
-            del fields["crossref"]
-
     return fields
 
-def bibtex_write_entry(out, db, key, entry, expand_crossrefs=False, expand_values=False, remove_empty_fields=False):
-    """ Write a bibtex entry in out """
+class RenderCache(object):
+    """ Cache of rendered entries (output of bibtex_entry_str), to be passed as option cache to bibtex_gen, ...
+
+    An entry text is keyed by the fingerprint of the entry, the fingerprint of its crossref (if crossrefs are expanded),
+    the render options and a digest of config.first_keys and config.types.
+    bibtex_gen and bibtex_gen_multi call refresh_config themselves,
+    it needs to be called manually after modifying the config if bibtex_write_entry is used directly.
+
+    The cache keeps the max_entries most recently used texts (least recently used ones are evicted).
+    It can be kept in memory in long-running processes or saved/loaded on disk (as JSON lines, see save).
+    When used with processes != 1 in bibtex_gen, workers read the cache as it was when their pool started
+    and send the entries they render back to the parent process, which stores them (see merge).
+    It can be shared by threads (e.g., the workers of web_service): entries are rendered outside of its lock,
+    a text rendered twice concurrently being the same.
+    """
+
+    version = 4
+    """ version of the on-disk format and of the rendering, to be increased when bibtex_entry_str is modified """
+
+    def __init__(self, max_entries=1 << 18):
+        """ @arg max_entries: maximum number of entry texts kept, None for no limit """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        """ key -> entry text, from the least recently used to the most recently used """
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.added = None
+        """ list of the (key, text) set since the last merge, recorded only in workers of RenderPool (None otherwise) """
+        self.config_version = None
+        self.refresh_config()
+
+    def refresh_config(self):
+        if config is None:
+            return
+        self.config_version = hashlib.blake2b(
+            repr((list(config.first_keys), sorted(config.types.items()))).encode("utf8"),
+            digest_size=8
+        ).hexdigest()
+
+    def key(self, db, entry, expand_crossrefs, expand_values, remove_empty_fields):
+        if expand_crossrefs and "crossref" in entry.fields:
+            crossref_fingerprint = db.entries[EntryKey.from_string(entry.fields["crossref"].expand())].fingerprint()
+        else:
+            crossref_fingerprint = ""
+        return (
+            entry.fingerprint(), crossref_fingerprint,
+            expand_crossrefs, expand_values, remove_empty_fields,
+            self.config_version
+        )
+
+    def get(self, key):
+        with self._lock:
+            s = self.entries.get(key)
+            if s is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        return s
+
+    def set(self, key, s):
+        with self._lock:
+            self.entries[key] = s
+            self.entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            if self.added is not None:
+                self.added.append((key, s))
+
+    def drain(self):
+        """ Return (hits, misses, added) since the last drain and reset them
+        (used to send the work of a worker process to the parent process, see merge) """
+        with self._lock:
+            res = (self.hits, self.misses, self.added)
+            (self.hits, self.misses, self.added) = (0, 0, [])
+        return res
+
+    def merge(self, drained):
+        """ Add the counters and the entries drained from the cache of a worker process """
+        (hits, misses, added) = drained
+        for (key, s) in added:
+            self.set(key, s)
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def save(self, filename):
+        """ save the cache in filename (atomically): a first line {"version": version},
+        then one line [key, text] per entry (JSON), from the least recently used to the most recently used """
+        tmp_filename = "{0}.tmp{1}".format(filename, os.getpid())
+        with self._lock:
+            items = list(self.entries.items())
+        with open(tmp_filename, "w", encoding="utf8") as f:
+            f.write(json.dumps({"version": self.version}) + "\n")
+            for (key, s) in items:
+                f.write(json.dumps([key, s], ensure_ascii=False) + "\n")
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename, max_entries=1 << 18):
+        """ load a cache saved with save, return an empty cache if the file does not exist, is not valid
+        or has been saved by another version """
+        cache = cls(max_entries)
+        entries = collections.OrderedDict()
+        try:
+            with open(filename, encoding="utf8") as f:
+                header = json.loads(f.readline())
+                if not isinstance(header, dict) or header.get("version") != cls.version:
+                    return cache
+                for line in f:
+                    (key, s) = json.loads(line)
+                    if not isinstance(key, list) or not isinstance(s, str):
+                        return cache
+                    entries[tuple(key)] = s
+        except (OSError, UnicodeDecodeError, ValueError, TypeError):
+            return cache
+        if max_entries is not None:
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+        cache.entries = entries
+        return cache
+
+def bibtex_entry_str(db, key, entry, expand_crossrefs=False, expand_values=False, remove_empty_fields=False, fields=None, cache=None):
+    """ Return the bibtex representation of an entry
+    @arg fields: fields returned by bibtex_entry_format_fields if already computed, None otherwise
+    @arg cache: RenderCache or None """
+
+    if cache is not None:
+        cache_key = cache.key(db, entry, expand_crossrefs, expand_values, remove_empty_fields)
+        s = cache.get(cache_key)
+        if s is None:
+            s = bibtex_entry_str(db, key, entry, expand_crossrefs, expand_values, remove_empty_fields, fields)
+            cache.set(cache_key, s)
+        return s
 
     def key_sort(key):
         if key in config.first_keys:
@@ -186,10 +382,10 @@ def bibtex_write_entry(out, db, key, entry, expand_crossrefs=False, expand_value
         else:
             return type_.capitalize()
 
-    fields = bibtex_entry_format_fields(db, key, entry, expand_crossrefs, expand_values)
+    if fields is None:
+        fields = bibtex_entry_format_fields(db, key, entry, expand_crossrefs, expand_values)
 
-    # actual writing
-    out.write("@{0}{{{1},\n".format(format_type(entry.type), str(key)))
+    res = ["@{0}{{{1},\n".format(format_type(entry.type), str(key))]
 
     for k in sorted(iter(fields.keys()), key=key_sort):
         # remove empty fields after expansion
@@ -200,26 +396,201 @@ def bibtex_write_entry(out, db, key, entry, expand_crossrefs=False, expand_value
 
         v = fields[k].to_bib(expand = expand_values)
 
-        # v_ascii only contains ascii characters
-        try:
-            v_ascii = v.encode("ascii").decode("ascii")
-        except UnicodeEncodeError as ex:
-            logging.warning("Problem of encoding in entry \"{0}\", key \"{1}\", value \"{2}\" -> replace bad caracter(s) with '?'".format(key,k,repr(v)))
-            v_ascii = v.encode("ascii", "replace").decode("ascii")
+        # v_ascii only contains ascii characters (non-ascii characters are transliterated into LaTeX)
+        v_ascii = latex.to_ascii(v, key, k)
 
-        out.write("  {0:<15}{1},\n".format((k + " ="), v_ascii ))
+        res.append("  {0:<15}{1},\n".format((k + " ="), v_ascii ))
 
-    out.write("}")
+    res.append("}")
+    return "".join(res)
+
+def bibtex_write_entry(out, db, key, entry, *args, **kwargs):
+    """ Write a bibtex entry in out """
+    out.write(bibtex_entry_str(db, key, entry, *args, **kwargs))
 
 def bibtex_write_entries(out, db, entries, *args, **kwargs):
     """ internal function used to write bibtex entries """
+    if stats.current is not None:
+        _bibtex_write_entries_profiled(stats.current, out, db, entries, *args, **kwargs)
+        return
 
     for key, entry in entries:
         bibtex_write_entry(out, db, key, entry, *args, **kwargs)
         out.write("\n\n")
 
+def _bibtex_write_entries_profiled(s, out, db, entries, *args, **kwargs):
+    """ same as bibtex_write_entries, recording the stages render and write in the Stats s """
+    cache = kwargs.get("cache")
+    if cache is not None:
+        (hits, misses) = (cache.hits, cache.misses)
+    render_wall = render_cpu = write_wall = write_cpu = 0.0
+    n = 0
+    nb_bytes = 0
+    for key, entry in entries:
+        wall0 = time.perf_counter()
+        cpu0 = time.process_time()
+        e = bibtex_entry_str(db, key, entry, *args, **kwargs)
+        wall1 = time.perf_counter()
+        cpu1 = time.process_time()
+        out.write(e)
+        out.write("\n\n")
+        render_wall += wall1 - wall0
+        render_cpu += cpu1 - cpu0
+        write_wall += time.perf_counter() - wall1
+        write_cpu += time.process_time() - cpu1
+        n += 1
+        nb_bytes += len(e.encode("utf8")) + 2
+    s.add(
+        "render", render_wall, render_cpu, calls=1, entries=n,
+        cache_hits=cache.hits - hits if cache is not None else 0,
+        cache_misses=cache.misses - misses if cache is not None else 0
+    )
+    s.add("write", write_wall, write_cpu, calls=1, entries=n, bytes=nb_bytes)
+
+
+_worker_db = None
+""" database rendered by a worker process of a RenderPool (set by _parallel_init in the worker only) """
+_worker_cache = None
+
+def _parallel_init(db, cache):
+    global _worker_db, _worker_cache
+    _worker_db = db
+    _worker_cache = cache
+    if cache is not None:
+        # entries rendered by the worker are sent to the parent process (see _write_chunks_parallel)
+        cache.drain()
+    # counters of the parent process are inherited through fork and must not be reported twice
+    diagnostics.collector.clear()
+    diagnostics.collector.buffering = True
+
+def _parallel_write_chunk(task):
+    (keys, args, kwargs) = task
+    out = io.StringIO()
+    entries = ((key, _worker_db.entries[key]) for key in keys)
+    bibtex_write_entries(out, _worker_db, entries, *args, cache=_worker_cache, **kwargs)
+    rendered = _worker_cache.drain() if _worker_cache is not None else None
+    return (out.getvalue(), diagnostics.collector.drain(), rendered)
+
+class RenderPool(object):
+    """ Pool of worker processes rendering entries of db for bibtex_write_entries_parallel (and bibtex_gen),
+    to be reused by multiple calls on the same database:
+
+    >>> with RenderPool(db, cache=cache) as pool:
+    ...     bibtex_gen(out1, db, ..., cache=cache, pool=pool)
+    ...     bibtex_gen(out2, db, ..., cache=cache, pool=pool)
+
+    db and cache are inherited by the workers through fork (never pickled), and db must not be modified
+    while the pool is used. Workers read the cache as it was when the pool started, entries they render
+    are stored in the cache by the parent process. """
+
+    def __init__(self, db, processes=None, cache=None):
+        self.db = db
+        self.cache = cache
+        self.pool = multiprocessing.get_context("fork").Pool(
+            processes, initializer=_parallel_init, initargs=(db, cache)
+        )
 
-def bibtex_gen(out, db, entry_filter=FilterPaper(), entry_sort=SortConfYearPage(), expand_crossrefs=False, include_crossrefs=False, *args, **kwargs):
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+
+def bibtex_write_entries_parallel(out, db, entries, *args, processes=None, chunk_size=256, min_entries=2048, pool=None, **kwargs):
+    """ same as bibtex_write_entries but render entries in a pool of processes
+    (processes=None means one process per core)
+    The output is exactly the same as the one of bibtex_write_entries.
+    Entries have to be entries of db (only their keys are sent to the workers).
+    @arg pool: RenderPool of db (with the same cache) to use, None to start a pool for this call only
+    Fall back to bibtex_write_entries if fork is not available on the platform, if there are fewer than
+    min_entries entries, or (without pool) if a single process would be used """
+    keys = [key for (key, entry) in entries]
+    cache = kwargs.pop("cache", None)
+    if pool is not None and (pool.db is not db or pool.cache is not cache):
+        raise ValueError("the pool renders another database or uses another cache")
+    if pool is None:
+        processes = min(processes or os.cpu_count() or 1, os.cpu_count() or 1)
+    if (
+        "fork" not in multiprocessing.get_all_start_methods()
+        or len(keys) < min_entries
+        or (pool is None and processes == 1)
+    ):
+        bibtex_write_entries(out, db, ((key, db.entries[key]) for key in keys), *args, cache=cache, **kwargs)
+        return
+
+    tasks = [(keys[i:i+chunk_size], args, kwargs) for i in range(0, len(keys), chunk_size)]
+
+    s = stats.current
+    if s is None:
+        _write_chunks_parallel(out, db, tasks, pool, processes, cache)
+        return
+
+    # workers do not record statistics: the whole parallel rendering is recorded as the stage render
+    stats.current = None
+    try:
+        with s.stage("render") as stage:
+            stage.bytes += _write_chunks_parallel(out, db, tasks, pool, processes, cache, count_bytes=True)
+            stage.entries += len(keys)
+    finally:
+        stats.current = s
+
+def _write_chunks_parallel(out, db, tasks, pool, processes, cache, count_bytes=False):
+    """ Write the entries of the tasks (chunk of keys, args, kwargs) rendered by pool
+    (or by a new RenderPool if pool is None), return the number of bytes written if count_bytes is True """
+    if pool is None:
+        with RenderPool(db, processes, cache) as pool:
+            return _write_chunks_parallel(out, db, tasks, pool, processes, cache, count_bytes)
+
+    nb_bytes = 0
+    for (e, drained, rendered) in pool.pool.imap(_parallel_write_chunk, tasks):
+        out.write(e)
+        diagnostics.collector.merge(drained)
+        if rendered is not None:
+            cache.merge(rendered)
+        if count_bytes:
+            nb_bytes += len(e.encode("utf8"))
+    return nb_bytes
+
+
+def get_crossrefs(db, entries):
+    """ Return the dictionary of entries of db crossrefed by entries (list of pairs key, entry) """
+    # works because an entry crossrefed cannot crossref another entry
+    crossrefs = dict()
+    for k,e in entries:
+        if "crossref" in e.fields:
+            crossref = EntryKey.from_string(e.fields["crossref"].expand())
+            if crossref not in crossrefs:
+                crossrefs[crossref] = db.entries[crossref]
+    return crossrefs
+
+def _filter(entry_filter, entries):
+    """ entry_filter.filter(entries), recorded as the stage filter when profiling (see stats.py) """
+    s = stats.current
+    if s is None:
+        return entry_filter.filter(entries)
+    with s.stage("filter") as stage:
+        res = list(entry_filter.filter(entries))
+        stage.entries += len(res)
+    return res
+
+def _sort(entry_sort, entries):
+    """ entry_sort.sort(entries), recorded as the stage sort when profiling (see stats.py) """
+    s = stats.current
+    if s is None:
+        return entry_sort.sort(entries)
+    with s.stage("sort") as stage:
+        res = entry_sort.sort(entries)
+        stage.entries += len(res)
+    return res
+
+def bibtex_gen(out, db, entry_filter=FilterPaper(), entry_sort=SortConfYearPage(), expand_crossrefs=False, include_crossrefs=False, *args, processes=1, pool=None, **kwargs):
     """
     Generate bibtex file
 
@@ -229,43 +600,248 @@ def bibtex_gen(out, db, entry_filter=FilterPaper(), entry_sort=SortConfYearPage(
     @arg expand_values: expand values (using macros) if True
     @arg remove_empty_fields: remove empty fields if True, empty fields are ones that are either empty or expand to an empty value
       (in case expand_values=False and multiple macros values may be used using, e.g., multiple "abbrev*.bib" files, be extra careful)
+    @arg processes: number of processes used to render entries (None means one per core),
+      the output does not depend on this option
+    @arg pool: RenderPool of db used to render entries (instead of starting processes), see bibtex_write_entries_parallel
+    @arg cache: RenderCache used to store rendered entries or None
     """
-    entries = dict(entry_filter.filter(db.entries))
-    bibtex_write_entries(
+    if kwargs.get("cache") is not None:
+        kwargs["cache"].refresh_config()
+
+    if processes == 1 and pool is None:
+        write_entries = bibtex_write_entries
+    else:
+        def write_entries(out, db, entries, *args, **kwargs):
+            bibtex_write_entries_parallel(out, db, entries, *args, processes=processes, pool=pool, **kwargs)
+
+    entries = dict(_filter(entry_filter, db.entries))
+    write_entries(
         out,
         db,
-        entry_sort.sort(iter(entries.items())),
+        _sort(entry_sort, iter(entries.items())),
         expand_crossrefs=expand_crossrefs,
         *args, **kwargs
     )
 
     if expand_crossrefs==False and include_crossrefs==True:
-        # works because an entry crossrefed cannot crossref another entry
-        crossrefs = dict()
-        for k,e in entries.items():
-            if "crossref" in e.fields:
-                crossref = EntryKey.from_string(e.fields["crossref"].expand())
-                if crossref not in crossrefs:
-                    crossrefs[crossref] = db.entries[crossref]
-
-        bibtex_write_entries(
+        write_entries(
             out,
             db,
-            entry_sort.sort(iter(crossrefs.items())),
+            _sort(entry_sort, iter(get_crossrefs(db, entries.items()).items())),
             expand_crossrefs=expand_crossrefs,
             *args, **kwargs
         )
 
+def bibtex_gen_file(filename, db, *args, header="", ignore_re=None, **kwargs):
+    """
+    Generate the bibtex file filename (same options as bibtex_gen) preceded by header,
+    only replacing the file (atomically) if its content changed.
+    Lines matching ignore_re in the header (e.g., header.timestamp_line_re) are ignored when comparing contents.
+    Return True if the file has been replaced.
+    """
+    with AtomicOutput(filename, ignore_re=ignore_re) as out:
+        out.write(header)
+        bibtex_gen(out, db, *args, **kwargs)
+        if stats.current is not None:
+            with stats.current.stage("commit"):
+                out.close()
+    return out.changed
+
+def bibtex_gen_multi(targets, db, entry_filter=FilterPaper(), entry_sort=SortConfYearPage(), cache=None):
+    """
+    Generate multiple bibtex files from the same entries in one pass
+
+    @arg targets: list of pairs (out, options) where options is a dictionary of options of bibtex_gen
+      (expand_crossrefs, include_crossrefs, expand_values, remove_empty_fields)
+
+    Each out receives exactly what bibtex_gen(out, db, entry_filter, entry_sort, **options) would write,
+    but entries are filtered and sorted only once, and an entry is formatted only once for all targets
+    with the same options (fields are even shared between all targets with the same expand_crossrefs).
+
+    @arg cache: RenderCache used to store rendered entries or None
+    """
+    def render_options(options):
+        return (
+            options.get("expand_crossrefs", False),
+            options.get("expand_values", False),
+            options.get("remove_empty_fields", False)
+        )
+
+    outs = [out for (out, options) in targets]
+    targets_options = [render_options(options) for (out, options) in targets]
+
+    def write_entries(entries, targets_idx):
+        for key, entry in entries:
+            fields = {} # expand_crossrefs -> formatted fields
+            rendered = {} # render options -> entry string
+            for i in targets_idx:
+                options = targets_options[i]
+                s = rendered.get(options)
+                if s is None:
+                    (expand_crossrefs, expand_values, remove_empty_fields) = options
+                    if cache is not None:
+                        cache_key = cache.key(db, entry, *options)
+                        s = cache.get(cache_key)
+                    if s is None:
+                        if expand_crossrefs not in fields:
+                            fields[expand_crossrefs] = bibtex_entry_format_fields(db, key, entry, expand_crossrefs, expand_values)
+                        s = bibtex_entry_str(
+                            db, key, entry, expand_crossrefs, expand_values, remove_empty_fields,
+                            fields=fields[expand_crossrefs]
+                        )
+                        if cache is not None:
+                            cache.set(cache_key, s)
+                    s = rendered[options] = s + "\n\n"
+                outs[i].write(s)
+
+    if cache is not None:
+        cache.refresh_config()
+
+    entries = _sort(entry_sort, _filter(entry_filter, db.entries))
+    write_entries(entries, range(len(targets)))
+
+    crossrefs_targets = [
+        i for (i, (out, options)) in enumerate(targets)
+        if options.get("expand_crossrefs", False) == False and options.get("include_crossrefs", False) == True
+    ]
+    if len(crossrefs_targets) > 0:
+        write_entries(_sort(entry_sort, iter(get_crossrefs(db, entries).items())), crossrefs_targets)
+
 def bibtex_gen_str(db, *args, **kwargs):
     out = io.StringIO()
     bibtex_gen(out, db, *args, **kwargs)
     return out.getvalue()
 
 
+csl_types = {
+    "article": "article-journal",
+    "book": "book",
+    "inbook": "chapter",
+    "incollection": "chapter",
+    "inproceedings": "paper-conference",
+    "mastersthesis": "thesis",
+    "misc": "document",
+    "phdthesis": "thesis",
+    "proceedings": "book",
+    "techreport": "report",
+}
+""" mapping bibtex type -> CSL type """
+
+csl_fields = {
+    "title": "title",
+    "booktitle": "container-title",
+    "journal": "container-title",
+    "series": "collection-title",
+    "volume": "volume",
+    "number": "issue",
+    "pages": "page",
+    "publisher": "publisher",
+    "address": "publisher-place",
+    "doi": "DOI",
+    "url": "URL",
+    "isbn": "ISBN",
+    "issn": "ISSN",
+    "note": "note",
+    "howpublished": "note",
+    "abstract": "abstract",
+}
+""" mapping bibtex field -> CSL field (other fields are not exported in CSL-JSON) """
+
+_month_numbers = {name: i+1 for (i, name) in enumerate(month_names.values())}
+
+def json_person(person):
+    """ Return the CSL representation of a person """
+    res = {
+        "family": " ".join(person.prelast() + person.last()),
+        "given": " ".join(person.first() + person.middle()),
+    }
+    if person.lineage():
+        res["suffix"] = " ".join(person.lineage())
+    return res
+
+def json_entry(db, key, entry, expand_crossrefs=True, expand_values=True, split_persons=True):
+    """ Return the JSON representation (a dictionary) of an entry:
+    {"key": ..., "type": ..., "fields": {...}}, where persons are lists of CSL persons if split_persons=True
+    @arg expand_crossrefs: fields of the crossref are included if True
+    @arg expand_values: macros are expanded if True, otherwise values are in bibtex format
+    """
+    if expand_crossrefs and "crossref" in entry.fields:
+        crossref = db.entries[EntryKey.from_string(entry.fields["crossref"].expand())]
+        fields = dict(crossref.inheritable_fields())
+        fields.update(entry.fields)
+        del fields["crossref"]
+    else:
+        fields = entry.fields
+
+    res = {}
+    for (name, value) in fields.items():
+        res[name] = value.expand() if expand_values else value.to_bib()
+    for role in Person.valid_roles:
+        if role in entry.persons or (split_persons and role in fields):
+            persons = entry_persons(entry, role) if role in entry.persons or role in entry.fields \
+                else entry_persons(crossref, role)
+            if split_persons:
+                res[role] = [json_person(person) for person in persons]
+            else:
+                res[role] = " and ".join(str(person) for person in persons)
+
+    return {"key": str(key), "type": entry.type, "fields": res}
+
+def csl_entry(db, key, entry):
+    """ Return the CSL-JSON representation (a dictionary) of an entry (crossrefs are resolved and macros expanded)
+    The date is omitted (and an INCORRECT_YEAR diagnostic reported) if the year is not a number """
+    fields = json_entry(db, key, entry)["fields"]
+
+    res = {"id": str(key), "type": csl_types.get(entry.type.lower(), "document")}
+    for (name, value) in fields.items():
+        if name in csl_fields and csl_fields[name] not in res:
+            res[csl_fields[name]] = value.replace("--", "-") if name == "pages" else value
+    for role in Person.valid_roles:
+        if role in fields:
+            res[role] = fields[role]
+    if "year" in fields:
+        year = fields["year"].strip()
+        if year.isdigit():
+            date = [int(year)]
+            if fields.get("month") in _month_numbers:
+                date.append(_month_numbers[fields["month"]])
+            res["issued"] = {"date-parts": [date]}
+        else:
+            diagnostics.report(diagnostics.INCORRECT_YEAR, key, "year", year=fields["year"])
+    return res
+
+def json_gen(out, db, entry_filter=FilterPaper(), entry_sort=SortConfYearPage(), json_format="csl", **kwargs):
+    """
+    Generate a JSON file, writing entries one by one
+
+    @arg json_format: "csl" for a CSL-JSON array, "jsonl" for JSON Lines (one json_entry per line)
+    @arg kwargs: options of json_entry (only for json_format="jsonl")
+    """
+    if json_format not in ("csl", "jsonl"):
+        raise ValueError("unknown JSON format \"{0}\"".format(json_format))
+    if json_format == "csl" and len(kwargs) > 0:
+        raise TypeError("options {0} of json_entry are only supported with json_format=\"jsonl\"".format(
+            ", ".join(sorted(kwargs))))
+
+    entries = _sort(entry_sort, _filter(entry_filter, db.entries))
+
+    if json_format == "csl":
+        out.write("[\n")
+        for (i, (key, entry)) in enumerate(entries):
+            if i > 0:
+                out.write(",\n")
+            out.write(json.dumps(csl_entry(db, key, entry), ensure_ascii=False))
+        out.write("\n]\n")
+    else:
+        for (key, entry) in entries:
+            out.write(json.dumps(json_entry(db, key, entry, **kwargs), ensure_ascii=False))
+            out.write("\n")
+
 def sql_write_entry(out, entry, crossref=None):
     """ write entry for an entry in web2py sqlite (entry is a row corresponding to an entry)
     @entry
     @arg crossref if None, does nothing, otherwise, merge fields in entry
+    Non-ascii characters are replaced by '?' (and reported)
     """
     def key_sort(key):
         if key in config.first_keys:
@@ -314,10 +890,11 @@ def sql_write_entry(out, entry, crossref=None):
             continue
         v = str(v)
 
-        try:
-            v_ascii = v.encode("ascii").decode()
-        except UnicodeEncodeError as ex:
-            logging.warning("Problem of encoding in entry \"{0}\", key \"{1}\", value \"{2}\" -> replace bad caracter(s) with '?'".format(key,k,repr(v)))
+        # values are written as is (not transliterated into LaTeX)
+        if v.isascii():
+            v_ascii = v
+        else:
+            diagnostics.report(diagnostics.NON_ASCII_VALUE, key, k, value=repr(v))
             v_ascii = v.encode("ascii", "replace").decode()
 
         out.write("  {0:<15}{1},\n".format((k + " ="), v_ascii))
@@ -0,0 +1,172 @@
+"""
+Automatic generation of entry keys following the labeling convention of the header (see header.py):
+
+    Conference/Journal/Archive label + `:' + Author label + 2 last digits of publication year
+    + a letter starting with `a' in case of collisions
+
+Author labels are:
+  - the last name of the author for single-author papers,
+  - the first 3 letters of the last name of each author for papers with 2 or 3 authors,
+  - the first letter of the last name of each author (up to 6) for papers with 4 or more authors.
+
+Collisions are resolved against the existing database through an index keyed on (confkey, auth, year).
+Existing keys are never renamed: new entries only take letters that are still free.
+"""
+
+import functools
+import itertools
+import re
+import string
+import unicodedata
+
+from pybtex.bibtex.utils import split_name_list
+
+from .database import EntryKey, Person
+
+
+class EntryKeyGenerationError(Exception):
+    def __init__(self, entry, msg):
+        self.entry = entry
+        message = 'Error while generating key for entry {0}: {1}'.format(repr(entry), msg)
+        super(EntryKeyGenerationError, self).__init__(message)
+
+
+# LaTeX commands producing letters; all other commands (accents, ...) are simply dropped
+_latex_letters = {
+    "o": "o", "O": "O", "ss": "ss", "ae": "ae", "AE": "AE", "oe": "oe", "OE": "OE",
+    "aa": "a", "AA": "A", "l": "l", "L": "L", "i": "i", "j": "j",
+}
+_latex_command_re = re.compile(r"\\([a-zA-Z]+|[^a-zA-Z])\s*")
+_non_letters_re = re.compile(r"[^a-zA-Z]+")
+
+
+def _latex_command_to_letters(m):
+    return _latex_letters.get(m.group(1), "")
+
+
+def latex_to_ascii(s):
+    """ Convert a (LaTeX or unicode) string into ascii, dropping accents and LaTeX commands, e.g., Fran{\\c c}ois -> Fran{c}ois """
+    s = _latex_command_re.sub(_latex_command_to_letters, s)
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+
+
+def name_to_ascii(name):
+    """ Convert a (LaTeX or unicode) name into a string of ascii letters only, e.g., Fran{\\c c}ois -> Francois """
+    return _non_letters_re.sub("", latex_to_ascii(name))
+
+
+def _last_name(person):
+    name = name_to_ascii("".join(person.last()))
+    if name == "":
+        raise ValueError("empty last name for person {0}".format(repr(person)))
+    return name[0].upper() + name[1:]
+
+
+def auth_label(persons):
+    """ Return the author label of a list of persons (see header.py) """
+    names = [_last_name(person) for person in persons]
+    if len(names) == 0:
+        raise ValueError("no author")
+    elif len(names) == 1:
+        return names[0]
+    elif len(names) <= 3:
+        return "".join(name[:3] for name in names)
+    else:
+        return "".join(name[0] for name in names[:6])
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def parse_person(name):
+    """ Return Person(name), cached as names are repeated a lot (persons returned have to be considered immutable) """
+    return Person(name)
+
+
+def entry_persons(entry, role="author"):
+    """ Return the persons of role `role` of the entry,
+    parsing the corresponding field if persons have not been parsed by the parser """
+    if role in entry.persons:
+        return entry.persons[role]
+    if role in entry.fields:
+        return [parse_person(name) for name in split_name_list(entry.fields[role].expand())]
+    return []
+
+
+def _dis_letters():
+    """ Disambiguation letters: a, b, ..., z, aa, ab, ... """
+    for n in itertools.count(1):
+        for letters in itertools.product(string.ascii_lowercase, repeat=n):
+            yield "".join(letters)
+
+
+class KeyGenerator(object):
+    """ Bulk key generator.
+
+    >>> gen = KeyGenerator(db)
+    >>> keys = gen.generate(new_entries)
+
+    The generator remembers the keys it generates, so that successive calls never produce the same key twice.
+    """
+
+    def __init__(self, db=None):
+        self.index = {}
+        """ dictionary associating (confkey, auth, year) to the set of used disambiguation strings """
+        if db is not None:
+            self.add_keys(db.entries)
+
+    def add_key(self, key):
+        if key.auth is None:
+            return  # proceedings keys never collide with paper keys
+        self.index.setdefault((key.confkey, key.auth, key.year), set()).add(key.dis)
+
+    def add_keys(self, keys):
+        for key in keys:
+            self.add_key(key)
+
+    def label(self, entry, confkey=None):
+        """ Return the tuple (confkey, auth, year) of a new entry.
+        confkey and year are taken from the crossref if there is one,
+        otherwise confkey has to be provided and year is taken from the field year """
+        if "crossref" in entry.fields:
+            crossref = EntryKey.from_string(entry.fields["crossref"].expand())
+            if confkey is None:
+                confkey = crossref.confkey
+            year = crossref.year
+        elif "year" in entry.fields and confkey is not None:
+            year = int(entry.fields["year"].expand()) % 100
+        else:
+            raise EntryKeyGenerationError(entry, "no crossref, and no year or no confkey")
+
+        try:
+            auth = auth_label(entry_persons(entry))
+        except ValueError as e:
+            raise EntryKeyGenerationError(entry, str(e))
+
+        return (confkey, auth, year)
+
+    def generate(self, entries, confkey=None):
+        """ Return the list of keys (EntryKey) for the list of new entries `entries` (in the same order).
+        If confkey is not None, it is used as conference key for all entries.
+        Entries colliding with each other get letters starting with `a',
+        entries colliding with existing entries get the first free letters """
+        labels = [self.label(entry, confkey) for entry in entries]
+
+        groups = {}
+        for (i, label) in enumerate(labels):
+            groups.setdefault(label, []).append(i)
+
+        keys = [None] * len(labels)
+        for (label, indices) in groups.items():
+            used = self.index.setdefault(label, set())
+            if len(indices) == 1 and len(used) == 0:
+                dis_list = [""]
+            else:
+                dis_list = itertools.islice((dis for dis in _dis_letters() if dis not in used), len(indices))
+            (confkey_, auth, year) = label
+            for (i, dis) in zip(indices, dis_list):
+                keys[i] = EntryKey(confkey_, year, auth, dis)
+                used.add(dis)
+
+        return keys
+
+    def generate_one(self, entry, confkey=None):
+        return self.generate([entry], confkey)[0]
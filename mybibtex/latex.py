@@ -0,0 +1,111 @@
+"""
+Transliteration of unicode strings into ascii LaTeX, e.g., é -> {\\'e}
+
+Characters that cannot be transliterated are replaced by '?' by to_ascii, which reports a (rate-limited) diagnostic
+for the entry and field being written if the key is given.
+As rendered entries may come from a RenderCache, they are also counted when parsing (see Parser.parse_stream):
+check counts them in a Counter, and log_unmapped logs a single summary for the Counter.
+"""
+
+import unicodedata
+
+from . import diagnostics
+
+# combining character -> LaTeX accent command
+_accents = {
+    "̀": "\\`",
+    "́": "\\'",
+    "̂": "\\^",
+    "̃": "\\~",
+    "̄": "\\=",
+    "̆": "\\u ",
+    "̇": "\\.",
+    "̈": "\\\"",
+    "̊": "\\r ",
+    "̋": "\\H ",
+    "̌": "\\v ",
+    "̣": "\\d ",
+    "̧": "\\c ",
+    "̨": "\\k ",
+    "̦": "\\textcommabelow ",
+}
+
+_specials = {
+    " ": "~",
+    "Å": "{\\AA}",
+    "Æ": "{\\AE}",
+    "Ø": "{\\O}",
+    "ß": "{\\ss}",
+    "å": "{\\aa}",
+    "æ": "{\\ae}",
+    "ø": "{\\o}",
+    "ı": "{\\i}",
+    "Ł": "{\\L}",
+    "ł": "{\\l}",
+    "Œ": "{\\OE}",
+    "œ": "{\\oe}",
+    "–": "--",
+    "—": "---",
+    "‘": "`",
+    "’": "'",
+    "“": "``",
+    "”": "''",
+    "…": "\\ldots{}",
+}
+
+
+def _make_table():
+    """ Return the table unicode code point -> LaTeX string used with str.translate """
+    table = {}
+    for c in map(chr, list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00))):
+        decomposition = unicodedata.normalize("NFD", c)
+        if len(decomposition) == 2 and decomposition[0].isascii() and decomposition[0].isalpha() \
+                and decomposition[1] in _accents:
+            table[ord(c)] = "{{{0}{1}}}".format(_accents[decomposition[1]], decomposition[0])
+    table.update((ord(c), latex) for (c, latex) in _specials.items())
+    return table
+
+
+table = _make_table()
+""" table for str.translate: unicode code point -> LaTeX string """
+
+
+def to_ascii(s, key=None, field=None):
+    """ Return s where non-ascii characters are transliterated into LaTeX
+    (or replaced by '?' if they cannot be, key and field being used for the diagnostic if key is not None) """
+    if s.isascii():
+        return s
+    # decomposed letters (e.g., o + U+0308) are composed first, as the table only has composed letters
+    s = unicodedata.normalize("NFC", s).translate(table)
+    if s.isascii():
+        return s
+    if key is not None:
+        chars = "".join(sorted(set(c for c in s if not c.isascii())))
+        diagnostics.report(diagnostics.UNMAPPED_CHARACTERS, key, field, chars=chars)
+    return s.encode("ascii", "replace").decode("ascii")
+
+
+def unmapped_chars(s):
+    """ Return the list of the characters of s that cannot be transliterated (replaced by '?' by to_ascii) """
+    if s.isascii():
+        return []
+    s = unicodedata.normalize("NFC", s).translate(table)
+    if s.isascii():
+        return []
+    return [c for c in s if not c.isascii()]
+
+
+def check(s, unmapped):
+    """ Count in the Counter unmapped the characters of s that cannot be transliterated """
+    unmapped.update(unmapped_chars(s))
+
+
+def log_unmapped(unmapped):
+    """ Log a single warning for all the characters counted in the Counter unmapped (nothing if it is empty) """
+    if len(unmapped) == 0:
+        return
+    diagnostics.report(
+        diagnostics.UNMAPPED_CHARACTERS_TOTAL,
+        total=sum(unmapped.values()),
+        chars=", ".join("{0} (U+{1:04X}) x{2}".format(c, ord(c), n) for (c, n) in unmapped.most_common())
+    )
@@ -0,0 +1,317 @@
+"""
+Merge of newly imported entries (e.g., from dblp.import_dblp) into an existing database
+
+>>> result = merge.merge(db, db_new)
+>>> print(result.report())
+>>> result.apply(db)
+
+Each incoming entry is matched against the existing entries using indexes built once on the existing database:
+  - proceedings (keys without authors) are matched by key,
+  - papers are matched by DOI, by (venue, start page) where the venue is the crossref (or the conference key, year
+    and volume if there is no crossref), and by normalized title within the same conference and year.
+It is then classified as:
+  - NEW: no match (it is added with its own key),
+  - IDENTICAL: the match already has all its fields (up to formatting for the identity fields author and title),
+  - UPDATED: the match misses some fields or persons (e.g., editors), or has different values for fields other than
+    author and title (it is replaced by an updated copy, under the key of the existing entry),
+  - CONFLICT: several entries match, the match is already claimed by another incoming entry, the types differ,
+    the identity fields differ, or the key of a new entry is already used (nothing is applied).
+Papers with the same normalized title in other venues (e.g., ePrint versions) are only reported as related.
+"""
+
+import re
+
+from .database import Entry, EntryKey
+from .keygen import latex_to_ascii
+
+NEW = "new"
+IDENTICAL = "identical"
+UPDATED = "updated"
+CONFLICT = "conflict"
+statuses = (NEW, IDENTICAL, UPDATED, CONFLICT)
+
+identity_fields = ("author", "title")
+""" fields that are never updated: a different value (after normalization) is a conflict """
+
+_non_alnum_re = re.compile(r"[^a-z0-9]+")
+_start_page_re = re.compile(r"^\s*([^-\s]+)")
+_doi_prefix_re = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:)", re.IGNORECASE)
+
+
+def normalize_text(s):
+    """ Return s in lower-case ascii letters and digits only (LaTeX commands, accents, braces, punctuation and spaces
+    removed), to compare titles and authors up to formatting """
+    if not s.isascii() or "\\" in s:
+        s = latex_to_ascii(s)
+    return _non_alnum_re.sub("", s.lower())
+
+
+def normalize_doi(doi):
+    return _doi_prefix_re.sub("", doi.strip()).lower()
+
+
+def field_str(entry, name):
+    """ Return the expanded value of the field name of entry (persons included), None if there is none """
+    if name in entry.fields:
+        return entry.fields[name].expand()
+    if name in entry.persons:
+        return " and ".join(str(person) for person in entry.persons[name])
+    return None
+
+
+def start_page(entry):
+    pages = entry.fields.get("pages")
+    if pages is None:
+        return None
+    r = _start_page_re.match(pages.expand())
+    return r.group(1) if r is not None else None
+
+
+def page_key(key, entry):
+    """ Return the (venue, start page) of a paper, None if it has no pages """
+    page = start_page(entry)
+    if page is None:
+        return None
+    if "crossref" in entry.fields:
+        return (entry.fields["crossref"].expand(), page)
+    volume = entry.fields["volume"].expand() if "volume" in entry.fields else ""
+    return ((key.confkey, key.year, volume), page)
+
+
+class Change(object):
+    """ Classification of an incoming entry """
+
+    __slots__ = ("status", "key", "incoming_key", "entry", "existing", "fields", "persons", "reason", "related")
+
+    def __init__(self, status, key, incoming_key, entry, existing=None, fields=None, persons=None, reason=None,
+                 related=None):
+        self.status = status
+        self.key = key
+        """ key of the entry in the database after applying the change """
+        self.incoming_key = incoming_key
+        self.entry = entry
+        """ incoming entry """
+        self.existing = existing
+        """ matched existing entry (None for NEW) """
+        self.fields = fields if fields is not None else {}
+        """ for UPDATED: dictionary field name -> (old Value or None, new Value) """
+        self.persons = persons if persons is not None else {}
+        """ for UPDATED: dictionary role -> (old value (list of persons, Value of a field or None), new list of persons) """
+        self.reason = reason
+        """ for CONFLICT: why the entry could not be merged """
+        self.related = related if related is not None else []
+        """ keys of existing papers with the same title in other venues """
+
+    def __repr__(self):
+        return "Change({0}, {1})".format(self.status, self.key)
+
+    def describe(self):
+        if self.status == NEW:
+            res = "{0:<9} {1}".format(self.status, self.key)
+        elif self.status == CONFLICT:
+            res = "{0:<9} {1}: {2}".format(self.status, self.incoming_key, self.reason)
+        elif self.key != self.incoming_key:
+            res = "{0:<9} {1} (as {2})".format(self.status, self.key, self.incoming_key)
+        else:
+            res = "{0:<9} {1}".format(self.status, self.key)
+        for (name, (old, new)) in sorted(self.fields.items()):
+            res += "\n    {0}: {1} -> {2}".format(
+                name, old.to_bib() if old is not None else "(none)", new.to_bib())
+        for (role, (old, new)) in sorted(self.persons.items()):
+            if old is None:
+                old = "(none)"
+            elif isinstance(old, list):
+                old = " and ".join(str(person) for person in old)
+            else:
+                old = old.to_bib()
+            res += "\n    {0}: {1} -> {2}".format(role, old, " and ".join(str(person) for person in new))
+        if len(self.related) > 0:
+            res += "\n    related: {0}".format(", ".join(str(key) for key in self.related))
+        return res
+
+
+class MergeResult(object):
+    def __init__(self, changes):
+        self.changes = changes
+
+    def by_status(self, status):
+        return [change for change in self.changes if change.status == status]
+
+    def counts(self):
+        res = dict.fromkeys(statuses, 0)
+        for change in self.changes:
+            res[change.status] += 1
+        return res
+
+    def apply(self, db):
+        """ Apply the NEW and UPDATED changes to db, the database the result was computed against
+        (BibliographyData or snapshot.Transaction: existing entries are not modified but replaced) """
+        for change in self.changes:
+            if change.status == NEW:
+                db.add_entry(change.key, change.entry)
+            elif change.status == UPDATED:
+                existing = change.existing
+                fields = dict(existing.fields)
+                fields.update((name, new) for (name, (old, new)) in change.fields.items())
+                persons = dict(existing.persons)
+                for (role, (old, new)) in change.persons.items():
+                    # a role given as a field in the existing entry is replaced by the persons
+                    fields.pop(role, None)
+                    persons[role] = new
+                db.replace_entry(change.key, Entry(existing.type, fields, persons))
+
+    def summary(self):
+        return ", ".join("{0} {1}".format(n, status) for (status, n) in self.counts().items())
+
+    def report(self, statuses=(NEW, UPDATED, CONFLICT)):
+        """ Return the change report: summary, then one line (and its details) per change with one of the statuses """
+        lines = [self.summary()]
+        lines.extend(change.describe() for change in self.changes if change.status in statuses)
+        return "\n".join(lines)
+
+
+class MergeIndex(object):
+    """ Lookup indexes on the papers of a database.
+    The DOI index is built at once, the page and title indexes are built by (conference, year) on first lookup
+    (an import usually touches a few conferences and years only). """
+
+    def __init__(self, db):
+        self.db = db
+        self.by_doi = {}
+        """ normalized DOI -> list of keys """
+        self.by_conf_year = {}
+        """ (confkey, year) -> list of keys """
+        self._buckets = {}
+        """ (confkey, year) -> (dictionary page key -> list of keys, dictionary normalized title -> list of keys) """
+        self._by_title_all = None
+        """ normalized title -> list of keys, built on first use """
+        for (key, entry) in db.entries.items():
+            if key.auth is not None:
+                doi = entry.fields.get("doi")
+                if doi is not None:
+                    self.by_doi.setdefault(normalize_doi(doi.expand()), []).append(key)
+                self.by_conf_year.setdefault((key.confkey, key.year), []).append(key)
+
+    def bucket(self, confkey, year):
+        res = self._buckets.get((confkey, year))
+        if res is None:
+            res = self._buckets[(confkey, year)] = ({}, {})
+            for key in self.by_conf_year.get((confkey, year), []):
+                self._add_to_bucket(res, key, self.db.entries[key])
+        return res
+
+    def _add_to_bucket(self, bucket, key, entry):
+        (pages, titles) = bucket
+        page = page_key(key, entry)
+        if page is not None:
+            pages.setdefault(page, []).append(key)
+        title = field_str(entry, "title")
+        if title is not None:
+            titles.setdefault(normalize_text(title), []).append(key)
+
+    def by_title_all(self, title):
+        if self._by_title_all is None:
+            self._by_title_all = {}
+            for (key, entry) in self.db.entries.items():
+                other = field_str(entry, "title")
+                if key.auth is not None and other is not None:
+                    self._by_title_all.setdefault(normalize_text(other), []).append(key)
+        return self._by_title_all.get(title, [])
+
+    def candidates(self, key, entry):
+        """ Return the list of keys of the existing papers matching the paper entry """
+        res = []
+        doi = entry.fields.get("doi")
+        if doi is not None:
+            res.extend(self.by_doi.get(normalize_doi(doi.expand()), []))
+        (pages, titles) = self.bucket(key.confkey, key.year)
+        page = page_key(key, entry)
+        if page is not None:
+            res.extend(pages.get(page, []))
+        title = field_str(entry, "title")
+        if title is not None:
+            res.extend(titles.get(normalize_text(title), []))
+        return list(dict.fromkeys(res))
+
+
+class Merger(object):
+    def __init__(self, db, related=True):
+        """
+        @arg db: existing database (not modified, see MergeResult.apply)
+        @arg related: look for papers with the same title in other venues
+        """
+        self.db = db
+        self.related = related
+        self.index = MergeIndex(db)
+
+    def compare(self, existing, entry):
+        """ Return (fields to update, persons to update, conflict reason or None) between the existing entry and the
+        incoming one (see Change.fields and Change.persons) """
+        if existing.type.lower() != entry.type.lower():
+            return ({}, {}, "type {0} instead of {1}".format(entry.type, existing.type))
+        fields = {}
+        persons = {}
+        for name in sorted(set(entry.fields) | set(entry.persons)):
+            new = field_str(entry, name)
+            old = field_str(existing, name)
+            if old == new:
+                continue
+            if name in identity_fields:
+                if old is None or normalize_text(old) != normalize_text(new):
+                    return ({}, {}, "{0} differs from {1}: {2}".format(name, existing.key, old))
+            elif name in entry.fields:
+                fields[name] = (existing.fields.get(name), entry.fields[name])
+            else:
+                old = existing.persons.get(name, existing.fields.get(name))
+                persons[name] = (list(old) if isinstance(old, list) else old, list(entry.persons[name]))
+        return (fields, persons, None)
+
+    def classify(self, key, entry, claimed):
+        if key.auth is None:
+            if key not in self.db.entries:
+                return Change(NEW, key, key, entry)
+            matches = [key]
+        else:
+            matches = self.index.candidates(key, entry)
+            if len(matches) == 0:
+                if key in self.db.entries:
+                    return Change(CONFLICT, key, key, entry, reason="key already used by an unmatched entry")
+                return Change(NEW, key, key, entry, related=self.find_related(key, entry))
+            if len(matches) > 1:
+                return Change(CONFLICT, key, key, entry,
+                              reason="several matches: {0}".format(", ".join(str(match) for match in matches)))
+
+        match = matches[0]
+        existing = self.db.entries[match]
+        if match in claimed:
+            return Change(CONFLICT, key, key, entry, existing,
+                          reason="{0} already matched by {1}".format(match, claimed[match]))
+        claimed[match] = key
+        (fields, persons, reason) = self.compare(existing, entry)
+        if reason is not None:
+            return Change(CONFLICT, key, key, entry, existing, reason=reason)
+        status = UPDATED if len(fields) > 0 or len(persons) > 0 else IDENTICAL
+        return Change(status, match, key, entry, existing, fields, persons)
+
+    def find_related(self, key, entry):
+        title = field_str(entry, "title")
+        if not self.related or title is None:
+            return []
+        return [other for other in self.index.by_title_all(normalize_text(title)) if other.confkey != key.confkey]
+
+    def merge(self, incoming):
+        """ Classify the entries of incoming (BibliographyData or dictionary key -> entry) and return the MergeResult """
+        entries = incoming.entries if hasattr(incoming, "entries") else incoming
+        claimed = {}
+        """ key of matched existing entry -> key of the incoming entry """
+        changes = []
+        for (key, entry) in entries.items():
+            if not isinstance(key, EntryKey):
+                key = EntryKey.from_string(key)
+            changes.append(self.classify(key, entry, claimed))
+        return MergeResult(changes)
+
+
+def merge(db, incoming, related=True):
+    """ Classify the entries of incoming against db (see Merger.merge); db is not modified """
+    return Merger(db, related).merge(incoming)
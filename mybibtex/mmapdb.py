@@ -0,0 +1,357 @@
+"""
+Compact read-only file format of a parsed database, memory-mapped and decoded lazily
+
+>>> mmapdb.write("crypto_db.bibdb", db)            # offline, after parsing
+>>> db = mmapdb.MappedBibliographyData("crypto_db.bibdb")  # in each worker: near-instant
+>>> bibtex_gen(out, db, ...)
+
+The file is pointer-free (offsets only), so that all the processes mapping it share the same pages of the OS page cache
+and memory does not grow with the number of workers. It is made of (all integers little-endian):
+  - a header (see _header), with the offsets and sizes of the other sections,
+  - the record table: for each entry in the order of the database, its key and its record (offsets and lengths
+    in the blob), as struct _record,
+  - the key table: record numbers sorted by key (utf8 bytes), looked up by binary search,
+  - the blob: keys (utf8) and records (marshal of (type, fields, persons, fingerprint), values being tuples of
+    (kind, string) parts, kind being one of _part_kinds, a macro part being (M, macro name)),
+  - the meta section (marshal): macro table, preamble and coverage (see BibliographyData.confs_years),
+  - the index section (marshal): record numbers by (conference key, full year), see MappedBibliographyData.index.
+
+Entries are decoded on access (and kept in a small LRU cache), with their fingerprint precomputed,
+so that render caches (generator.RenderCache) hit without decoding the crossrefs again.
+Keys are decoded on access too (and kept): a worker only decodes the keys of the conferences it queries.
+Decoded entries and values must be considered read-only.
+"""
+
+import collections
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections.abc import ItemsView, Mapping, Sequence, ValuesView
+
+from .database import (
+    BibliographyDataError, Entry, EntryKey, Person, Value,
+    ValuePartBrace, ValuePartMacro, ValuePartNumber, ValuePartQuote
+)
+from .query import Index
+from . import tools
+
+magic = b"MYBIBDB\x00"
+version = 2
+
+_header = struct.Struct("<8sIIQQQQQQQQ")
+""" magic, version, number of entries, offset of the record table, offset of the key table,
+offset and size of the blob, offset and size of the meta section, offset and size of the index section """
+_record = struct.Struct("<IIII")
+""" offset and length of the key, offset and length of the record (in the blob) """
+_key_index = struct.Struct("<I")
+""" record number """
+
+_part_kinds = {
+    ValuePartNumber: "N",
+    ValuePartQuote: "Q",
+    ValuePartBrace: "B",
+    ValuePartMacro: "M",
+}
+_part_classes = {kind: cls for (cls, kind) in _part_kinds.items()}
+
+
+class MappedDataError(BibliographyDataError):
+    pass
+
+
+class _Encoder(object):
+    def __init__(self):
+        self.macros = {}
+        """ macro name -> encoded value """
+
+    def value(self, value):
+        parts = []
+        for part in value:
+            kind = _part_kinds[type(part)]
+            if kind == "M":
+                self.macro(part)
+                parts.append((kind, part.macro_name))
+            else:
+                parts.append((kind, part.val))
+        return tuple(parts)
+
+    def macro(self, part):
+        encoded = self.value(part.macro_val)
+        if self.macros.setdefault(part.macro_name, encoded) != encoded:
+            raise MappedDataError("macro {0} has several values".format(part.macro_name))
+
+    def entry(self, entry):
+        fields = tuple((name, self.value(value)) for (name, value) in entry.fields.items())
+        persons = tuple((role, tuple(str(person) for person in persons)) for (role, persons) in entry.persons.items())
+        return marshal.dumps((entry.type, fields, persons, entry.fingerprint()))
+
+
+def write(filename, db):
+    """ Write db (BibliographyData) into filename (atomically) """
+    encoder = _Encoder()
+    blob = bytearray()
+    records = []
+    keys = []
+    by_conf_year = {}
+    for (i, (key, entry)) in enumerate(db.entries.items()):
+        key_bytes = str(key).encode("utf8")
+        data = encoder.entry(entry)
+        records.append(_record.pack(len(blob), len(key_bytes), len(blob) + len(key_bytes), len(data)))
+        blob += key_bytes
+        blob += data
+        keys.append((key_bytes, i))
+        by_conf_year.setdefault((key.confkey, tools.short_to_full_year(key.year)), []).append(i)
+    keys.sort()
+
+    meta = marshal.dumps({
+        "macros": encoder.macros,
+        "preamble": [encoder.value(value) for value in db._preamble],
+        "confs_years": dict(db.confs_years()),
+    })
+    index = marshal.dumps(by_conf_year)
+
+    record_table = b"".join(records)
+    key_table = b"".join(_key_index.pack(i) for (_, i) in keys)
+    records_offset = _header.size
+    keys_offset = records_offset + len(record_table)
+    blob_offset = keys_offset + len(key_table)
+    meta_offset = blob_offset + len(blob)
+    index_offset = meta_offset + len(meta)
+    header = _header.pack(
+        magic, version, len(records), records_offset, keys_offset,
+        blob_offset, len(blob), meta_offset, len(meta), index_offset, len(index)
+    )
+
+    (fd, tmp_filename) = tempfile.mkstemp(
+        prefix=".{0}.".format(os.path.basename(filename)),
+        dir=os.path.dirname(os.path.abspath(filename))
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for section in (header, record_table, key_table, blob, meta, index):
+                f.write(section)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+class _MappedItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _MappedValues(ValuesView):
+    def __iter__(self):
+        return (entry for (key, entry) in self._mapping._iter_items())
+
+
+class _KeyBucket(Sequence):
+    """ Bucket of the index of a MappedBibliographyData: keys of a list of record numbers, decoded on access """
+
+    def __init__(self, entries, records):
+        self.entries = entries
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.entries.key(r) for r in self.records[i]]
+        return self.entries.key(self.records[i])
+
+    def __iter__(self):
+        return map(self.entries.key, self.records)
+
+
+class MappedEntries(Mapping):
+    """ Read-only dictionary key -> entry of a MappedBibliographyData (keys are EntryKey or strings) """
+
+    def __init__(self, db, cache_size):
+        self.db = db
+        self.cache_size = cache_size
+        """ maximum number of decoded entries kept, None for no limit """
+        self._cache = collections.OrderedDict()
+        """ record number -> decoded entry (LRU) """
+        self._lock = threading.Lock()
+        self._keys = [None] * db._nb_entries
+        """ EntryKey of each record (None if not decoded yet) """
+        self._all_keys = False
+        """ True if all the keys are decoded """
+
+    def __len__(self):
+        return self.db._nb_entries
+
+    def key(self, i):
+        """ Return the EntryKey of the record i """
+        key = self._keys[i]
+        if key is None:
+            key = self._keys[i] = EntryKey.from_string(self.db._key_bytes(i).decode("utf8"))
+        return key
+
+    def keys_list(self):
+        """ Return the list of the EntryKey of the records (all the keys are decoded) """
+        if not self._all_keys:
+            for i in range(self.db._nb_entries):
+                self.key(i)
+            self._all_keys = True
+        return self._keys
+
+    def __iter__(self):
+        return iter(self.keys_list())
+
+    def __contains__(self, key):
+        return self.db._find(key) is not None
+
+    def __getitem__(self, key):
+        i = self.db._find(key)
+        if i is None:
+            raise KeyError(key)
+        return self.get_record(i)
+
+    def get_record(self, i, cache=True):
+        with self._lock:
+            entry = self._cache.get(i)
+            if entry is not None:
+                self._cache.move_to_end(i)
+                return entry
+        entry = self.db._decode_entry(i, self.key(i))
+        if cache:
+            with self._lock:
+                self._cache[i] = entry
+                if self.cache_size is not None and len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return entry
+
+    def _iter_items(self):
+        # with a bounded cache, full scans do not go through it, so that they do not evict the entries used by lookups
+        cache = self.cache_size is None
+        for (i, key) in enumerate(self.keys_list()):
+            yield (key, self.get_record(i, cache))
+
+    def items(self):
+        return _MappedItems(self)
+
+    def values(self):
+        return _MappedValues(self)
+
+
+class MappedBibliographyData(object):
+    """ Read-only database memory-mapped from a file written by write()
+    (same interface as BibliographyData for generation and queries) """
+
+    def __init__(self, filename, cache_size=4096):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (file_magic, file_version, self._nb_entries, self._records_offset, self._keys_offset,
+             self._blob_offset, blob_size, meta_offset, meta_size, self._index_offset, self._index_size) = \
+                _header.unpack_from(self._mmap, 0)
+        except struct.error:
+            self._mmap.close()
+            raise MappedDataError("{0} is not a mapped database".format(filename))
+        if file_magic != magic or file_version != version:
+            self._mmap.close()
+            raise MappedDataError("{0} is not a mapped database of version {1}".format(filename, version))
+
+        meta = marshal.loads(self._mmap[meta_offset:meta_offset + meta_size])
+        self._encoded_macros = meta["macros"]
+        self._macros = {}
+        """ macro name -> decoded Value (decoded on first use) """
+        self._preamble = [self._decode_value(value) for value in meta["preamble"]]
+        self._confs_years = meta["confs_years"]
+        self._index = None
+        self.entries = MappedEntries(self, cache_size)
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def preamble(self):
+        return ''.join(self._preamble)
+
+    def confs_years(self):
+        """ See BibliographyData.confs_years """
+        return self._confs_years
+
+    def index(self):
+        """ Return the query.Index of the entries, built from the index section (without scanning the entries):
+        buckets are sequences of keys decoded on access, so that only the keys of the queried buckets are decoded """
+        if self._index is None:
+            by_conf_year = marshal.loads(self._mmap[self._index_offset:self._index_offset + self._index_size])
+            # same order as Index(entries): order of first appearance, keys in the order of the entries
+            by_conf_year = sorted(by_conf_year.items(), key=lambda item: item[1][0])
+            by_conf = {}
+            for ((confkey, year), records) in by_conf_year:
+                by_conf.setdefault(confkey, []).extend(records)
+            index = Index.__new__(Index)
+            index.entries = self.entries
+            index.size = self._nb_entries
+            index.mutations = None
+            index.by_conf = {confkey: _KeyBucket(self.entries, sorted(records)) for (confkey, records) in by_conf.items()}
+            index.by_conf_year = {conf_year: _KeyBucket(self.entries, records) for (conf_year, records) in by_conf_year}
+            self._index = index
+        return self._index
+
+    def _record(self, i):
+        return _record.unpack_from(self._mmap, self._records_offset + i * _record.size)
+
+    def _key_bytes(self, i):
+        (key_offset, key_length, _, _) = self._record(i)
+        start = self._blob_offset + key_offset
+        return self._mmap[start:start + key_length]
+
+    def _find(self, key):
+        """ Return the record number of key (EntryKey or string), None if there is none (binary search) """
+        key_bytes = str(key).encode("utf8")
+        (lo, hi) = (0, self._nb_entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = _key_index.unpack_from(self._mmap, self._keys_offset + mid * _key_index.size)[0]
+            other = self._key_bytes(i)
+            if other == key_bytes:
+                return i
+            if other < key_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _macro(self, name):
+        value = self._macros.get(name)
+        if value is None:
+            value = self._macros[name] = self._decode_value(self._encoded_macros[name])
+        return value
+
+    def _decode_value(self, parts):
+        value = Value()
+        for (kind, s) in parts:
+            if kind == "M":
+                value.append(ValuePartMacro(s, self._macro(s)))
+            else:
+                value.append(_part_classes[kind](s, normalize=False))
+        return value
+
+    def _decode_entry(self, i, key):
+        (_, _, data_offset, data_length) = self._record(i)
+        start = self._blob_offset + data_offset
+        (type_, fields, persons, fingerprint) = marshal.loads(self._mmap[start:start + data_length])
+        entry = Entry(
+            type_,
+            fields={name: self._decode_value(parts) for (name, parts) in fields},
+            persons={role: [Person(person) for person in role_persons] for (role, role_persons) in persons},
+            collection=self
+        )
+        entry.key = key
+        entry._fingerprint = fingerprint
+        return entry
@@ -0,0 +1,135 @@
+"""
+Atomic write-if-changed output files
+
+>>> with AtomicOutput("crypto.bib", ignore_re=header.timestamp_line_re) as out:
+...     out.write(header.get_header(config, "gen.py"))
+...     bibtex_gen(out, db)
+>>> out.changed
+False
+
+Content is written to a temporary file in the same directory while being hashed
+(created with the default mode of new files, as if the target file was opened directly).
+When closing, the temporary file atomically replaces the target file only if the hash of the content differs
+from the hash of the existing file, lines matching ignore_re among the first ignore_lines lines being excluded
+from both hashes (e.g., the timestamp of the header).
+Otherwise, the temporary file is removed and the target file is not touched at all.
+"""
+
+import hashlib
+import os
+import shutil
+
+
+class _LineHasher(object):
+    """ Hash a text given by chunks, ignoring lines matching ignore_re among the first ignore_lines lines """
+
+    def __init__(self, ignore_re=None, ignore_lines=100):
+        self.hash = hashlib.sha256()
+        self.ignore_re = ignore_re
+        self.ignore_lines = ignore_lines if ignore_re is not None else 0
+        self.lines = 0
+        self.pending = ""
+
+    def update(self, s):
+        if self.lines >= self.ignore_lines:
+            if self.pending != "":
+                s = self.pending + s
+                self.pending = ""
+            self.hash.update(s.encode("utf8"))
+            return
+        lines = (self.pending + s).split("\n")
+        self.pending = lines.pop()
+        for (i, line) in enumerate(lines):
+            if self.lines >= self.ignore_lines:
+                # the remaining text is hashed directly
+                self.hash.update("\n".join(lines[i:] + [self.pending]).encode("utf8"))
+                self.pending = ""
+                return
+            self.lines += 1
+            if self.ignore_re.match(line) is None:
+                self.hash.update((line + "\n").encode("utf8"))
+
+    def digest(self):
+        if self.pending != "":
+            if self.ignore_re is None or self.ignore_re.match(self.pending) is None:
+                self.hash.update(self.pending.encode("utf8"))
+            self.pending = ""
+        return self.hash.digest()
+
+
+def file_digest(filename, encoding="utf8", ignore_re=None, ignore_lines=100, chunk_size=1 << 20):
+    """ Return the digest of the file as computed by AtomicOutput, or None if the file does not exist """
+    hasher = _LineHasher(ignore_re, ignore_lines)
+    try:
+        with open(filename, "r", encoding=encoding) as f:
+            while True:
+                s = f.read(chunk_size)
+                if s == "":
+                    break
+                hasher.update(s)
+    except FileNotFoundError:
+        return None
+    return hasher.digest()
+
+
+def _create_temp_file(filename, attempts=100):
+    """ Create a new temporary file in the directory of filename and return (fd, temporary filename)
+
+    Unlike tempfile.mkstemp (mode 0o600), the file gets the default mode of new files (0o666 minus the umask). """
+    prefix = os.path.join(os.path.dirname(os.path.abspath(filename)), ".{0}.".format(os.path.basename(filename)))
+    for _ in range(attempts):
+        tmp_filename = "{0}{1}.tmp".format(prefix, os.urandom(6).hex())
+        try:
+            return (os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp_filename)
+        except FileExistsError:
+            continue
+    raise FileExistsError("no usable temporary file name for {0}".format(filename))
+
+
+class AtomicOutput(object):
+    def __init__(self, filename, encoding="utf8", ignore_re=None, ignore_lines=100):
+        self.filename = filename
+        self.encoding = encoding
+        self.ignore_re = ignore_re
+        self.ignore_lines = ignore_lines
+        self.changed = None
+        """ after closing, True if the file has been replaced, False otherwise """
+        self._hasher = _LineHasher(ignore_re, ignore_lines)
+        (fd, self._tmp_filename) = _create_temp_file(filename)
+        self._file = os.fdopen(fd, "w", encoding=encoding)
+
+    def write(self, s):
+        self._file.write(s)
+        self._hasher.update(s)
+
+    def close(self):
+        """ Close the output, replacing the file if its content changed. Return True if the file has been replaced. """
+        if self.changed is not None:
+            return self.changed
+        self._file.close()
+        old_digest = file_digest(self.filename, self.encoding, self.ignore_re, self.ignore_lines)
+        if old_digest == self._hasher.digest():
+            os.remove(self._tmp_filename)
+            self.changed = False
+        else:
+            # the replaced file keeps the mode of the target (new files keep the default mode of the temporary file)
+            if old_digest is not None:
+                shutil.copymode(self.filename, self._tmp_filename)
+            os.replace(self._tmp_filename, self.filename)
+            self.changed = True
+        return self.changed
+
+    def abort(self):
+        """ Close the output without touching the file """
+        self._file.close()
+        os.remove(self._tmp_filename)
+        self.changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
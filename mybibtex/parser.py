@@ -63,6 +63,7 @@ Gaub, Hermann E.
 
 from string import ascii_letters, digits
 
+import collections
 import re
 import pybtex.io
 from mybibtex.database import *
@@ -76,6 +77,8 @@ from pybtex.scanner import (
     PrematureEOF, PybtexSyntaxError,
 )
 from mybibtex.month_names import month_names
+from mybibtex import latex
+from mybibtex import stats
 
 class Macro(object):
     def __init__(self, name):
@@ -318,6 +321,8 @@ class Parser(BaseParser):
     unicode_io = True
 
     macros = None
+    unmapped = None
+    """ Counter of the characters that cannot be transliterated into LaTeX, while parsing a non-ascii text """
 
     def __init__(self,
             encoding=None,
@@ -347,6 +352,11 @@ class Parser(BaseParser):
                     entry.add_person(Person(name), field_name)
             else:
                 entry.fields[field_name] = field_value
+                if self.unmapped is not None:
+                    # macros are checked when defined
+                    for part in field_value:
+                        if not isinstance(part, ValuePartMacro) and not part.val.isascii():
+                            latex.check(part.val, self.unmapped)
         self.data.add_entry(key, entry)
 
     def process_preamble(self, value_list):
@@ -361,9 +371,29 @@ class Parser(BaseParser):
         report_error(error)
 
     def parse_stream(self, stream):
+        """ Parse the stream, logging a summary of the characters that cannot be transliterated into LaTeX
+        (see latex.py) if there are some """
         self.unnamed_entry_counter = 1
         text = stream.read()
+        # characters are only checked if the text is not pure ascii
+        self.unmapped = None if text.isascii() else collections.Counter()
+        s = stats.current
+        if s is None:
+            res = self.parse_text(text)
+        else:
+            with s.stage("parse") as stage:
+                nb_entries = len(self.data.entries)
+                res = self.parse_text(text)
+                stage.entries += len(self.data.entries) - nb_entries
+                stage.bytes += len(text.encode("utf8"))
+        if self.unmapped is not None:
+            latex.log_unmapped(self.unmapped)
+            self.unmapped = None
+        return res
+
+    def parse_text(self, text):
         self.command_start = 0
+        macros = set(self.macros) if self.unmapped is not None else None
 
         entry_iterator = BibTeXEntryIterator(
             text,
@@ -382,5 +412,9 @@ class Parser(BaseParser):
                 self.process_entry(entry_type, *entry[1])
 
         self.macros = entry_iterator.macros # store new macros !
+        if macros is not None:
+            for (name, value) in self.macros.items():
+                if name not in macros:
+                    latex.check(value.to_bib(), self.unmapped)
 
         return self.data
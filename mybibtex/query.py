@@ -0,0 +1,414 @@
+"""
+Index-backed queries on entries of a BibliographyData
+
+Queries are built from predicates combined with & (and), | (or) and ~ (not):
+
+>>> q = Conf("C", "EC") & Years(2000, 2010) & Paper() & ~HasField("note")
+>>> for (key, entry) in q.run(db.entries):
+...     pass
+
+or parsed from a string (terms are combined with "and", a term starting with "-" is negated):
+
+>>> q = parse_query("conf:C,EC year:2000-2010 paper -has:note author:Bellare")
+
+Each query is planned against an Index of the entries: indexed predicates (conference, year) select candidate keys,
+the remaining predicates are compiled into a single function applied to candidates only.
+If no index fits, the whole query is applied in a single pass over all entries.
+Results (ResultSet) are lazy.
+
+QueryFilter wraps a query into an EntryFilter, to be used with bibtex_gen.
+"""
+
+import itertools
+import re
+from abc import ABCMeta, abstractmethod
+
+from .generator import EntryFilter
+from . import tools
+
+
+class QueryParsingError(Exception):
+    def __init__(self, query, msg):
+        self.query = query
+        message = 'Error while parsing query "{0}": {1}'.format(query, msg)
+        super(QueryParsingError, self).__init__(message)
+
+
+class Index(object):
+    """ Indexes of a dictionary of entries (key -> entry) by conference and by (conference, full year) """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.size = len(entries)
+        self.mutations = getattr(entries, "mutations", None)
+        """ mutation counter of the entries when the index was built (see database.EntryDict), None if they have none """
+        self.by_conf = {}
+        self.by_conf_year = {}
+        for key in entries:
+            year = tools.short_to_full_year(key.year)
+            self.by_conf.setdefault(key.confkey, []).append(key)
+            self.by_conf_year.setdefault((key.confkey, year), []).append(key)
+
+    def updated(self, entries, added=(), removed=()):
+        """ Return the index of entries, a new version of the indexed entries with the keys added and without
+        the keys removed. Only the modified buckets are copied (self is not modified). """
+        index = Index.__new__(Index)
+        index.entries = entries
+        index.size = len(entries)
+        index.mutations = getattr(entries, "mutations", None)
+        index.by_conf = dict(self.by_conf)
+        index.by_conf_year = dict(self.by_conf_year)
+        for (buckets, bucket_key) in (
+            (index.by_conf, lambda key: key.confkey),
+            (index.by_conf_year, lambda key: (key.confkey, tools.short_to_full_year(key.year))),
+        ):
+            modified = {}
+            """ bucket key -> copy of the bucket """
+            for key in itertools.chain(removed, added):
+                k = bucket_key(key)
+                if k not in modified:
+                    modified[k] = list(buckets.get(k, []))
+            for key in removed:
+                modified[bucket_key(key)].remove(key)
+            for key in added:
+                modified[bucket_key(key)].append(key)
+            for (k, bucket) in modified.items():
+                if len(bucket) > 0:
+                    buckets[k] = bucket
+                else:
+                    buckets.pop(k, None)
+        return index
+
+    def is_valid(self, entries):
+        """ return True if the index can be used for entries: same dictionary, not modified since the index was built
+        (for dictionaries without mutation counter, only the size is checked) """
+        return (
+            entries is self.entries
+            and len(entries) == self.size
+            and getattr(entries, "mutations", None) == self.mutations
+        )
+
+
+class Query(object, metaclass=ABCMeta):
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    @abstractmethod
+    def compile(self):
+        """ Return a function (key, entry) -> bool selecting entries """
+        pass
+
+    def candidates(self, index):
+        """ Return a list of keys containing all the selected entries,
+        or None if the query cannot be answered using index """
+        return None
+
+    def plan(self, index):
+        """ Return a pair (keys, predicate) where keys is a list of candidate keys (or None for all the entries)
+        and predicate a function (key, entry) -> bool (or None if all the candidates are selected) """
+        keys = self.candidates(index)
+        return (keys, self.compile())
+
+    def run(self, entries, index=None):
+        """ Return the lazy ResultSet of the query on entries (dictionary key -> entry) """
+        if index is None or not index.is_valid(entries):
+            index = Index(entries)
+        (keys, predicate) = self.plan(index)
+        return ResultSet(entries, keys, predicate)
+
+
+class Conf(Query):
+    """ select entries of the given conferences (conference keys) """
+
+    def __init__(self, *confkeys):
+        self.confkeys = frozenset(confkeys)
+
+    def compile(self):
+        confkeys = self.confkeys
+        return lambda k, e: k.confkey in confkeys
+
+    def candidates(self, index):
+        return [key for confkey in self.confkeys for key in index.by_conf.get(confkey, [])]
+
+    def plan(self, index):
+        return (self.candidates(index), None)
+
+
+class Years(Query):
+    """ select entries whose key year (converted to a full year) is in [start, end] (None means unbounded) """
+
+    def __init__(self, start=None, end=None):
+        self.start = start
+        self.end = end
+
+    def contains(self, year):
+        return (self.start is None or year >= self.start) and (self.end is None or year <= self.end)
+
+    def compile(self):
+        start = self.start if self.start is not None else 0
+        end = self.end if self.end is not None else 9999
+        return lambda k, e: start <= tools.short_to_full_year(k.year) <= end
+
+
+class YearSelection(Query):
+    """ select entries whose key year (converted to a full year) is selected for their conference in selection:
+    dictionary conference key -> bitset of years (see tools.year_bit and web2py_ctrl_default.resolve_years) """
+
+    def __init__(self, selection):
+        self.selection = selection
+
+    def compile(self):
+        selection = self.selection
+        return lambda k, e: tools.has_year(selection.get(k.confkey, 0), tools.short_to_full_year(k.year))
+
+    def candidates(self, index):
+        selection = self.selection
+        return [
+            key
+            for ((confkey, year), bucket) in index.by_conf_year.items()
+            if tools.has_year(selection.get(confkey, 0), year)
+            for key in bucket
+        ]
+
+    def plan(self, index):
+        return (self.candidates(index), None)
+
+
+class Paper(Query):
+    """ select papers """
+
+    def compile(self):
+        return lambda k, e: k.auth is not None
+
+
+class Proceedings(Query):
+    """ select proceedings (entries without author part in the key) """
+
+    def compile(self):
+        return lambda k, e: k.auth is None
+
+
+class Author(Query):
+    """ select entries having an author whose name contains `name` (case insensitive) """
+
+    def __init__(self, name):
+        self.name = name
+
+    def compile(self):
+        name = self.name.lower()
+
+        def predicate(k, e):
+            if "author" in e.persons:
+                return any(name in str(person).lower() for person in e.persons["author"])
+            elif "author" in e.fields:
+                return name in e.fields["author"].expand().lower()
+            return False
+        return predicate
+
+
+class HasField(Query):
+    """ select entries with the field `name` (own field, not inherited from crossref) """
+
+    def __init__(self, name):
+        self.name = name.lower()
+
+    def compile(self):
+        name = self.name
+        return lambda k, e: name in e.fields or name in e.persons
+
+
+class And(Query):
+    def __init__(self, *queries):
+        self.queries = []
+        for q in queries:
+            self.queries.extend(q.queries if isinstance(q, And) else [q])
+
+    def compile(self):
+        return _compile_and([q.compile() for q in self.queries])
+
+    def candidates(self, index):
+        return self.plan(index)[0]
+
+    def plan(self, index):
+        confs = [q for q in self.queries if isinstance(q, Conf)]
+        years = [q for q in self.queries if isinstance(q, Years)]
+        others = [q for q in self.queries if not isinstance(q, (Conf, Years))]
+
+        if len(confs) > 0 and len(years) > 0:
+            # use the index by (conf, year) for one Conf and all the Years
+            confkeys = confs[0].confkeys
+            for q in confs[1:]:
+                confkeys = confkeys & q.confkeys
+            keys = [
+                key
+                for ((confkey, year), bucket) in index.by_conf_year.items()
+                if confkey in confkeys and all(q.contains(year) for q in years)
+                for key in bucket
+            ]
+            residual = others + confs[1:]
+        else:
+            # use the most selective index
+            keys = None
+            residual = list(self.queries)
+            for q in self.queries:
+                (q_keys, q_predicate) = q.plan(index)
+                if q_keys is not None and (keys is None or len(q_keys) < len(keys)):
+                    keys = q_keys
+                    residual = [r for r in self.queries if r is not q]
+                    if q_predicate is not None:
+                        residual.append(q)
+
+        if len(residual) == 0:
+            return (keys, None)
+        return (keys, _compile_and([q.compile() for q in residual]))
+
+
+class Or(Query):
+    def __init__(self, *queries):
+        self.queries = []
+        for q in queries:
+            self.queries.extend(q.queries if isinstance(q, Or) else [q])
+
+    def compile(self):
+        predicates = [q.compile() for q in self.queries]
+        return lambda k, e: any(p(k, e) for p in predicates)
+
+    def candidates(self, index):
+        keys = {}
+        for q in self.queries:
+            q_keys = q.candidates(index)
+            if q_keys is None:
+                return None
+            keys.update(dict.fromkeys(q_keys))
+        return list(keys)
+
+
+class Not(Query):
+    def __init__(self, query):
+        self.query = query
+
+    def compile(self):
+        predicate = self.query.compile()
+        return lambda k, e: not predicate(k, e)
+
+
+def _compile_and(predicates):
+    """ Return a function computing the conjunction of predicates """
+    if len(predicates) == 1:
+        return predicates[0]
+    elif len(predicates) == 2:
+        (p1, p2) = predicates
+        return lambda k, e: p1(k, e) and p2(k, e)
+    else:
+        return lambda k, e: all(p(k, e) for p in predicates)
+
+
+class ResultSet(object):
+    """ Lazy result of a query: entries are only selected when iterating """
+
+    def __init__(self, entries, keys, predicate):
+        self.entries = entries
+        self.keys_ = keys
+        """ list of candidate keys or None for all entries """
+        self.predicate = predicate
+        """ function (key, entry) -> bool or None if all candidates are selected """
+
+    def __iter__(self):
+        entries = self.entries
+        predicate = self.predicate
+        if self.keys_ is None:
+            items = iter(entries.items())
+        else:
+            items = ((k, entries[k]) for k in self.keys_)
+        if predicate is None:
+            return items
+        return ((k, e) for (k, e) in items if predicate(k, e))
+
+    def items(self):
+        return iter(self)
+
+    def keys(self):
+        return (k for (k, e) in self)
+
+    def __len__(self):
+        if self.predicate is None and self.keys_ is not None:
+            return len(self.keys_)
+        return sum(1 for _ in self)
+
+
+class QueryFilter(EntryFilter):
+    """ EntryFilter selecting entries using a query (index-backed if the filter is not composed) """
+
+    def __init__(self, query, index=None, filter_and=None):
+        super(QueryFilter, self).__init__(filter_and=filter_and)
+        if isinstance(query, str):
+            query = parse_query(query)
+        self.query = query
+        self.index = index
+        self._predicate = query.compile()
+
+    def is_selected(self, k, e):
+        return self._predicate(k, e)
+
+    def filter(self, entries):
+        if self.filter_and is not None:
+            return super(QueryFilter, self).filter(entries)
+        if self.index is None or not self.index.is_valid(entries):
+            self.index = Index(entries)
+        return iter(self.query.run(entries, self.index))
+
+
+_year_range_re = re.compile(r"^(\d*)(?:-(\d*))?$")
+
+
+def parse_query(s):
+    """ Parse a query string made of space-separated terms, combined with "and":
+      - conf:C,EC          entries of conferences C or EC
+      - year:2000-2010     entries with year in 2000-2010 (also year:2000, year:2000-, year:-2010)
+      - paper, proceedings
+      - author:Bellare     entries with an author whose name contains Bellare
+      - has:doi            entries with a field doi
+    Terms starting with "-" are negated.
+    """
+    queries = []
+    for term in s.split():
+        negate = term.startswith("-")
+        if negate:
+            term = term[1:]
+        (name, _, arg) = term.partition(":")
+        name = name.lower()
+        if name == "conf" and arg != "":
+            q = Conf(*arg.split(","))
+        elif name == "year":
+            r = _year_range_re.match(arg)
+            if r is None or arg == "":
+                raise QueryParsingError(s, "invalid year range \"{0}\"".format(arg))
+            start = int(r.group(1)) if r.group(1) != "" else None
+            if r.group(2) is None:
+                end = start
+            else:
+                end = int(r.group(2)) if r.group(2) != "" else None
+            q = Years(start, end)
+        elif name == "paper" and arg == "":
+            q = Paper()
+        elif name == "proceedings" and arg == "":
+            q = Proceedings()
+        elif name == "author" and arg != "":
+            q = Author(arg)
+        elif name == "has" and arg != "":
+            q = HasField(arg)
+        else:
+            raise QueryParsingError(s, "unknown term \"{0}\"".format(term))
+        queries.append(~q if negate else q)
+
+    if len(queries) == 0:
+        raise QueryParsingError(s, "empty query")
+    elif len(queries) == 1:
+        return queries[0]
+    return And(*queries)
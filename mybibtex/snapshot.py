@@ -0,0 +1,479 @@
+"""
+Immutable snapshots of a database for concurrent readers, updated by transactions
+
+>>> store = snapshot.SnapshotStore(db)
+>>> snap = store.current()            # readers: a consistent version, without locks
+>>> bibtex_gen(out, snap, ...)
+>>> with store.transaction() as txn:  # writers: serialized, published atomically at the end of the block
+...     merge.merge(txn, db_new).apply(txn)
+
+Entries of the versions are stored in a persistent hash array mapped trie (PersistentMap): a new version copies
+the path from the root to each changed entry only and shares everything else with the previous version,
+so that publishing a transaction costs O(changed entries), whatever the size of the database.
+Nodes created by a transaction are owned by it and modified in place until it is published.
+
+Entries of a store are shared between versions and must not be modified: they are replaced instead
+(Transaction.replace_entry). Their collection is None, crossrefs being resolved through the snapshot
+(as the generator does with db.entries). Entries given to a transaction are taken over by the store,
+except if they still belong to a database (e.g., the initial database of the store): they are copied,
+so that the database is left unchanged. Iterating over a snapshot does not follow the insertion order of entries.
+
+The query.Index of each version is derived from the index of the previous version and the keys added and removed
+by the transaction (in O(size of the modified conference buckets)).
+"""
+
+import threading
+from collections.abc import ItemsView, Mapping, ValuesView
+
+from pybtex.errors import report_error
+
+from .database import BibliographyDataError, Entry, EntryKey, add_coverage
+from .query import Index
+from . import tools
+
+_bits = 5
+_mask = (1 << _bits) - 1
+_hash_bits = 64
+_hash_mask = (1 << _hash_bits) - 1
+
+
+def _hash(key):
+    return hash(key) & _hash_mask
+
+
+def _popcount(x):
+    return bin(x).count("1")
+
+
+class _Node(object):
+    """ Bitmap-indexed node: children are nodes, collision nodes or leaves (tuples (hash, key, value)) """
+
+    __slots__ = ("bitmap", "children", "owner")
+
+    def __init__(self, bitmap, children, owner):
+        self.bitmap = bitmap
+        self.children = children
+        self.owner = owner
+
+
+class _Collision(object):
+    """ Keys with the same (full) hash """
+
+    __slots__ = ("hash", "items", "owner")
+
+    def __init__(self, hash_, items, owner):
+        self.hash = hash_
+        self.items = items
+        self.owner = owner
+
+
+def _editable(node, owner):
+    """ Return node if it is owned by owner (transaction being built), otherwise a copy owned by owner """
+    if owner is not None and node.owner is owner:
+        return node
+    if isinstance(node, _Node):
+        return _Node(node.bitmap, list(node.children), owner)
+    return _Collision(node.hash, list(node.items), owner)
+
+
+def _merge_leaves(shift, leaf1, leaf2, owner):
+    """ Return a node at level shift containing the leaves (with different keys) """
+    if leaf1[0] == leaf2[0]:
+        return _Collision(leaf1[0], [leaf1[1:], leaf2[1:]], owner)
+    bit1 = 1 << ((leaf1[0] >> shift) & _mask)
+    bit2 = 1 << ((leaf2[0] >> shift) & _mask)
+    if bit1 == bit2:
+        return _Node(bit1, [_merge_leaves(shift + _bits, leaf1, leaf2, owner)], owner)
+    return _Node(bit1 | bit2, [leaf1, leaf2] if bit1 < bit2 else [leaf2, leaf1], owner)
+
+
+def _get(node, h, key, default):
+    shift = 0
+    while True:
+        if isinstance(node, _Collision):
+            for (k, v) in node.items:
+                if k == key:
+                    return v
+            return default
+        bit = 1 << ((h >> shift) & _mask)
+        if not node.bitmap & bit:
+            return default
+        child = node.children[_popcount(node.bitmap & (bit - 1))]
+        if isinstance(child, tuple):
+            return child[2] if child[0] == h and child[1] == key else default
+        node = child
+        shift += _bits
+
+
+def _set(node, shift, h, key, value, owner):
+    """ Return (new node, True if the key was added) """
+    if isinstance(node, _Collision):
+        if node.hash != h:
+            # a leaf with another hash in the slot of the collision node: split at this level
+            res = _Node(1 << ((node.hash >> shift) & _mask), [node], owner)
+            return _set(res, shift, h, key, value, owner)
+        for (i, (k, v)) in enumerate(node.items):
+            if k == key:
+                if v is value:
+                    return (node, False)
+                res = _editable(node, owner)
+                res.items[i] = (key, value)
+                return (res, False)
+        res = _editable(node, owner)
+        res.items.append((key, value))
+        return (res, True)
+
+    bit = 1 << ((h >> shift) & _mask)
+    i = _popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        res = _editable(node, owner)
+        res.children.insert(i, (h, key, value))
+        res.bitmap |= bit
+        return (res, True)
+
+    child = node.children[i]
+    if isinstance(child, tuple):
+        if child[0] == h and child[1] == key:
+            if child[2] is value:
+                return (node, False)
+            (new_child, added) = ((h, key, value), False)
+        else:
+            (new_child, added) = (_merge_leaves(shift + _bits, child, (h, key, value), owner), True)
+    else:
+        (new_child, added) = _set(child, shift + _bits, h, key, value, owner)
+        if new_child is child:
+            return (node, added)
+    res = _editable(node, owner)
+    res.children[i] = new_child
+    return (res, added)
+
+
+def _delete(node, shift, h, key, owner):
+    """ Return (new node, True if the key was removed), the new node being a leaf if only one is left
+    (below the root) and None if the node is empty """
+    if isinstance(node, _Collision):
+        items = [(k, v) for (k, v) in node.items if k != key]
+        if len(items) == len(node.items):
+            return (node, False)
+        if len(items) == 1:
+            return ((node.hash,) + items[0], True)
+        res = _editable(node, owner)
+        res.items = items
+        return (res, True)
+
+    bit = 1 << ((h >> shift) & _mask)
+    if not node.bitmap & bit:
+        return (node, False)
+    i = _popcount(node.bitmap & (bit - 1))
+    child = node.children[i]
+    if isinstance(child, tuple):
+        if child[0] != h or child[1] != key:
+            return (node, False)
+        new_child = None
+    else:
+        (new_child, removed) = _delete(child, shift + _bits, h, key, owner)
+        if not removed:
+            return (node, False)
+
+    if new_child is None:
+        if len(node.children) == 1:
+            return (None, True)
+        if shift > 0 and len(node.children) == 2 and isinstance(node.children[1 - i], tuple):
+            return (node.children[1 - i], True)  # a single leaf left: moved up to the parent
+        res = _editable(node, owner)
+        del res.children[i]
+        res.bitmap &= ~bit
+        return (res, True)
+    if shift > 0 and len(node.children) == 1 and isinstance(new_child, tuple):
+        return (new_child, True)
+    res = _editable(node, owner)
+    res.children[i] = new_child
+    return (res, True)
+
+
+def _iter_leaves(node):
+    if isinstance(node, _Collision):
+        for (k, v) in node.items:
+            yield (k, v)
+        return
+    for child in node.children:
+        if isinstance(child, tuple):
+            yield (child[1], child[2])
+        else:
+            yield from _iter_leaves(child)
+
+
+class _MapItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _MapValues(ValuesView):
+    def __iter__(self):
+        return (v for (k, v) in self._mapping._iter_items())
+
+
+class PersistentMap(Mapping):
+    """ Immutable dictionary: set and delete return a new map sharing all the unchanged nodes """
+
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, root=None, size=0):
+        self._root = root
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        if self._root is not None:
+            res = _get(self._root, _hash(key), key, _missing)
+            if res is not _missing:
+                return res
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if self._root is None:
+            return default
+        return _get(self._root, _hash(key), key, default)
+
+    def __contains__(self, key):
+        return self._root is not None and _get(self._root, _hash(key), key, _missing) is not _missing
+
+    def _iter_items(self):
+        if self._root is not None:
+            yield from _iter_leaves(self._root)
+
+    def __iter__(self):
+        return (k for (k, v) in self._iter_items())
+
+    def items(self):
+        return _MapItems(self)
+
+    def values(self):
+        return _MapValues(self)
+
+    def set(self, key, value, owner=None):
+        if self._root is None:
+            return PersistentMap(_Node(0, [], owner), 0).set(key, value, owner)
+        (root, added) = _set(self._root, 0, _hash(key), key, value, owner)
+        return PersistentMap(root, self._size + 1 if added else self._size)
+
+    def delete(self, key, owner=None):
+        """ Return the map without key (KeyError if key is not in the map) """
+        if self._root is None:
+            raise KeyError(key)
+        (root, removed) = _delete(self._root, 0, _hash(key), key, owner)
+        if not removed:
+            raise KeyError(key)
+        if isinstance(root, tuple):
+            root = _Node(1 << (root[0] & _mask), [root], owner)
+        return PersistentMap(root, self._size - 1)
+
+
+_missing = object()
+
+
+def _own(entry):
+    """ Return entry if it belongs to no collection, a copy of it otherwise """
+    if entry.collection is None:
+        return entry
+    return Entry(entry.type, entry.fields, {role: list(persons) for (role, persons) in entry.persons.items()})
+
+
+class Snapshot(object):
+    """ Immutable version of a database (same interface as BibliographyData for generation and queries) """
+
+    def __init__(self, version, entries, preamble, conf_year_counts, confs_years, index=None):
+        self.version = version
+        self.entries = entries
+        """ PersistentMap key -> entry """
+        self._preamble = preamble
+        self._conf_year_counts = conf_year_counts
+        self._confs_years = confs_years
+        self._index = index
+
+    def __repr__(self):
+        return "Snapshot(version={0}, entries={1})".format(self.version, len(self.entries))
+
+    def preamble(self):
+        return ''.join(self._preamble)
+
+    def confs_years(self):
+        """ See BibliographyData.confs_years """
+        return self._confs_years
+
+    def index(self):
+        """ Return the query.Index of the entries of the snapshot
+        (derived from the previous version by Transaction.commit, or built on first use) """
+        if self._index is None:
+            self._index = Index(self.entries)
+        return self._index
+
+
+class Transaction(object):
+    """ Changes to the current version of a SnapshotStore (same methods as BibliographyData to add, replace and
+    remove entries), published as a new Snapshot by commit """
+
+    def __init__(self, store, base):
+        self.store = store
+        self.base = base
+        self._owner = object()
+        """ token owning the nodes created by the transaction (modified in place until commit) """
+        self._entries = base.entries
+        self._preamble = base._preamble
+        self._conf_year_counts = base._conf_year_counts
+        self._confs_years = base._confs_years
+        self._coverage_copied = False
+        self._added = {}
+        """ keys added (and not in base), as an ordered set """
+        self._removed = set()
+        """ keys of base removed (and not added again) """
+        self.changed = 0
+        """ number of changes (entries added, replaced or removed) """
+        self.published = None
+        """ Snapshot published by commit """
+
+    @property
+    def entries(self):
+        """ Entries of the version being built (only valid until the next change) """
+        return self._entries
+
+    def confs_years(self):
+        return self._confs_years
+
+    def _check_open(self):
+        if self._owner is None:
+            raise BibliographyDataError("transaction already committed or rolled back")
+
+    def _add_coverage(self, key, delta):
+        if key.auth is None:
+            return
+        if not self._coverage_copied:
+            self._conf_year_counts = dict(self._conf_year_counts)
+            self._confs_years = dict(self._confs_years)
+            self._coverage_copied = True
+        add_coverage(self._conf_year_counts, self._confs_years, key.confkey, tools.short_to_full_year(key.year), delta)
+
+    def add_to_preamble(self, *values):
+        self._check_open()
+        self._preamble = self._preamble + tuple(values)
+
+    def add_entry(self, key, entry):
+        self._check_open()
+        if not isinstance(key, EntryKey):
+            key = EntryKey.from_string(key)
+        if key in self._entries:
+            report_error(BibliographyDataError('repeated bibliography entry: %s' % key))
+            return
+        entry = _own(entry)
+        entry.key = key
+        entry.invalidate()
+        self._entries = self._entries.set(key, entry, self._owner)
+        self._add_coverage(key, 1)
+        if key in self._removed:
+            self._removed.discard(key)
+        else:
+            self._added[key] = None
+        self.changed += 1
+
+    def add_entries(self, entries):
+        for key, entry in entries:
+            self.add_entry(key, entry)
+
+    def replace_entry(self, key, entry):
+        """ Replace the entry key (which has to exist) by entry, and return the old entry """
+        self._check_open()
+        if not isinstance(key, EntryKey):
+            key = EntryKey.from_string(key)
+        old = self._entries[key]
+        entry = _own(entry)
+        entry.key = key
+        entry.invalidate()
+        self._entries = self._entries.set(key, entry, self._owner)
+        self.changed += 1
+        return old
+
+    def remove_entry(self, key):
+        """ Remove the entry key and return it """
+        self._check_open()
+        if not isinstance(key, EntryKey):
+            key = EntryKey.from_string(key)
+        old = self._entries[key]
+        self._entries = self._entries.delete(key, self._owner)
+        self._add_coverage(key, -1)
+        if key in self._added:
+            del self._added[key]
+        else:
+            self._removed.add(key)
+        self.changed += 1
+        return old
+
+    def commit(self):
+        """ Publish the changes as the current version of the store and return the new Snapshot """
+        self._check_open()
+        self._owner = None
+        if self.changed == 0 and self._preamble is self.base._preamble:
+            self.published = self.base
+        else:
+            index = None
+            if self.base._index is not None:
+                index = self.base._index.updated(self._entries, self._added, self._removed)
+            self.published = self.store._publish(self.base, Snapshot(
+                self.base.version + 1, self._entries, self._preamble, self._conf_year_counts, self._confs_years, index
+            ))
+        return self.published
+
+    def rollback(self):
+        self._check_open()
+        self._owner = None
+
+
+class SnapshotStore(object):
+    """ Current version of a database: readers get it with current(), writers change it with transaction() """
+
+    def __init__(self, db=None):
+        """ @arg db: initial content (BibliographyData, left unchanged: its entries are copied) """
+        entries = PersistentMap()
+        self._current = Snapshot(0, entries, (), {}, {}, Index(entries))
+        self._write_lock = threading.Lock()
+        if db is not None:
+            with self.transaction() as txn:
+                txn.add_entries(db.entries.items())
+                txn.add_to_preamble(*db._preamble)
+
+    def current(self):
+        """ Return the current Snapshot (without locking: publishing only replaces the reference) """
+        return self._current
+
+    def transaction(self):
+        """ Return a context manager starting a Transaction on the current version (transactions are serialized),
+        committed at the end of the block or rolled back if an exception is raised """
+        return _TransactionContext(self)
+
+    def _publish(self, base, snapshot):
+        if base is not self._current:
+            raise BibliographyDataError("transaction based on version {0} instead of {1}".format(
+                base.version, self._current.version))
+        self._current = snapshot
+        return snapshot
+
+
+class _TransactionContext(object):
+    def __init__(self, store):
+        self.store = store
+        self.transaction = None
+
+    def __enter__(self):
+        self.store._write_lock.acquire()
+        self.transaction = Transaction(self.store, self.store._current)
+        return self.transaction
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.transaction.commit()
+            elif self.transaction._owner is not None:
+                self.transaction.rollback()
+        finally:
+            self.store._write_lock.release()
@@ -0,0 +1,181 @@
+"""
+Opt-in per-stage statistics of parsing and generation
+
+>>> with stats.profile() as s:
+...     db = parser.Parser().parse_file("crypto_db.bib")
+...     bibtex_gen_file("crypto.bib", db)
+>>> print(s.table())
+>>> s.to_json()
+
+Stages are parse (Parser.parse_stream), filter, sort, render (bibtex_entry_str), write (writes to the output)
+and commit (closing output files). For each stage are recorded: number of calls, wall-clock and CPU times,
+number of entries, bytes, render cache hits and misses, and the peak of traced memory if profiling with memory=True
+(tracemalloc, which slows everything down).
+
+When profiling is disabled (current is None), the instrumented functions only check `stats.current is not None`.
+"""
+
+import json
+import time
+import tracemalloc
+
+current = None
+""" Stats being recorded, None if profiling is disabled """
+
+
+class StageStats(object):
+    __slots__ = ("name", "calls", "wall", "cpu", "entries", "bytes", "cache_hits", "cache_misses", "peak_memory")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.entries = 0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.peak_memory = None
+
+    def cache_hit_rate(self):
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total > 0 else None
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "entries": self.entries,
+            "bytes": self.bytes,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hit_rate(),
+            "peak_memory": self.peak_memory,
+        }
+
+
+class _Stage(object):
+    """ Context manager measuring a stage, see Stats.stage """
+
+    def __init__(self, stats, stage):
+        self.stats = stats
+        self.stage = stage
+
+    def __enter__(self):
+        if self.stats.memory:
+            self.stats._enter_memory()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self.stage
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stage = self.stage
+        stage.cpu += time.process_time() - self._cpu
+        stage.wall += time.perf_counter() - self._wall
+        stage.calls += 1
+        if self.stats.memory:
+            peak = self.stats._exit_memory()
+            stage.peak_memory = peak if stage.peak_memory is None else max(stage.peak_memory, peak)
+
+
+class Stats(object):
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        """ name -> StageStats, in order of first use """
+        self._peaks = []
+        """ peak of traced memory of the open stages (when memory is True) """
+        self._started_tracemalloc = False
+
+    def get(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats(name)
+        return stage
+
+    def stage(self, name):
+        """ Return a context manager measuring the stage name, which returns the StageStats
+        (so that entries, bytes, ... can be added) """
+        return _Stage(self, self.get(name))
+
+    def add(self, name, wall=0.0, cpu=0.0, calls=0, entries=0, bytes=0, cache_hits=0, cache_misses=0):
+        """ Add measures to the stage name (for stages measured in loops) """
+        stage = self.get(name)
+        stage.wall += wall
+        stage.cpu += cpu
+        stage.calls += calls
+        stage.entries += entries
+        stage.bytes += bytes
+        stage.cache_hits += cache_hits
+        stage.cache_misses += cache_misses
+
+    def _enter_memory(self):
+        # tracemalloc has a single peak: the peak of the enclosing stage is saved before resetting it
+        peak = tracemalloc.get_traced_memory()[1]
+        if len(self._peaks) > 0:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        self._peaks.append(0)
+        tracemalloc.reset_peak()
+
+    def _exit_memory(self):
+        peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if len(self._peaks) > 0:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        return peak
+
+    def to_dict(self):
+        return {name: stage.to_dict() for (name, stage) in self.stages.items()}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def table(self):
+        lines = ["{0:<10} {1:>7} {2:>10} {3:>10} {4:>9} {5:>12} {6:>7} {7:>12}".format(
+            "stage", "calls", "wall (s)", "cpu (s)", "entries", "bytes", "cache", "peak mem")]
+        for stage in self.stages.values():
+            rate = stage.cache_hit_rate()
+            lines.append("{0:<10} {1:>7} {2:>10.4f} {3:>10.4f} {4:>9} {5:>12} {6:>7} {7:>12}".format(
+                stage.name,
+                stage.calls,
+                stage.wall,
+                stage.cpu,
+                stage.entries,
+                stage.bytes,
+                "{0:.1%}".format(rate) if rate is not None else "-",
+                "{0:.1f} MiB".format(stage.peak_memory / 2**20) if stage.peak_memory is not None else "-"
+            ))
+        return "\n".join(lines)
+
+
+def enable(memory=False):
+    """ Start recording statistics in a new Stats, and return it """
+    global current
+    current = Stats(memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        current._started_tracemalloc = True
+    return current
+
+
+def disable():
+    """ Stop recording statistics, and return the recorded Stats (None if profiling was not enabled) """
+    global current
+    res = current
+    current = None
+    if res is not None and res._started_tracemalloc:
+        tracemalloc.stop()
+    return res
+
+
+class profile(object):
+    """ Context manager enabling profiling, returns the Stats """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+
+    def __enter__(self):
+        return enable(self.memory)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        disable()
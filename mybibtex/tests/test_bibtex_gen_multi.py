@@ -0,0 +1,55 @@
+import io
+import itertools
+
+import pytest
+
+from mybibtex import generator
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(300, seed=6)
+
+
+options_list = [
+    dict(zip(["expand_crossrefs", "include_crossrefs", "expand_values", "remove_empty_fields"], values))
+    for values in itertools.product([False, True], repeat=4)
+]
+
+
+def gen_multi(db, cache=None, **kwargs):
+    targets = [(io.StringIO(), options) for options in options_list]
+    generator.bibtex_gen_multi(targets, db, cache=cache, **kwargs)
+    return [out.getvalue() for (out, options) in targets]
+
+
+def test_multi_equals_separate(db):
+    expected = [generator.bibtex_gen_str(db, **options) for options in options_list]
+    assert len(set(expected)) > 1
+    assert gen_multi(db) == expected
+
+
+def test_multi_equals_separate_filter(db):
+    entry_filter = generator.FilterPaper(generator.FilterConf("C"))
+    expected = [generator.bibtex_gen_str(db, entry_filter=entry_filter, **options) for options in options_list]
+    assert gen_multi(db, entry_filter=entry_filter) == expected
+
+
+def test_multi_equals_separate_cache(db):
+    expected = [generator.bibtex_gen_str(db, **options) for options in options_list]
+
+    cache = generator.RenderCache()
+    assert gen_multi(db, cache=cache) == expected
+    assert cache.misses > 0
+    # warm cache
+    misses = cache.misses
+    assert gen_multi(db, cache=cache) == expected
+    assert cache.misses == misses
+
+    # cache filled by separate calls
+    cache = generator.RenderCache()
+    for options in options_list:
+        generator.bibtex_gen_str(db, cache=cache, **options)
+    misses = cache.misses
+    assert gen_multi(db, cache=cache) == expected
+    assert cache.misses == misses
@@ -0,0 +1,50 @@
+import io
+
+from mybibtex import dblp, diagnostics
+from mybibtex.database import BibliographyData, Entry, EntryKey, Value, ValuePartQuote
+
+
+dump = b"""<?xml version="1.0" encoding="ISO-8859-1"?>
+<!DOCTYPE dblp SYSTEM "dblp.dtd">
+<dblp>
+<inproceedings key="conf/crypto/BellareR93">
+<author>Mihir Bellare</author><author>Phillip Rogaway</author>
+<title>Entity Authentication and Key Distribution.</title>
+<pages>232-249</pages><year>1993</year><crossref>conf/crypto/1993</crossref>
+</inproceedings>
+<inproceedings key="conf/crypto/BellareR93a">
+<author>Mihir Bellare</author><author>Phillip Rogaway</author>
+<title>Sch&ouml;n.</title>
+<pages>250-260</pages><year>1993</year><crossref>conf/crypto/1993</crossref>
+</inproceedings>
+<inproceedings key="conf/crypto/Orphan94">
+<author>Ann Orphan</author><title>No Proceedings.</title>
+<pages>1-10</pages><year>1994</year><crossref>conf/crypto/1994</crossref>
+</inproceedings>
+<inproceedings key="conf/crypto/Existing95">
+<author>Ann Existing</author><title>Existing Proceedings.</title>
+<pages>1-10</pages><year>1995</year><crossref>conf/crypto/1995</crossref>
+</inproceedings>
+<inproceedings key="conf/other/Other93">
+<author>Ann Other</author><title>Other Venue.</title><year>1993</year>
+</inproceedings>
+<proceedings key="conf/crypto/1993">
+<editor>Douglas R. Stinson</editor><title>Advances in Cryptology - CRYPTO '93.</title>
+<publisher>Springer</publisher><year>1993</year>
+</proceedings>
+</dblp>
+"""
+
+
+def test_import_dblp(config, collector):
+    db = BibliographyData()
+    db.add_entry(EntryKey.from_string("C95"), Entry("proceedings", {"year": Value([ValuePartQuote("1995")])}))
+    res = dblp.import_dblp(io.BytesIO(dump), db, chunk_size=64)
+
+    keys = set(str(key) for key in res.entries)
+    assert keys == {"C93", "C:BelRog93a", "C:BelRog93b", "C:Existing95"}
+    # the proceedings comes after its papers in the dump, the crossrefs of the papers still resolve
+    assert res.entries[EntryKey.from_string("C:BelRog93a")].fields["crossref"].expand() == "C93"
+    assert res.entries[EntryKey.from_string("C:BelRog93b")].fields["title"].expand() == "Schön"
+    # the proceedings of Orphan94 is neither in the dump nor in db
+    assert collector.counts[diagnostics.DBLP_SKIPPED] == 1
@@ -0,0 +1,74 @@
+import logging
+import pickle
+
+from mybibtex import diagnostics
+
+
+def messages(caplog):
+    return [record.getMessage() for record in caplog.records if record.name == "mybibtex"]
+
+
+def test_repeated_diagnostics_aggregated(caplog):
+    caplog.set_level(logging.WARNING, logger="mybibtex")
+    collector = diagnostics.Collector(limit=3)
+    for i in range(5):
+        collector.report(diagnostics.INCORRECT_PAGES, "C:Foo9{0}".format(i), "pages")
+        collector.report(diagnostics.MISSING_YEARS, "C", years="1990", min_year=1991)
+
+    assert collector.counts[diagnostics.INCORRECT_PAGES] == 5
+    assert collector.counts[diagnostics.MISSING_YEARS] == 5
+    logged = messages(caplog)
+    # only the first diagnostics of a limited code are logged, all of an unlimited code
+    assert [m for m in logged if "incorrect pages" in m] == \
+        ["Problem in entry \"C:Foo9{0}\": incorrect pages !".format(i) for i in range(3)]
+    assert len([m for m in logged if "are missing" in m]) == 5
+
+    summary = collector.summary().split("\n")
+    assert len(summary) == 3
+    assert summary[1].split() == ["incorrect-pages", "WARNING", "5", "3"]
+    assert summary[2].split() == ["missing-years", "WARNING", "5", "5"]
+
+    caplog.clear()
+    collector.log_summary()
+    assert messages(caplog) == ["Diagnostics summary:\n" + collector.summary()]
+
+    collector.clear()
+    assert collector.summary() == ""
+
+
+def test_drain_and_merge(caplog):
+    caplog.set_level(logging.WARNING, logger="mybibtex")
+    worker = diagnostics.Collector(limit=2)
+    worker.buffering = True
+    for i in range(4):
+        worker.report(diagnostics.INCORRECT_YEAR, "C:Foo9{0}".format(i), year="9{0}x".format(i))
+    assert messages(caplog) == []
+    # examples are buffered up to the limit, the others only counted
+    assert [str(d) for d in worker.buffer] == [
+        "Problem in entry \"C:Foo9{0}\": incorrect year \"9{0}x\" (not exported as a date) !".format(i)
+        for i in range(2)
+    ]
+
+    drained = pickle.loads(pickle.dumps(worker.drain()))
+    assert worker.counts == {} and worker.buffer == []
+    assert drained[0] == {diagnostics.INCORRECT_YEAR: 4}
+    assert drained[1][0].code is diagnostics.INCORRECT_YEAR
+
+    parent = diagnostics.Collector(limit=3)
+    parent.report(diagnostics.INCORRECT_YEAR, "EC:Bar90", year="90x")
+    parent.merge(drained)
+    assert parent.counts[diagnostics.INCORRECT_YEAR] == 5
+    # the examples of the worker are logged within the limit of the parent
+    assert messages(caplog) == [
+        "Problem in entry \"{0}\": incorrect year \"{1}\" (not exported as a date) !".format(key, year)
+        for (key, year) in [("EC:Bar90", "90x"), ("C:Foo90", "90x"), ("C:Foo91", "91x")]
+    ]
+
+
+def test_messages_formatted_when_logged(caplog):
+    caplog.set_level(logging.ERROR, logger="mybibtex")
+    collector = diagnostics.Collector()
+    # arguments missing from the template: an error if the message was formatted
+    collector.report(diagnostics.INCORRECT_YEAR, "C:Foo90")
+    assert collector.counts[diagnostics.INCORRECT_YEAR] == 1
+    assert messages(caplog) == []
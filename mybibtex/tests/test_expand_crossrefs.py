@@ -0,0 +1,88 @@
+import pytest
+
+from mybibtex import generator
+from mybibtex.database import Entry, EntryKey, Person, Value, ValuePartQuote
+
+
+def baseline_format_fields(db, key, entry, expand_crossrefs=False, expand_values=False):
+    """ bibtex_entry_format_fields before Entry.inheritable_fields (copy of the crossref fields for each entry) """
+
+    def format_persons(persons):
+        return Value([ValuePartQuote((" and ").join([str(person) for person in persons]))])
+
+    def format_author(author):
+        res = author.expand().replace(" and ", " and\n" + " "*18)
+        return Value([ValuePartQuote(res, normalize=False)])
+
+    fields = entry.fields.copy()
+
+    # expand persons
+    for (role, persons) in entry.persons.items():
+        if role not in fields:
+            fields[role] = format_persons(persons)
+
+    # format author
+    if "author" in fields:
+        fields["author"] = format_author(fields["author"])
+
+    # expand crossrefs
+    if expand_crossrefs:
+        if "crossref" in fields:
+            crossref_fields = db.entries[EntryKey.from_string(fields["crossref"].expand())].fields.copy()
+            del crossref_fields["key"]
+            fields = dict(list(crossref_fields.items()) + list(fields.items()))
+            del fields["crossref"]
+
+    return fields
+
+
+def quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+@pytest.fixture
+def db(corpus_db):
+    db = corpus_db(300, seed=9)
+    # fields overriding inherited fields, and persons
+    db.add_entry("C:Override93", Entry("inproceedings", {
+        "author": quote("Ann Override"),
+        "title": quote("Overriding"),
+        "booktitle": quote("Special Issue of CRYPTO 1993"),
+        "year": quote("1994"),
+        "crossref": quote("C93"),
+    }))
+    entry = Entry("inproceedings", {"title": quote("Persons"), "crossref": quote("C93")})
+    entry.add_person(Person("Ann Person"), "author")
+    entry.add_person(Person("Ed Itor"), "editor")
+    db.add_entry("C:Person93", entry)
+    return db
+
+
+def entry_text(bib, key):
+    return bib[bib.index("{" + key + ","):].split("\n}")[0]
+
+
+@pytest.mark.parametrize("options", [
+    {"expand_crossrefs": True},
+    {"expand_crossrefs": True, "expand_values": True},
+    {"expand_crossrefs": True, "expand_values": True, "remove_empty_fields": True},
+])
+def test_expanded_exports_equal_baseline(db, monkeypatch, options):
+    res = generator.bibtex_gen_str(db, **options)
+    monkeypatch.setattr(generator, "bibtex_entry_format_fields", baseline_format_fields)
+    assert res == generator.bibtex_gen_str(db, **options)
+
+    override = entry_text(res, "C:Override93")
+    assert "Special Issue of CRYPTO 1993" in override
+    assert "1994" in override
+    assert "Ed Itor" in entry_text(res, "C:Person93")
+
+
+def test_inheritable_fields_follow_crossref(db):
+    crossref = db.entries[EntryKey.from_string("C93")]
+    inherited = crossref.inheritable_fields()
+    assert "key" not in inherited
+    assert "key" in crossref.fields
+    crossref.fields["publisher"] = quote("Other Publisher")
+    assert crossref.inheritable_fields()["publisher"].expand() == "Other Publisher"
+    assert "Other Publisher" in generator.bibtex_gen_str(db, expand_crossrefs=True)
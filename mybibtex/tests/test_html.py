@@ -0,0 +1,94 @@
+from mybibtex.database import BibliographyData, Entry, EntryKey, Value, ValuePartQuote
+from mybibtex.format.html import HTMLRenderer, format_title
+from mybibtex.snapshot import SnapshotStore
+
+
+def value(s):
+    return Value([ValuePartQuote(s)])
+
+
+def make_db():
+    db = BibliographyData()
+    db.add_entry("C93", Entry("proceedings", {"booktitle": value("CRYPTO 1993"), "year": value("1993")}))
+    db.add_entry("C:BelRog93", Entry("inproceedings", {
+        "title": value("Entity Authentication"),
+        "pages": value("232--249"),
+        "crossref": value("C93"),
+    }))
+    return db
+
+
+def test_render_entry_inherits_crossref_fields():
+    db = make_db()
+    (key, entry) = list(db.entries.items())[1]
+    s = HTMLRenderer(db).render_entry(key, entry)
+    assert "CRYPTO 1993" in s
+    assert "1993" in s
+
+
+def test_render_entry_inherits_crossref_fields_in_snapshot(config):
+    snapshot = SnapshotStore(make_db()).current()
+    s = HTMLRenderer(snapshot).render_conference("C")
+    assert '<span class="venue">CRYPTO 1993</span>' in s
+    assert "pp. 232&ndash;249, 1993" in s
+
+
+def test_render_entry_cache_follows_crossref():
+    db = make_db()
+    renderer = HTMLRenderer(db)
+    (key, entry) = list(db.entries.items())[1]
+    assert "CRYPTO 1993" in renderer.render_entry(key, entry)
+    db.entries[EntryKey.from_string("C93")].fields["booktitle"] = value("Advances in Cryptology - CRYPTO 1993")
+    assert "Advances in Cryptology" in renderer.render_entry(key, entry)
+
+
+def test_render_entry_cache_bounded(corpus_db):
+    db = corpus_db(300, seed=7)
+    renderer = HTMLRenderer(db, max_entries=50)
+    entries = list(db.entries.items())
+    expected = [renderer.render_entry(key, entry) for (key, entry) in entries]
+    assert len(renderer.cache.entries) == 50
+    assert [renderer.render_entry(key, entry) for (key, entry) in entries] == expected
+
+
+def old_format_title(t):
+    """ format_title before it supported nested braces (quadratic time) """
+    i = 1
+    j = t.find("{", i)
+    while j != -1:
+        k = t.find("}", j)
+        if k == -1:
+            break
+        t = t[:i] + t[i:j].lower() + t[j+1:k] + t[k+1:]
+        i = k
+        j = t.find("{", i)
+    if i != -1:
+        t = t[:i] + t[i:].lower()
+    return t
+
+
+def test_format_title_equals_old(corpus_db):
+    db = corpus_db(1000, seed=7)
+    titles = [entry.fields["title"].expand() for entry in db.entries.values() if "title" in entry.fields]
+    titles += [
+        "Attacks on {AES} Today",
+        "Security of $O(n^2)$ Protocols",
+        "Cryptanalysis of {\\'E}cole {\\'Ecole} Ciphers",
+        "On {D}amg{\\aa}rd's Scheme",
+        "",
+    ]
+    # the old implementation lowered the first braced part of titles starting with {
+    titles = [t for t in titles if not t.startswith("{")]
+    assert len(titles) > 100
+    for t in titles:
+        assert format_title(t) == old_format_title(t), t
+
+
+def test_format_title_nested():
+    assert format_title("{AES} Is {Secure}") == "AES is Secure"
+    assert format_title("Breaking {T{LS} {1.2}} Again") == "Breaking TLS 1.2 again"
+    assert format_title("The {$\\mathsf{NP}$} Problem") == "The $\\mathsfNP$ problem"
+    assert format_title("On {\\'{E}}cole {$\\mathcal{O}(\\sqrt{N})$} Bounds") == "On \\'Ecole $\\mathcalO(\\sqrtN)$ bounds"
+    # unbalanced braces
+    assert format_title("Extra} Brace {{Kept}}") == "Extra brace Kept"
+    assert format_title("Unbalanced {Title") == "Unbalanced Title"
@@ -0,0 +1,45 @@
+import io
+import json
+
+import pytest
+
+from mybibtex import diagnostics, generator
+from mybibtex.database import BibliographyData, Entry, EntryKey, Value, ValuePartQuote
+
+
+def value(s):
+    return Value([ValuePartQuote(s)])
+
+
+def make_db():
+    db = BibliographyData()
+    db.add_entry("C93", Entry("proceedings", {"booktitle": value("CRYPTO 1993"), "year": value("1993"), "month": value("August")}))
+    db.add_entry("C:BelRog93", Entry("inproceedings", {"title": value("Entity Authentication"), "crossref": value("C93")}))
+    db.add_entry("C:Shamir93", Entry("inproceedings", {"title": value("Birational Permutations"), "year": value("to appear")}))
+    return db
+
+
+def test_csl_date_parts(collector):
+    db = make_db()
+    entry = db.entries[EntryKey.from_string("C:BelRog93")]
+    assert generator.csl_entry(db, "C:BelRog93", entry)["issued"] == {"date-parts": [[1993, 8]]}
+
+    entry = db.entries[EntryKey.from_string("C:Shamir93")]
+    assert "issued" not in generator.csl_entry(db, "C:Shamir93", entry)
+    assert collector.counts[diagnostics.INCORRECT_YEAR] == 1
+
+
+def test_json_gen_options(config, collector):
+    db = make_db()
+    out = io.StringIO()
+    generator.json_gen(out, db)
+    assert [e["id"] for e in json.loads(out.getvalue())] == ["C:BelRog93", "C:Shamir93"]
+
+    out = io.StringIO()
+    generator.json_gen(out, db, json_format="jsonl", expand_values=False)
+    assert [json.loads(line)["key"] for line in out.getvalue().splitlines()] == ["C:BelRog93", "C:Shamir93"]
+
+    with pytest.raises(TypeError):
+        generator.json_gen(io.StringIO(), db, expand_values=False)
+    with pytest.raises(ValueError):
+        generator.json_gen(io.StringIO(), db, json_format="xml")
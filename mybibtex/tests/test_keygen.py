@@ -0,0 +1,51 @@
+from mybibtex import keygen
+from mybibtex.database import BibliographyData, Entry, EntryKey, Value, ValuePartQuote
+
+
+def quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+def paper(author, crossref="C93"):
+    return Entry("inproceedings", {"author": quote(author), "crossref": quote(crossref)})
+
+
+def keys(entries, db=None, confkey=None):
+    return [str(key) for key in keygen.KeyGenerator(db).generate(entries, confkey)]
+
+
+def test_auth_label():
+    assert keys([paper("Claus-Peter Schn{\\\"o}rr")]) == ["C:Schnorr93"]
+    assert keys([paper("Mihir Bellare and Phillip Rogaway")]) == ["C:BelRog93"]
+    assert keys([paper("A. Alpha and B. Beta and C. Gamma and D. Delta and E. Eps and F. Phi and G. Gam")]) == ["C:ABGDEP93"]
+
+
+def test_collision_letters():
+    entries = [paper("Mihir Bellare and Phillip Rogaway"), paper("Ann Other"), paper("Mihir Bellare and Phillip Rogaway")]
+    assert keys(entries) == ["C:BelRog93a", "C:Other93", "C:BelRog93b"]
+
+
+def test_collision_letters_with_existing_keys():
+    db = BibliographyData()
+    db.add_entry(EntryKey.from_string("C:BelRog93"), paper("Mihir Bellare and Phillip Rogaway"))
+    db.add_entry(EntryKey.from_string("C:Other93b"), paper("Ann Other"))
+    entries = [paper("Mihir Bellare and Phillip Rogaway"), paper("Ann Other"), paper("Ann Other")]
+    # existing keys are never renamed, new entries take the first free letters
+    assert keys(entries, db) == ["C:BelRog93a", "C:Other93a", "C:Other93c"]
+
+
+def test_successive_calls_never_collide():
+    gen = keygen.KeyGenerator()
+    first = gen.generate_one(paper("Ann Other"))
+    second = gen.generate_one(paper("Ann Other"))
+    assert (str(first), str(second)) == ("C:Other93", "C:Other93a")
+
+
+def test_letters_after_z():
+    entries = [paper("Ann Other") for _ in range(28)]
+    assert keys(entries)[25:] == ["C:Other93z", "C:Other93aa", "C:Other93ab"]
+
+
+def test_confkey_and_year_without_crossref():
+    entry = Entry("article", {"author": quote("Ann Other"), "year": quote("2001")})
+    assert keys([entry], confkey="JC") == ["JC:Other01"]
@@ -0,0 +1,90 @@
+import io
+
+from mybibtex import diagnostics, generator, latex, parser
+from mybibtex.database import Entry, EntryKey, Value, ValuePartQuote
+
+
+abbrev = '@string{ekey = "Schn€ier"}\n'
+db_text = """
+@InProceedings{C:Sch93,
+  author = "Claus-Peter Schnörr and Łukasz €☃",
+  title = "Title",
+  crossref = "C93",
+}
+@InProceedings{C:Ascii93,
+  author = "John Doe",
+  title = ekey,
+  crossref = "C93",
+}
+"""
+
+
+def test_to_ascii():
+    assert latex.to_ascii("abc") == "abc"
+    assert latex.to_ascii("Schnörr Łukasz") == "Schn{\\\"o}rr {\\L}ukasz"
+    assert latex.to_ascii("€") == "?"
+    assert latex.unmapped_chars("Schnörr €") == ["€"]
+
+
+def test_to_ascii_decomposed():
+    # o + combining diaeresis
+    assert latex.to_ascii("Schno\u0308rr") == "Schn{\\\"o}rr"
+    assert latex.unmapped_chars("Schno\u0308rr") == []
+    # combining character without composed letter
+    assert latex.to_ascii("q\u0308") == "q?"
+
+
+def test_to_ascii_comma_below():
+    assert latex.to_ascii("\u0218tefan \u021Bara") == "{\\textcommabelow S}tefan {\\textcommabelow t}ara"
+    assert latex.to_ascii("S\u0326tefan") == "{\\textcommabelow S}tefan"
+
+
+def test_unmapped_counted_when_parsing(config, collector):
+    p = parser.Parser()
+    p.parse_stream(io.StringIO(abbrev))
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS_TOTAL] == 1
+    db = p.parse_stream(io.StringIO(db_text))
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS_TOTAL] == 2
+    # each parse has its own summary
+    assert p.unmapped is None
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS] == 0
+
+    # rendered fields with unmapped characters are reported when written (not when served from the cache)
+    cache = generator.RenderCache()
+    for _ in range(2):
+        s = generator.bibtex_gen_str(db, entry_filter=generator.FilterPaper(), cache=cache, expand_values=True)
+    assert s.isascii()
+    assert "{\\L}ukasz ??" in s
+    assert "Schn?ier" in s
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS] == 2
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS_TOTAL] == 2
+
+
+def test_unmapped_reported_when_written(config, collector):
+    # entries built in code (importers, merges...) are not parsed
+    entry = Entry("inproceedings", {"title": Value([ValuePartQuote("Snow \u2603")])})
+    s = generator.bibtex_entry_str(None, EntryKey.from_string("C:Snow93"), entry)
+    assert "Snow ?" in s
+    assert collector.counts[diagnostics.UNMAPPED_CHARACTERS] == 1
+
+
+class Row(object):
+    """ row of the web2py database """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def test_sql_write_entry(config, collector):
+    row = Row(
+        id=1, type="inproceedings", key_conf="C", key_year=1993, key_auth="Sch", key_dis="",
+        start_page=1, end_page=10, title="Schnörr \u2603", crossref=None,
+    )
+    out = io.StringIO()
+    generator.sql_write_entry(out, row)
+    # values are not transliterated into LaTeX, non-ascii characters are replaced by '?' and reported
+    assert out.getvalue() == '@Inproceedings{C:Sch93,\n  title =        Schn?rr ?,\n  pages =        "1--10",\n}'
+    assert collector.counts[diagnostics.NON_ASCII_VALUE] == 1
@@ -0,0 +1,116 @@
+from mybibtex import merge
+from mybibtex.database import BibliographyData, Entry, EntryKey, Person, Value, ValuePartQuote
+
+
+def quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+def paper(author, title, pages=None, crossref="C93", **fields):
+    entry = Entry("inproceedings", {"author": quote(author), "title": quote(title), "crossref": quote(crossref)})
+    if pages is not None:
+        entry.fields["pages"] = quote(pages)
+    for (name, value) in fields.items():
+        entry.fields[name] = quote(value)
+    return entry
+
+
+def make_db():
+    db = BibliographyData()
+    db.add_entry("C93", Entry("proceedings", {"title": quote("CRYPTO '93"), "year": quote("1993")}))
+    db.add_entry("C:BelRog93", paper("Mihir Bellare and Phillip Rogaway", "Entity Authentication", "232--249", doi="10.1/abc"))
+    db.add_entry("C:Other93", paper("Ann Other", "Other Paper", "300--310"))
+    db.add_entry("C:Dup93a", paper("Ann Dup", "Same Title", "400--410"))
+    db.add_entry("C:Dup93b", paper("Ann Dup", "Same Title", "411--420"))
+    db.add_entry("C:Used93", paper("Ann Used", "Used Key", "600--610"))
+    db.add_entry("EPRINT:New93", Entry("misc", {"author": quote("Ann New"), "title": quote("Related Title"), "year": quote("1993")}))
+    return db
+
+
+def test_merge():
+    db = make_db()
+    incoming = BibliographyData()
+    incoming.add_entry("C93", Entry("proceedings", {"title": quote("CRYPTO '93"), "year": quote("1993")}))
+    # matched by DOI, title equal up to formatting
+    incoming.add_entry("C:BelRog93a", paper(
+        "Mihir Bellare and Phillip Rogaway", "Entity {A}uthentication.", "232-249",
+        doi="https://doi.org/10.1/ABC", url="http://example.com"))
+    # matched by pages, different title
+    incoming.add_entry("C:Oth93", paper("Ann Other", "Different Title", "300--310"))
+    # matched by title, twice
+    incoming.add_entry("C:Same93", paper("Ann Dup", "Same Title"))
+    # matched by DOI, already matched
+    incoming.add_entry("C:BelRog93b", paper("Mihir Bellare and Phillip Rogaway", "Entity Authentication", doi="10.1/ABC"))
+    # unmatched, key used
+    incoming.add_entry("C:Used93", paper("Ann Used", "Another Paper", "700--710"))
+    incoming.add_entry("C:New93", paper("Ann New", "Related Title", "500--510"))
+
+    result = merge.merge(db, incoming)
+    changes = {str(change.incoming_key): change for change in result.changes}
+    assert {name: change.status for (name, change) in changes.items()} == {
+        "C93": merge.IDENTICAL,
+        "C:BelRog93a": merge.UPDATED,
+        "C:Oth93": merge.CONFLICT,
+        "C:Same93": merge.CONFLICT,
+        "C:BelRog93b": merge.CONFLICT,
+        "C:Used93": merge.CONFLICT,
+        "C:New93": merge.NEW,
+    }
+    assert result.counts() == {merge.NEW: 1, merge.IDENTICAL: 1, merge.UPDATED: 1, merge.CONFLICT: 4}
+
+    updated = changes["C:BelRog93a"]
+    assert str(updated.key) == "C:BelRog93"
+    # different formatting of pages and DOI are updates, url is new
+    assert sorted(updated.fields) == ["doi", "pages", "url"]
+    assert "title differs" in changes["C:Oth93"].reason
+    assert "several matches" in changes["C:Same93"].reason
+    assert "already matched by C:BelRog93a" in changes["C:BelRog93b"].reason
+    assert "key already used" in changes["C:Used93"].reason
+    assert [str(key) for key in changes["C:New93"].related] == ["EPRINT:New93"]
+    assert result.report().splitlines()[0] == "1 new, 1 identical, 1 updated, 4 conflict"
+
+
+def test_apply():
+    db = make_db()
+    incoming = {
+        "C:BelRog93a": paper("Mihir Bellare and Phillip Rogaway", "Entity Authentication", "232--249", doi="10.1/abc", url="http://example.com"),
+        "C:New93": paper("Ann New", "New Paper", "500--510"),
+    }
+    result = merge.merge(db, incoming, related=False)
+    old = db.entries[EntryKey.from_string("C:BelRog93")]
+    result.apply(db)
+
+    assert EntryKey.from_string("C:New93") in db.entries
+    assert EntryKey.from_string("C:BelRog93a") not in db.entries
+    new = db.entries[EntryKey.from_string("C:BelRog93")]
+    assert new is not old
+    assert new.fields["url"].expand() == "http://example.com"
+    # existing entries are replaced, not modified
+    assert "url" not in old.fields
+    # a second merge finds everything
+    assert merge.merge(db, incoming).counts()[merge.IDENTICAL] == 2
+
+
+def test_merge_persons():
+    db = make_db()
+    db.add_entry("C94", Entry("proceedings", {"title": quote("CRYPTO '94"), "editor": quote("Yvo Desmedt")}))
+    incoming = {
+        # editors given as persons only
+        "C93": Entry("proceedings", {"title": quote("CRYPTO '93")}, persons={"editor": [Person("Douglas R. Stinson")]}),
+        "C94": Entry("proceedings", {"title": quote("CRYPTO '94")}, persons={"editor": [Person("Yvo Desmedt")]}),
+    }
+    result = merge.merge(db, incoming)
+    changes = {str(change.incoming_key): change for change in result.changes}
+    assert changes["C93"].status == merge.UPDATED
+    assert changes["C93"].fields == {}
+    assert [str(person) for person in changes["C93"].persons["editor"][1]] == ["Douglas R. Stinson"]
+    assert "editor: (none) -> Douglas R. Stinson" in changes["C93"].describe()
+    # same editor as a field
+    assert changes["C94"].status == merge.IDENTICAL
+
+    old = db.entries[EntryKey.from_string("C93")]
+    result.apply(db)
+    new = db.entries[EntryKey.from_string("C93")]
+    assert [str(person) for person in new.persons["editor"]] == ["Douglas R. Stinson"]
+    assert "editor" not in old.persons
+    assert merge.merge(db, incoming).counts()[merge.IDENTICAL] == 2
@@ -0,0 +1,87 @@
+import pytest
+
+from mybibtex import generator, mmapdb
+from mybibtex.database import EntryKey
+from mybibtex.query import Conf, Index
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(1000, seed=4)
+
+
+@pytest.fixture
+def mapped(db, tmp_path):
+    filename = str(tmp_path / "db.bibdb")
+    mmapdb.write(filename, db)
+    with mmapdb.MappedBibliographyData(filename, cache_size=16) as mapped:
+        yield mapped
+
+
+def fields_bib(entry):
+    return {name: value.to_bib() for (name, value) in entry.fields.items()}
+
+
+def test_entries_round_trip(db, mapped):
+    assert len(mapped.entries) == len(db.entries)
+    assert list(mapped.entries) == list(db.entries)
+    for (key, entry) in mapped.entries.items():
+        original = db.entries[key]
+        assert entry.type == original.type
+        assert fields_bib(entry) == fields_bib(original)
+        assert {name: value.to_bib(expand=True) for (name, value) in entry.fields.items()} == \
+            {name: value.to_bib(expand=True) for (name, value) in original.fields.items()}
+        assert entry.fingerprint() == original.fingerprint()
+    assert mapped.preamble() == db.preamble()
+    assert mapped.confs_years() == db.confs_years()
+
+
+def test_lookup(db, mapped):
+    for key in list(db.entries)[::37]:
+        assert key in mapped.entries
+        assert str(mapped.entries[key].key) == str(key)
+        # uncached access through a crossref
+        entry = mapped.entries[key]
+        if "crossref" in entry.fields:
+            assert entry.get_crossref() is not None
+    missing = EntryKey.from_string("NOPE:Missing99")
+    assert missing not in mapped.entries
+    assert mapped.entries.get(missing) is None
+    with pytest.raises(KeyError):
+        mapped.entries[missing]
+
+
+def test_index(db, mapped):
+    index = Index(db.entries)
+    assert {confkey: list(keys) for (confkey, keys) in mapped.index().by_conf.items()} == index.by_conf
+    assert {conf_year: list(keys) for (conf_year, keys) in mapped.index().by_conf_year.items()} == index.by_conf_year
+
+
+def decoded_keys(mapped):
+    return sum(1 for key in mapped.entries._keys if key is not None)
+
+
+def test_index_decodes_queried_keys_only(db, mapped):
+    index = mapped.index()
+    assert decoded_keys(mapped) == 0
+    expected = [(str(k), e.fingerprint()) for (k, e) in Conf("C").run(db.entries)]
+    assert [(str(k), e.fingerprint()) for (k, e) in Conf("C").run(mapped.entries, index)] == expected
+    assert decoded_keys(mapped) == len(expected)
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"include_crossrefs": True},
+    {"expand_crossrefs": True},
+    {"expand_crossrefs": True, "expand_values": True, "remove_empty_fields": True},
+])
+def test_bibtex_gen_identical(db, mapped, options):
+    assert generator.bibtex_gen_str(mapped, **options) == generator.bibtex_gen_str(db, **options)
+
+
+def test_not_a_mapped_database(tmp_path):
+    filename = str(tmp_path / "db.bibdb")
+    with open(filename, "wb") as f:
+        f.write(b"@inproceedings{C:Foo93,}\n" * 10)
+    with pytest.raises(mmapdb.MappedDataError):
+        mmapdb.MappedBibliographyData(filename)
@@ -0,0 +1,46 @@
+import os
+import re
+import stat
+
+from mybibtex.output import AtomicOutput
+
+
+def mode(filename):
+    return stat.S_IMODE(os.stat(filename).st_mode)
+
+
+def test_new_file_mode(tmp_path):
+    filename = str(tmp_path / "out.bib")
+    umask = os.umask(0o027)
+    try:
+        with AtomicOutput(filename) as out:
+            out.write("@string{a = \"A\"}\n")
+    finally:
+        os.umask(umask)
+    assert out.changed
+    assert mode(filename) == 0o640
+
+
+def test_replaced_file_keeps_mode(tmp_path):
+    filename = str(tmp_path / "out.bib")
+    with open(filename, "w") as f:
+        f.write("old\n")
+    os.chmod(filename, 0o640)
+    with AtomicOutput(filename) as out:
+        out.write("new\n")
+    assert out.changed
+    assert mode(filename) == 0o640
+    with open(filename) as f:
+        assert f.read() == "new\n"
+
+
+def test_unchanged_file_not_replaced(tmp_path):
+    filename = str(tmp_path / "out.bib")
+    with open(filename, "w") as f:
+        f.write("% generated on 2020-01-01\nbody\n")
+    inode = os.stat(filename).st_ino
+    with AtomicOutput(filename, ignore_re=re.compile(r"^% generated on")) as out:
+        out.write("% generated on 2024-06-30\nbody\n")
+    assert not out.changed
+    assert os.stat(filename).st_ino == inode
+    assert os.listdir(str(tmp_path)) == ["out.bib"]
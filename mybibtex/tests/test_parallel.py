@@ -0,0 +1,80 @@
+import io
+
+import pytest
+
+from mybibtex import generator
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(300, seed=2)
+
+
+def entries(db):
+    return generator.SortConfYearPage().sort(generator.FilterPaper().filter(db.entries))
+
+
+def serial(db, **options):
+    out = io.StringIO()
+    generator.bibtex_write_entries(out, db, entries(db), **options)
+    return out.getvalue()
+
+
+def parallel(db, pool, **options):
+    out = io.StringIO()
+    generator.bibtex_write_entries_parallel(out, db, entries(db), pool=pool, chunk_size=16, min_entries=0, **options)
+    return out.getvalue()
+
+
+def test_pool_reused_with_several_options(db):
+    cache = generator.RenderCache()
+    with generator.RenderPool(db, 2, cache=cache) as pool:
+        for options in ({}, {"expand_crossrefs": True}, {"expand_values": True, "remove_empty_fields": True}):
+            assert parallel(db, pool, cache=cache, **options) == serial(db, **options)
+
+
+def test_entries_rendered_by_workers_are_cached(db):
+    cache = generator.RenderCache()
+    n = len(list(entries(db)))
+    with generator.RenderPool(db, 2, cache=cache) as pool:
+        expected = serial(db, expand_crossrefs=True)
+        assert parallel(db, pool, cache=cache, expand_crossrefs=True) == expected
+        assert (cache.hits, cache.misses, len(cache.entries)) == (0, n, n)
+    # the entries rendered by the workers are in the cache of the parent process
+    assert serial(db, cache=cache, expand_crossrefs=True) == expected
+    assert (cache.hits, cache.misses) == (n, n)
+
+    # and in the cache of the workers of the next pools
+    with generator.RenderPool(db, 2, cache=cache) as pool:
+        assert parallel(db, pool, cache=cache, expand_crossrefs=True) == expected
+    assert (cache.hits, cache.misses) == (2 * n, n)
+
+
+def test_pool_of_another_database_or_cache(db, corpus_db):
+    cache = generator.RenderCache()
+    other = corpus_db(300, seed=2)
+    with generator.RenderPool(db, 1, cache=cache) as pool:
+        with pytest.raises(ValueError):
+            parallel(other, pool, cache=cache)
+        with pytest.raises(ValueError):
+            parallel(db, pool, cache=generator.RenderCache())
+        with pytest.raises(ValueError):
+            parallel(db, pool)
+
+
+def test_serial_fallback(db, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("no pool should be started")
+    monkeypatch.setattr(generator, "RenderPool", no_pool)
+    expected = serial(db)
+
+    # small corpus
+    out = io.StringIO()
+    generator.bibtex_write_entries_parallel(out, db, entries(db), processes=4)
+    assert out.getvalue() == expected
+
+    # single core
+    monkeypatch.setattr(generator.os, "cpu_count", lambda: 1)
+    out = io.StringIO()
+    generator.bibtex_write_entries_parallel(out, db, entries(db), min_entries=0)
+    assert out.getvalue() == expected
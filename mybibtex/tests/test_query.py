@@ -0,0 +1,161 @@
+import pytest
+
+from mybibtex import generator, tools
+from mybibtex.database import BibliographyData, Entry, Value, ValuePartQuote
+from mybibtex.generator import FilterConf, FilterPaper
+from mybibtex.query import Conf, Index, Paper, QueryFilter, QueryParsingError, YearSelection, Years, parse_query
+
+
+def make_entry(title):
+    return Entry("inproceedings", {"title": Value([ValuePartQuote(title)])})
+
+
+def make_db():
+    db = BibliographyData()
+    db.add_entry("C:BelRog93", make_entry("Entity Authentication"))
+    db.add_entry("C:Shamir93", make_entry("Birational Permutations"))
+    db.add_entry("EC:Nguyen02", make_entry("Lattices"))
+    return db
+
+
+def test_index_valid_until_modified():
+    db = make_db()
+    index = Index(db.entries)
+    assert index.is_valid(db.entries)
+    db.add_entry("EC:Wee05", make_entry("Obfuscation"))
+    assert not index.is_valid(db.entries)
+
+
+def test_index_invalid_after_remove_and_add():
+    db = make_db()
+    index = Index(db.entries)
+    entry = db.remove_entry("EC:Nguyen02")
+    db.add_entry("ZZ:Nguyen02", entry)
+    assert len(db.entries) == index.size
+    assert not index.is_valid(db.entries)
+
+    # queries given the stale index rebuild it instead of using it
+    assert [str(k) for (k, e) in Conf("EC").run(db.entries, index)] == []
+    assert [str(k) for (k, e) in Conf("ZZ").run(db.entries, index)] == ["ZZ:Nguyen02"]
+
+    query_filter = QueryFilter("conf:EC", index=index)
+    assert list(query_filter.filter(db.entries)) == []
+
+
+def test_index_invalid_after_replace():
+    db = make_db()
+    index = Index(db.entries)
+    db.replace_entry("C:Shamir93", make_entry("Other"))
+    assert not index.is_valid(db.entries)
+
+
+def test_index_plain_dict():
+    db = make_db()
+    entries = dict(db.entries)
+    index = Index(entries)
+    assert index.is_valid(entries)
+    assert not index.is_valid(db.entries)
+
+
+def brute_force(db, predicate):
+    return sorted(str(k) for (k, e) in db.entries.items() if predicate(k, e))
+
+
+def selected(query, db, index=None):
+    return sorted(str(k) for (k, e) in query.run(db.entries, index))
+
+
+def full_year(k):
+    return tools.short_to_full_year(k.year)
+
+
+def test_parse_query(corpus_db):
+    db = corpus_db(1000, seed=5)
+    cases = [
+        ("conf:C,EC", lambda k, e: k.confkey in ("C", "EC")),
+        ("year:2000", lambda k, e: full_year(k) == 2000),
+        ("year:2000-", lambda k, e: full_year(k) >= 2000),
+        ("year:-2010", lambda k, e: full_year(k) <= 2010),
+        (
+            "conf:C year:1990-1999 paper",
+            lambda k, e: k.confkey == "C" and 1990 <= full_year(k) <= 1999 and k.auth is not None
+        ),
+        ("conf:EC -paper", lambda k, e: k.confkey == "EC" and k.auth is None),
+        ("-conf:C,EC,EPRINT proceedings", lambda k, e: k.confkey not in ("C", "EC", "EPRINT") and k.auth is None),
+        ("has:doi -year:2000-2020", lambda k, e: "doi" in e.fields and not 2000 <= full_year(k) <= 2020),
+        (
+            "author:bellare conf:C",
+            lambda k, e: k.confkey == "C" and "author" in e.fields and "bellare" in e.fields["author"].expand().lower()
+        ),
+    ]
+    for (s, predicate) in cases:
+        expected = brute_force(db, predicate)
+        assert len(expected) > 0, s
+        assert selected(parse_query(s), db) == expected, s
+
+
+def test_parse_query_errors():
+    for s in ["", "   ", "year:", "year:20a0", "year:2000-2010-2020", "conf:", "paper:C", "has:", "title:Lattice"]:
+        with pytest.raises(QueryParsingError):
+            parse_query(s)
+
+
+def test_and_plan_conf_conf(corpus_db):
+    db = corpus_db(1000, seed=5)
+    index = Index(db.entries)
+    query = Conf("C", "EC") & Conf("EC", "AC")
+    (keys, predicate) = query.plan(index)
+    # candidates are taken from the index, not from a full scan
+    assert keys is not None and len(keys) < len(db.entries)
+    assert selected(query, db, index) == brute_force(db, lambda k, e: k.confkey == "EC")
+
+
+def test_and_plan_conf_years(corpus_db):
+    db = corpus_db(1000, seed=5)
+    index = Index(db.entries)
+    query = Conf("C", "EC") & Years(1995, None) & Years(None, 2005)
+    (keys, predicate) = query.plan(index)
+    # all the predicates are answered by the index by (conference, year)
+    assert predicate is None
+    expected = brute_force(db, lambda k, e: k.confkey in ("C", "EC") and 1995 <= full_year(k) <= 2005)
+    assert sorted(str(k) for k in keys) == expected
+    assert selected(query, db, index) == expected
+
+
+def test_or_candidates(corpus_db):
+    db = corpus_db(1000, seed=5)
+    index = Index(db.entries)
+
+    query = Conf("C") | Conf("EC")
+    assert query.candidates(index) is not None
+    assert selected(query, db, index) == brute_force(db, lambda k, e: k.confkey in ("C", "EC"))
+
+    # Paper has no index: full scan
+    query = Conf("C") | Paper()
+    assert query.candidates(index) is None
+    assert query.plan(index)[0] is None
+    assert selected(query, db, index) == brute_force(db, lambda k, e: k.confkey == "C" or k.auth is not None)
+
+
+def test_year_selection(corpus_db):
+    db = corpus_db(1000, seed=5)
+    years = {"C": range(1990, 2001), "EC": [1985, 2015, 2016], "UNKNOWN": [2000]}
+    selection = {confkey: sum(tools.year_bit(year) for year in conf_years) for (confkey, conf_years) in years.items()}
+    expected = brute_force(db, lambda k, e: full_year(k) in years.get(k.confkey, []))
+    assert len(expected) > 0
+    assert selected(YearSelection(selection), db) == expected
+    assert selected(YearSelection(selection) & Paper(), db) == brute_force(
+        db, lambda k, e: full_year(k) in years.get(k.confkey, []) and k.auth is not None
+    )
+    assert sorted(str(k) for (k, e) in db.entries.items() if YearSelection(selection).compile()(k, e)) == expected
+
+
+def test_query_filter_equals_entry_filters(corpus_db):
+    db = corpus_db(1000, seed=5)
+    for confkey in ["C", "JC", "EPRINT", "UNKNOWN"]:
+        expected = sorted(str(k) for (k, e) in FilterPaper(FilterConf(confkey)).filter(db.entries))
+        query_filter = QueryFilter("conf:{0} paper".format(confkey))
+        assert sorted(str(k) for (k, e) in query_filter.filter(db.entries)) == expected
+        assert generator.bibtex_gen_str(db, entry_filter=query_filter) == generator.bibtex_gen_str(
+            db, entry_filter=FilterPaper(FilterConf(confkey))
+        )
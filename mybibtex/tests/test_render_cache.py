@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from mybibtex import generator
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(100, seed=4)
+
+
+def test_lru_eviction():
+    cache = generator.RenderCache(max_entries=2)
+    cache.set(("a",), "A")
+    cache.set(("b",), "B")
+    assert cache.get(("a",)) == "A"
+    cache.set(("c",), "C")
+    assert list(cache.entries) == [("a",), ("c",)]
+    assert cache.get(("b",)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_save_load(db, tmp_path):
+    filename = str(tmp_path / "cache.jsonl")
+    cache = generator.RenderCache()
+    expected = generator.bibtex_gen_str(db, expand_crossrefs=True, cache=cache)
+    cache.save(filename)
+
+    loaded = generator.RenderCache.load(filename)
+    assert loaded.entries == cache.entries
+    assert list(loaded.entries) == list(cache.entries)
+    assert generator.bibtex_gen_str(db, expand_crossrefs=True, cache=loaded) == expected
+    assert loaded.misses == 0
+
+    # only the most recently used entries are loaded
+    small = generator.RenderCache.load(filename, max_entries=10)
+    assert list(small.entries) == list(cache.entries)[-10:]
+
+
+def test_load_invalid(tmp_path):
+    filename = tmp_path / "cache.jsonl"
+    assert len(generator.RenderCache.load(str(filename)).entries) == 0
+
+    filename.write_text(json.dumps({"version": generator.RenderCache.version - 1}) + "\n" + json.dumps([["k"], "s"]) + "\n")
+    assert len(generator.RenderCache.load(str(filename)).entries) == 0
+
+    filename.write_text(json.dumps({"version": generator.RenderCache.version}) + "\n" + json.dumps(["k", 1]) + "\n")
+    assert len(generator.RenderCache.load(str(filename)).entries) == 0
+
+    filename.write_bytes(b"\x80\x04\x95garbage")
+    assert len(generator.RenderCache.load(str(filename)).entries) == 0
@@ -0,0 +1,94 @@
+import pytest
+
+from mybibtex.database import BibliographyData, Entry, EntryKey, Value, ValuePartQuote
+from mybibtex.query import Conf, Index
+from mybibtex.snapshot import SnapshotStore
+
+
+def value(s):
+    return Value([ValuePartQuote(s)])
+
+
+def make_db():
+    db = BibliographyData()
+    db.add_entry("C93", Entry("proceedings", {"booktitle": value("CRYPTO 1993")}))
+    db.add_entry("C:BelRog93", Entry("inproceedings", {"title": value("Entity Authentication"), "crossref": value("C93")}))
+    db.add_entry("C:Shamir93", Entry("inproceedings", {"title": value("Birational Permutations"), "crossref": value("C93")}))
+    db.add_entry("EC:Nguyen02", Entry("inproceedings", {"title": value("Lattices")}))
+    return db
+
+
+def key(s):
+    return EntryKey.from_string(s)
+
+
+def buckets(index):
+    return (
+        {k: sorted(map(str, keys)) for (k, keys) in index.by_conf.items()},
+        {k: sorted(map(str, keys)) for (k, keys) in index.by_conf_year.items()},
+    )
+
+
+def test_store_leaves_db_unchanged():
+    db = make_db()
+    store = SnapshotStore(db)
+    snap = store.current()
+    for (k, entry) in db.entries.items():
+        assert entry.collection is db
+        assert snap.entries[k] is not entry
+        assert snap.entries[k] == entry
+    # crossrefs are still resolved through db
+    assert db.entries[key("C:BelRog93")].fields["booktitle"].expand() == "CRYPTO 1993"
+
+
+def test_snapshot_isolation():
+    store = SnapshotStore(make_db())
+    snap0 = store.current()
+    with store.transaction() as txn:
+        txn.add_entry("EC:Wee05", Entry("inproceedings", {"title": value("Obfuscation")}))
+        txn.replace_entry("C:Shamir93", Entry("inproceedings", {"title": value("Birational Permutations (revised)")}))
+        txn.remove_entry("EC:Nguyen02")
+        # readers still see the published version during the transaction
+        assert store.current() is snap0
+    snap1 = store.current()
+
+    assert snap1.version == snap0.version + 1
+    assert sorted(map(str, snap0.entries)) == ["C93", "C:BelRog93", "C:Shamir93", "EC:Nguyen02"]
+    assert snap0.entries[key("C:Shamir93")].fields["title"].expand() == "Birational Permutations"
+    assert sorted(map(str, snap1.entries)) == ["C93", "C:BelRog93", "C:Shamir93", "EC:Wee05"]
+    assert snap1.entries[key("C:Shamir93")].fields["title"].expand() == "Birational Permutations (revised)"
+    assert snap0.confs_years() != snap1.confs_years()
+
+
+def test_transaction_rolled_back_on_error():
+    store = SnapshotStore(make_db())
+    snap0 = store.current()
+    with pytest.raises(KeyError):
+        with store.transaction() as txn:
+            txn.add_entry("EC:Wee05", Entry("inproceedings", {"title": value("Obfuscation")}))
+            txn.remove_entry("EC:Missing99")
+    assert store.current() is snap0
+    assert key("EC:Wee05") not in store.current().entries
+
+
+def test_index_updated_by_transactions():
+    store = SnapshotStore(make_db())
+    index0 = store.current().index()
+    with store.transaction() as txn:
+        txn.add_entry("EC:Wee05", Entry("inproceedings", {"title": value("Obfuscation")}))
+        txn.add_entry("TCC:Pass05", Entry("inproceedings", {"title": value("Concurrent Composition")}))
+        txn.remove_entry("TCC:Pass05")
+        txn.remove_entry("EC:Nguyen02")
+        txn.remove_entry("C:Shamir93")
+        txn.add_entry("C:Shamir93", Entry("inproceedings", {"title": value("Birational Permutations")}))
+    snap = store.current()
+    index = snap.index()
+
+    assert index is not index0
+    assert index.is_valid(snap.entries)
+    assert buckets(index) == buckets(Index(snap.entries))
+    assert "TCC" not in index.by_conf
+    assert [str(k) for (k, e) in Conf("EC").run(snap.entries, index)] == ["EC:Wee05"]
+    # the index of the previous version is unchanged
+    assert index0.is_valid(store.current().entries) is False
+    assert sorted(map(str, index0.by_conf["EC"])) == ["EC:Nguyen02"]
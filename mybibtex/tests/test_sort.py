@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from mybibtex import generator
+from mybibtex.database import BibliographyData, Entry, Value, ValuePartQuote
+
+
+def long_confs():
+    # names longer than 15 characters, one being a prefix of the other followed by "-"
+    return {
+        "LONG": {"key": "LONG", "type": "conf", "name": "International Workshop"},
+        "LONGB": {"key": "LONGB", "type": "conf", "name": "International Workshop-B"},
+        "C": {"key": "C", "type": "conf", "name": "CRYPTO"},
+        "JC": {"key": "JC", "type": "journal", "name": "Journal of Cryptology"},
+    }
+
+
+@pytest.fixture
+def config(config):
+    config.confs = long_confs()
+    return config
+
+
+def quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+def make_db():
+    r = random.Random(0)
+    db = BibliographyData()
+    for i in range(300):
+        confkey = r.choice(["LONG", "LONGB", "C", "JC", "UNKNOWN"])
+        fields = {"title": quote("Paper {0}".format(i))}
+        if r.random() < 0.8:
+            start = r.randint(1, 500)
+            fields["pages"] = quote(r.choice(["{0}--{1}".format(start, start + 20), str(start), "5:{0}--5:{1}".format(start, start + 3)]))
+        if confkey != "JC" and r.random() < 0.7:
+            fields["crossref"] = quote("{0}{1:02d}{2}".format(confkey, r.randint(0, 99), r.choice(["", "-1", "-2"])))
+        if r.random() < 0.3:
+            fields["volume"] = quote(r.choice([str(r.randint(1, 40)), "IV", "xii"]))
+        if r.random() < 0.3:
+            fields["number"] = quote(str(r.randint(1, 4)))
+        if r.random() < 0.1:
+            fields["howpublished"] = quote("Cryptology ePrint Archive, Report {0}/{1}".format(r.randint(1996, 2023), r.randint(1, 999)))
+        dis = "".join(chr(ord("a") + int(d)) for d in str(i))
+        db.add_entry("{0}:Auth{1:02d}{2}".format(confkey, r.randint(0, 99), dis), Entry("inproceedings", fields))
+    return db
+
+
+def test_fast_key_equals_key(config):
+    sort = generator.SortConfYearPage()
+    for ke in make_db().entries.items():
+        assert sort.fast_key(ke) == sort.key(ke)
+
+
+def test_sort_order_equals_string_key_order(config):
+    db = make_db()
+    sort = generator.SortConfYearPage()
+    entries = list(db.entries.items())
+    expected = [k for (k, e) in sorted(entries, key=sort.key)]
+    assert [k for (k, e) in sort.sort(entries)] == expected
+    # a second sort (warm caches) gives the same order
+    random.Random(1).shuffle(entries)
+    assert [k for (k, e) in sort.sort(entries)] == expected
+
+
+def test_sort_order_synthetic_corpus(corpus_db):
+    db = corpus_db(2000, seed=3)
+    sort = generator.SortConfYearPage()
+    entries = list(db.entries.items())
+    assert [k for (k, e) in sort.sort(entries)] == [k for (k, e) in sorted(entries, key=sort.key)]
+
+
+def test_shared_instance_follows_config(config):
+    sort = generator.SortConfYearPage()
+    entries = list(make_db().entries.items())
+    first = [k for (k, e) in sort.sort(entries)]
+
+    # another configuration (e.g., reloaded): names of the conferences swapped
+    confs = long_confs()
+    (confs["C"]["name"], confs["LONG"]["name"]) = (confs["LONG"]["name"], confs["C"]["name"])
+    config.confs = confs
+    expected = [k for (k, e) in sorted(entries, key=sort.key)]
+    assert expected != first
+    assert [k for (k, e) in sort.sort(entries)] == expected
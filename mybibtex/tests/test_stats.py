@@ -0,0 +1,83 @@
+import io
+import json
+
+import pytest
+
+from benchmarks.corpus import Corpus
+from mybibtex import generator, parser, stats
+
+
+@pytest.fixture
+def corpus(monkeypatch):
+    corpus = Corpus(200, seed=5)
+    monkeypatch.setattr(generator, "config", corpus.config)
+    return corpus
+
+
+def parse(corpus):
+    p = parser.Parser()
+    p.parse_stream(io.StringIO(corpus.abbrev))
+    return p.parse_stream(io.StringIO(corpus.db))
+
+
+def test_disabled_is_noop(corpus, monkeypatch, tmp_path):
+    assert stats.current is None
+    expected = generator.bibtex_gen_str(parse(corpus), include_crossrefs=True)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stage recorded while profiling is disabled")
+    monkeypatch.setattr(stats.Stats, "get", fail)
+    db = parse(corpus)
+    assert generator.bibtex_gen_str(db, include_crossrefs=True, cache=generator.RenderCache()) == expected
+    generator.bibtex_gen_file(str(tmp_path / "out.bib"), db)
+    assert stats.current is None
+
+
+def test_stages_recorded(corpus, tmp_path):
+    cache = generator.RenderCache()
+    with stats.profile() as s:
+        assert stats.current is s
+        db = parse(corpus)
+        generator.bibtex_gen_str(db, cache=cache)
+        res = generator.bibtex_gen_str(db, cache=cache)
+        generator.bibtex_gen_file(str(tmp_path / "out.bib"), db)
+    assert stats.current is None
+    assert list(s.stages) == ["parse", "filter", "sort", "render", "write", "commit"]
+
+    papers = len(list(generator.FilterPaper().filter(db.entries)))
+    parse_stage = s.stages["parse"]
+    assert parse_stage.calls == 2
+    assert parse_stage.entries == len(db.entries)
+    assert parse_stage.bytes == len(corpus.abbrev.encode("utf8")) + len(corpus.db.encode("utf8"))
+    assert (s.stages["filter"].calls, s.stages["filter"].entries) == (3, 3 * papers)
+    assert (s.stages["sort"].calls, s.stages["sort"].entries) == (3, 3 * papers)
+    render = s.stages["render"]
+    assert (render.calls, render.entries) == (3, 3 * papers)
+    # first generation fills the cache, the second one only hits, the third one has no cache
+    assert (render.cache_hits, render.cache_misses) == (papers, papers)
+    assert render.cache_hit_rate() == 0.5
+    write = s.stages["write"]
+    assert write.entries == 3 * papers
+    with open(str(tmp_path / "out.bib"), encoding="utf8") as f:
+        assert f.read() == res
+    assert write.bytes == 3 * len(res.encode("utf8"))
+    assert s.stages["commit"].calls == 1
+    for stage in s.stages.values():
+        assert stage.wall >= 0 and stage.cpu >= 0
+        assert stage.peak_memory is None
+
+    assert json.loads(s.to_json())["render"]["cache_hit_rate"] == 0.5
+    table = s.table().split("\n")
+    assert [line.split()[0] for line in table] == ["stage"] + list(s.stages)
+
+
+def test_memory(corpus):
+    with stats.profile(memory=True) as s:
+        with s.stage("outer"):
+            db = parse(corpus)
+            with s.stage("inner"):
+                generator.bibtex_gen_str(db)
+    assert stats.current is None
+    assert s.stages["parse"].peak_memory > 0
+    assert s.stages["outer"].peak_memory >= s.stages["parse"].peak_memory
+    assert s.stages["outer"].peak_memory >= s.stages["inner"].peak_memory > 0
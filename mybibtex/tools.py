@@ -1,2 +1,23 @@
 def short_to_full_year(year):
     return 1900+year if year >= 80 else 2000+year
+
+BASE_YEAR = 1970
+""" first year of bitsets of years: bit i is set iff year BASE_YEAR + i is in the set
+(the full years of keys are after 1980, see short_to_full_year) """
+
+def year_bit(year):
+    """ Return the bitset of the single year year (year >= BASE_YEAR) """
+    return 1 << (year - BASE_YEAR)
+
+def has_year(bits, year):
+    """ Return True iff year is in the bitset of years bits """
+    return year >= BASE_YEAR and (bits >> (year - BASE_YEAR)) & 1 == 1
+
+def bits_to_years(bits):
+    """ Return the sorted list of years of a bitset of years """
+    years = []
+    while bits:
+        low = bits & -bits
+        years.append(BASE_YEAR + low.bit_length() - 1)
+        bits ^= low
+    return years
@@ -0,0 +1,165 @@
+"""
+Pre-rendered shards for custom bibliographies
+
+An offline step (build_shards) renders the papers of each (conference, year) in the final sort order
+into a single data file, and writes an index file with the byte offsets of each shard.
+A custom bibliography (years selected per conference, as returned by web2py_ctrl_default.get_years)
+is then the ordered concatenation of some shards, which can be read with pread or sent with sendfile,
+without rendering anything.
+
+The concatenation is exactly the output of bibtex_gen for the selected papers with the same options,
+as long as each crossrefed entry is in the same (conference, year) as the papers crossrefing it
+(checked by build_shards).
+"""
+
+import json
+import os
+
+from mybibtex import generator
+from mybibtex import tools
+
+data_filename = "shards.bib"
+index_filename = "shards.json"
+version = 1
+
+
+def build_shards(dirname, db, entry_sort=None, expand_crossrefs=False, include_crossrefs=False, **kwargs):
+    """ Build the shards of all the papers of db in the directory dirname
+    (options are the ones of bibtex_gen, except entry_filter which is always FilterPaper) """
+    if entry_sort is None:
+        entry_sort = generator.SortConfYearPage()
+    with_crossrefs = expand_crossrefs == False and include_crossrefs == True
+
+    entries = entry_sort.sort(generator.FilterPaper().filter(db.entries))
+
+    # group papers by (conference, year), groups have to be contiguous in the sort order
+    groups = []
+    for (key, entry) in entries:
+        group_key = (key.confkey, tools.short_to_full_year(key.year))
+        if len(groups) == 0 or groups[-1][0] != group_key:
+            groups.append((group_key, []))
+        groups[-1][1].append((key, entry))
+    if len(set(group_key for (group_key, _) in groups)) != len(groups):
+        raise ValueError("papers of a same (conference, year) are not contiguous in the sort order")
+
+    papers_index = []
+    crossrefs_index = []
+    tmp_data = os.path.join(dirname, data_filename + ".tmp")
+    offset = 0
+    with open(tmp_data, "wb") as f:
+        def write_shard(index, group_key, group):
+            nonlocal offset
+            data = "".join(
+                generator.bibtex_entry_str(db, key, entry, expand_crossrefs=expand_crossrefs, **kwargs) + "\n\n"
+                for (key, entry) in group
+            ).encode("utf8")
+            f.write(data)
+            index.append([group_key[0], group_key[1], offset, len(data)])
+            offset += len(data)
+
+        for (group_key, group) in groups:
+            write_shard(papers_index, group_key, group)
+
+        if with_crossrefs:
+            for (group_key, group) in groups:
+                crossrefs = generator.get_crossrefs(db, group)
+                for crossref in crossrefs:
+                    if (crossref.confkey, tools.short_to_full_year(crossref.year)) != group_key:
+                        raise ValueError("crossref {0} is not in the same (conference, year) as papers crossrefing it".format(crossref))
+                if len(crossrefs) > 0:
+                    write_shard(crossrefs_index, group_key, entry_sort.sort(iter(crossrefs.items())))
+
+    index = {
+        "version": version,
+        "size": offset,
+        "papers": papers_index,
+        "crossrefs": crossrefs_index,
+    }
+    tmp_index = os.path.join(dirname, index_filename + ".tmp")
+    with open(tmp_index, "w", encoding="utf8") as f:
+        json.dump(index, f)
+    # readers keep the data file they opened, so that replacing files does not affect them (see Shards)
+    os.replace(tmp_data, os.path.join(dirname, data_filename))
+    os.replace(tmp_index, os.path.join(dirname, index_filename))
+
+
+class Shards(object):
+    """ Read-only access to shards built by build_shards """
+
+    def __init__(self, dirname, retries=5):
+        # a rebuild may happen between opening the data file and reading the index:
+        # in this case, the size of the data file does not match the index and we retry
+        for _ in range(retries):
+            self.fd = os.open(os.path.join(dirname, data_filename), os.O_RDONLY)
+            with open(os.path.join(dirname, index_filename), encoding="utf8") as f:
+                index = json.load(f)
+            if index["version"] != version:
+                os.close(self.fd)
+                raise ValueError("unsupported shards version {0}".format(index["version"]))
+            if os.fstat(self.fd).st_size == index["size"]:
+                break
+            os.close(self.fd)
+        else:
+            raise ValueError("shards data file does not match the index")
+        self.papers = [tuple(shard) for shard in index["papers"]]
+        self.crossrefs = [tuple(shard) for shard in index["crossrefs"]]
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def spans(self, years):
+        """ Return the list of (offset, length) to concatenate for the selection years:
+        dictionary conference key -> (start year, end year) (as returned by web2py_ctrl_default.get_years)
+        or conference key -> bitset of years (as returned by web2py_ctrl_default.resolve_years).
+        Contiguous spans are merged. """
+        def selected(confkey, year):
+            if confkey not in years:
+                return False
+            if isinstance(years[confkey], int):
+                return tools.has_year(years[confkey], year)
+            (start_year, end_year) = years[confkey]
+            return start_year <= year <= end_year
+
+        res = []
+        for shards in (self.papers, self.crossrefs):
+            for (confkey, year, offset, length) in shards:
+                if not selected(confkey, year):
+                    continue
+                if len(res) > 0 and res[-1][0] + res[-1][1] == offset:
+                    res[-1] = (res[-1][0], res[-1][1] + length)
+                else:
+                    res.append((offset, length))
+        return res
+
+    def read(self, years):
+        """ Return the custom bibliography for the selection years (see spans) as bytes """
+        return b"".join(os.pread(self.fd, length, offset) for (offset, length) in self.spans(years))
+
+    def iter_chunks(self, years, chunk_size=1 << 20):
+        """ Iterate over the custom bibliography for the selection years (see spans) by chunks of bytes """
+        for (offset, length) in self.spans(years):
+            while length > 0:
+                data = os.pread(self.fd, min(length, chunk_size), offset)
+                offset += len(data)
+                length -= len(data)
+                yield data
+
+    def sendfile(self, out_fd, years):
+        """ Send the custom bibliography for the selection years (see spans) to the file descriptor out_fd
+        (usually a socket) using zero-copy sendfile. Return the number of bytes sent. """
+        total = 0
+        for (offset, length) in self.spans(years):
+            while length > 0:
+                sent = os.sendfile(out_fd, self.fd, offset, length)
+                if sent == 0:
+                    raise BrokenPipeError("sendfile: connection closed")
+                offset += sent
+                length -= sent
+                total += sent
+        return total
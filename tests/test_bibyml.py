@@ -0,0 +1,144 @@
+import io
+import os
+
+import pytest
+
+from benchmarks.corpus import Corpus
+import bibyml
+
+
+text = """eurocrypt:              test
+    2013:               aa
+    2015:               bb
+        sub:            cc
+crypto: 
+    1993:               dd
+"""
+
+tree = {
+    "eurocrypt": {"": "test", "2013": {"": "aa"}, "2015": {"": "bb", "sub": {"": "cc"}}},
+    "crypto": {"1993": {"": "dd"}},
+}
+
+
+def test_parse():
+    assert bibyml.parse(io.StringIO(text)) == tree
+    assert list(bibyml.parse(io.StringIO(text))) == ["eurocrypt", "crypto"]
+
+
+def test_roundtrip():
+    assert bibyml.write_str(bibyml.parse(io.StringIO(text))) == text
+    big_tree = {
+        "conf{0}".format(i): {"": "name {0}".format(i), **{
+            str(1980 + j): {"": "v{0}".format(j), "sub": {"": "x"}} if j % 3 == 0 else {"": "v{0}".format(j)}
+            for j in range(40)
+        }}
+        for i in range(30)
+    }
+    big_text = bibyml.write_str(big_tree)
+    assert bibyml.parse(io.StringIO(big_text)) == big_tree
+    assert bibyml.write_str(bibyml.parse(io.StringIO(big_text))) == big_text
+
+    corpus_tree = Corpus(500, seed=2).bibyml()
+    corpus_text = bibyml.write_str(corpus_tree)
+    assert bibyml.parse(io.StringIO(corpus_text)) == corpus_tree
+    assert bibyml.write_str(bibyml.parse(io.StringIO(corpus_text))) == corpus_text
+
+
+def test_parse_errors():
+    with pytest.raises(bibyml.ParserError, match="indentation problem"):
+        bibyml.parse(io.StringIO("a: 1\n    b: 2\n  c: 3\n"))
+    with pytest.raises(bibyml.ParserError, match="only spaces are accepted"):
+        bibyml.parse(io.StringIO("a: 1\n \tb: 2\n"))
+    with pytest.raises(bibyml.ParserError):
+        bibyml.parse(io.StringIO("no colon\n"))
+
+
+def test_parse_path_cache(tmp_path):
+    path = str(tmp_path / "confs.bibyml")
+    with open(path, "w", encoding="utf8") as f:
+        f.write(text)
+    assert bibyml.parse_path(path) == tree
+    assert os.path.exists(path + bibyml.cache_suffix)
+    assert bibyml.parse_path(path) == tree
+
+    # the cache is invalidated when the file changes
+    with open(path, "a", encoding="utf8") as f:
+        f.write("asiacrypt: ee\n")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert bibyml.parse_path(path)["asiacrypt"] == {"": "ee"}
+
+    # a corrupted cache is ignored
+    with open(path + bibyml.cache_suffix, "wb") as f:
+        f.write(b"garbage")
+    assert bibyml.parse_path(path)["asiacrypt"] == {"": "ee"}
+
+
+def write_file(tmp_path, content):
+    path = str(tmp_path / "confs.bibyml")
+    with open(path, "w", encoding="utf8") as f:
+        f.write(content)
+    return path
+
+
+def read_file(path):
+    with open(path, encoding="utf8") as f:
+        return f.read()
+
+
+def test_patch_apply(tmp_path):
+    # a hand-formatted file: untouched lines keep their formatting
+    path = write_file(tmp_path, "eurocrypt: test\n  2013: aa\n  2015: bb\n\ncrypto: \n    1993:   dd\n")
+    with bibyml.Patch(path) as patch:
+        patch.set(["eurocrypt", "2013"], "changed")
+        patch.set(["eurocrypt", "2016"], "new")
+        patch.set(["asiacrypt", "2000", "sub"], "deep")
+        patch.delete(["crypto", "1993"])
+        assert patch.get(["eurocrypt", "2016"]) == "new"
+        assert patch.get(["crypto", "1993"]) is None
+    content = read_file(path)
+    assert content == (
+        "eurocrypt: test\n"
+        "  2013:                 changed\n"
+        "  2015: bb\n"
+        "  2016:                 new\n"
+        "\n"
+        "crypto: \n"
+        "asiacrypt: \n"
+        "    2000: \n"
+        "        sub:            deep\n"
+    )
+    tree = bibyml.parse(io.StringIO(content))
+    assert tree["eurocrypt"]["2013"] == {"": "changed"}
+    assert tree["asiacrypt"] == {"2000": {"sub": {"": "deep"}}}
+    assert tree["crypto"] == {}
+
+
+def test_patch_same_as_write(tmp_path):
+    d = {"a": {"": "1", "x": {"": "2"}}, "b": {"": "3"}}
+    path = write_file(tmp_path, bibyml.write_str(d))
+    with bibyml.Patch(path) as patch:
+        patch.set(["a", "y"], "4")
+        patch.set(["c"], "5")
+        patch.delete(["b"])
+    assert read_file(path) == bibyml.write_str({"a": {"": "1", "x": {"": "2"}, "y": {"": "4"}}, "c": {"": "5"}})
+
+
+def test_patch_no_edit(tmp_path):
+    path = write_file(tmp_path, text)
+    mtime = os.stat(path).st_mtime_ns
+    with bibyml.Patch(path) as patch:
+        patch.set(["eurocrypt", "2013"], "aa")
+        assert not patch.apply()
+    assert os.stat(path).st_mtime_ns == mtime
+
+    patch = bibyml.Patch(path)
+    with pytest.raises(KeyError):
+        patch.delete(["missing"])
+    # edits are not applied when leaving the block with an exception
+    with pytest.raises(RuntimeError):
+        with bibyml.Patch(path) as patch:
+            patch.set(["eurocrypt"], "changed")
+            raise RuntimeError()
+    assert read_file(path) == text
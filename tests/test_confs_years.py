@@ -0,0 +1,54 @@
+import random
+
+import confs_years
+from mybibtex.database import Entry, EntryKey, Value, ValuePartQuote
+
+
+class Entries(object):
+    """ database without maintained coverage: confs_years recomputes it from the entries """
+
+    def __init__(self, entries):
+        self.entries = entries
+
+
+def recomputed(db):
+    return confs_years.get_confs_years_bits(Entries(db.entries))
+
+
+def make_entry(title):
+    return Entry("inproceedings", {"title": Value([ValuePartQuote(title)])})
+
+
+def test_incremental_coverage_equals_recomputed(corpus_db):
+    db = corpus_db(300, seed=8)
+    assert db.confs_years() == recomputed(db)
+
+    r = random.Random(0)
+    for i in range(300):
+        keys = list(db.entries)
+        op = r.choice(["add", "remove", "replace"])
+        if op == "add":
+            dis = "".join(chr(ord("a") + int(d)) for d in str(i))
+            key = "{0}:New{1:02d}{2}".format(r.choice(["C", "EC", "NEW"]), r.randint(0, 99), dis)
+            db.add_entry(key, make_entry("New {0}".format(i)))
+        elif op == "remove":
+            db.remove_entry(r.choice(keys))
+        else:
+            db.replace_entry(r.choice(keys), make_entry("Replaced {0}".format(i)))
+        assert db.confs_years() == recomputed(db), (op, i)
+
+    # removing all the papers of a conference removes it
+    for key in [key for key in db.entries if key.confkey == "C"]:
+        db.remove_entry(key)
+    assert "C" not in db.confs_years()
+    assert db.confs_years() == recomputed(db)
+
+
+def test_proceedings_not_counted(corpus_db):
+    db = corpus_db(300, seed=8)
+    db.add_entry("NEW95", make_entry("Proceedings"))
+    assert "NEW" not in db.confs_years()
+    db.add_entry("NEW:Paper95", make_entry("Paper"))
+    assert confs_years.get_confs_years(db)["NEW"] == {1995}
+    db.remove_entry(EntryKey.from_string("NEW:Paper95"))
+    assert db.confs_years() == recomputed(db)
@@ -0,0 +1,44 @@
+import io
+import random
+
+from benchmarks.corpus import Corpus
+from mybibtex import parser
+
+
+def parse(corpus):
+    p = parser.Parser()
+    p.parse_stream(io.StringIO(corpus.abbrev))
+    return p.parse_stream(io.StringIO(corpus.db))
+
+
+def test_same_seed_same_corpus(tmp_path):
+    corpus = Corpus(500, seed=3)
+    # the global random state does not matter
+    random.seed(1)
+    other = Corpus(500, seed=3)
+    assert other.db == corpus.db
+    assert other.abbrev == corpus.abbrev
+    assert other.bibyml() == corpus.bibyml()
+    assert other.config.confs == corpus.config.confs
+
+    (abbrev_filename, db_filename) = other.write(str(tmp_path))
+    with open(abbrev_filename, encoding="utf8") as f:
+        assert f.read() == corpus.abbrev
+    with open(db_filename, encoding="utf8") as f:
+        assert f.read() == corpus.db
+
+
+def test_other_seed_other_corpus():
+    corpus = Corpus(500, seed=3)
+    other = Corpus(500, seed=4)
+    assert other.db != corpus.db
+    assert other.abbrev == corpus.abbrev
+
+
+def test_corpus_parsed():
+    corpus = Corpus(500, seed=3)
+    db = parse(corpus)
+    # keys are unique: no entry is lost when parsing
+    assert len(db.entries) == corpus.db.count("\n@") + 1
+    assert 400 <= sum(1 for key in db.entries if key.auth is not None) <= 600
+    assert {key.confkey for key in db.entries} == set(corpus.config.confs)
@@ -0,0 +1,61 @@
+import pytest
+
+from mybibtex import generator
+from mybibtex.database import Entry, Value, ValuePartQuote
+from mybibtex.query import Conf, Paper, QueryFilter, Years
+import shards
+import web2py_ctrl_default
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(500, seed=10)
+
+
+def quote(s):
+    return Value([ValuePartQuote(s)])
+
+
+@pytest.mark.parametrize("options", [{}, {"include_crossrefs": True}, {"expand_crossrefs": True}])
+def test_shard_equals_conference(db, tmp_path, options):
+    shards.build_shards(str(tmp_path), db, **options)
+    with shards.Shards(str(tmp_path)) as s:
+        for confkey in ["C", "EC", "JC", "EPRINT"]:
+            expected = generator.bibtex_gen_str(db, entry_filter=generator.FilterPaper(generator.FilterConf(confkey)), **options)
+            assert s.read({confkey: (1900, 2100)}).decode("utf8") == expected
+            assert b"".join(s.iter_chunks({confkey: (1900, 2100)}, chunk_size=1000)).decode("utf8") == expected
+
+
+def test_selection_equals_query(db, tmp_path):
+    shards.build_shards(str(tmp_path), db)
+    query = (Conf("C") & Years(1990, 2000)) | (Conf("EC") & Years(2010, 2010))
+    expected = generator.bibtex_gen_str(db, entry_filter=QueryFilter(query & Paper()))
+    with shards.Shards(str(tmp_path)) as s:
+        assert s.read({"C": (1990, 2000), "EC": (2010, 2010)}).decode("utf8") == expected
+        bits = {"C": web2py_ctrl_default.years_to_bits(1990, 2000), "EC": web2py_ctrl_default.years_to_bits(2010, 2010)}
+        assert s.read(bits).decode("utf8") == expected
+
+
+def test_rebuilt_after_database_changes(db, tmp_path):
+    shards.build_shards(str(tmp_path), db)
+    old = shards.Shards(str(tmp_path))
+    expected_old = generator.bibtex_gen_str(db, entry_filter=generator.FilterPaper(generator.FilterConf("C")))
+
+    key = next(key for key in db.entries if key.confkey == "C" and key.auth is not None)
+    db.replace_entry(key, Entry("inproceedings", dict(db.entries[key].fields, title=quote("Changed Title"))))
+    db.add_entry("C:Added95", Entry("inproceedings", {
+        "author": quote("Ann Added"), "title": quote("Added Paper"), "pages": quote("1--2"), "crossref": quote("C95"),
+    }))
+    db.remove_entry(next(k for k in db.entries if k.confkey == "C" and k.auth is not None and k != key))
+    expected = generator.bibtex_gen_str(db, entry_filter=generator.FilterPaper(generator.FilterConf("C")))
+    assert expected != expected_old
+    assert "Changed Title" in expected and "Added Paper" in expected
+
+    shards.build_shards(str(tmp_path), db)
+    try:
+        # readers opened before the rebuild keep the old shards
+        assert old.read({"C": (1900, 2100)}).decode("utf8") == expected_old
+        with shards.Shards(str(tmp_path)) as s:
+            assert s.read({"C": (1900, 2100)}).decode("utf8") == expected
+    finally:
+        old.close()
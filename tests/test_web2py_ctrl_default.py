@@ -0,0 +1,57 @@
+import itertools
+
+from mybibtex import tools
+import web2py_ctrl_default
+
+
+confs = [
+    {"key": "C", "start_year": 1981, "end_year": 2023},
+    {"key": "EC", "start_year": 1982, "end_year": 2023},
+    {"key": "OLD", "start_year": 1970, "end_year": 1985},
+]
+years_strings = [
+    "", "2000", "2000-", "-2010", "2000-2010", " 1990 - 1995 ", "-", "1900-1985", "1960", "2010-2000", "2030-", "abc",
+    "2000-2010-2020",
+]
+
+
+def test_base_year():
+    assert web2py_ctrl_default.BASE_YEAR == tools.BASE_YEAR
+
+
+def test_resolve_years_equals_get_years():
+    table = web2py_ctrl_default.CoverageTable(confs)
+    for strings in itertools.product(years_strings, repeat=len(confs)):
+        vars = {"years" + conf["key"]: s for (conf, s) in zip(confs, strings)}
+        # variables of unknown conferences are ignored
+        vars["yearsUNKNOWN"] = "2000"
+        (errors, years, nb) = web2py_ctrl_default.get_years(confs, vars)
+        (resolved_errors, selection, resolved_nb) = web2py_ctrl_default.resolve_years(table, vars)
+        assert resolved_errors == errors, vars
+        assert resolved_nb == nb, vars
+        assert {
+            confkey: tools.bits_to_years(bits) for (confkey, bits) in selection.items()
+        } == {
+            confkey: list(range(start_year, end_year + 1)) for (confkey, (start_year, end_year)) in years.items()
+        }, vars
+
+
+def test_resolve_years_missing_variables():
+    # missing variables are empty strings for get_years
+    table = web2py_ctrl_default.CoverageTable(confs)
+    (errors, selection, nb) = web2py_ctrl_default.resolve_years(table, {"yearsC": "1990-"})
+    (errors_expected, years, nb_expected) = web2py_ctrl_default.get_years(
+        confs, {"yearsC": "1990-", "yearsEC": "", "yearsOLD": ""}
+    )
+    assert (errors, nb) == (errors_expected, nb_expected) == ({}, 1)
+    assert tools.bits_to_years(selection["C"]) == list(range(years["C"][0], years["C"][1] + 1))
+
+
+def test_years_to_bits():
+    assert web2py_ctrl_default.years_to_bits(1970, 1970) == 1
+    assert tools.bits_to_years(web2py_ctrl_default.years_to_bits(1981, 1984)) == [1981, 1982, 1983, 1984]
+    # years before the base year cannot be selected
+    assert tools.bits_to_years(web2py_ctrl_default.years_to_bits(1960, 1971)) == [1970, 1971]
+    assert web2py_ctrl_default.years_to_bits(1950, 1960) == 0
+    # the bitsets of recent years stay small
+    assert web2py_ctrl_default.years_to_bits(2000, 2023).bit_length() == 2023 - tools.BASE_YEAR + 1
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+import pytest
+
+from mybibtex import generator
+from mybibtex.query import Conf, Paper, QueryFilter, Years
+import shards
+import web2py_ctrl_default
+import web_service
+
+
+@pytest.fixture
+def db(corpus_db):
+    return corpus_db(300, seed=1)
+
+
+confs = [{"key": "C", "start_year": 1981, "end_year": 2023}, {"key": "EC", "start_year": 1982, "end_year": 2023}]
+target = "/custom.bib?yearsC=2000-2010&yearsEC=2015"
+
+
+def expected(db):
+    """ Return the bibliography of target, selected with web2py_ctrl_default.get_years and a query """
+    (errors, years, nb) = web2py_ctrl_default.get_years(confs, {"yearsC": "2000-2010", "yearsEC": "2015"})
+    query = None
+    for (confkey, (start_year, end_year)) in years.items():
+        conf_query = Conf(confkey) & Years(start_year, end_year)
+        query = conf_query if query is None else query | conf_query
+    return generator.bibtex_gen_str(db, entry_filter=QueryFilter(query & Paper()))
+
+
+async def request(port, *requests):
+    """ Send the raw requests on a connection and return the list of (status line, headers, body) """
+    (reader, writer) = await asyncio.open_connection("127.0.0.1", port)
+    res = []
+    for raw in requests:
+        writer.write(raw)
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = dict((name.lower(), value) for (name, _, value) in (line.partition(": ") for line in lines[1:] if line))
+        if raw.startswith(b"HEAD") or lines[0].split()[1] == "304":
+            body = b""
+        else:
+            body = await reader.readexactly(int(headers["content-length"]))
+        res.append((lines[0], headers, body))
+    # the last request has "Connection: close"
+    assert await reader.read() == b""
+    writer.close()
+    return res
+
+
+def run_client(service, *requests):
+    async def main():
+        server = await web_service.start_server(service, "127.0.0.1", 0)
+        async with server:
+            return await request(server.sockets[0].getsockname()[1], *requests)
+    return asyncio.run(main())
+
+
+def test_start_server(db):
+    service = web_service.BibService(db, confs)
+    get = "GET {0} HTTP/1.1\r\nConnection: close\r\n\r\n".format(target).encode()
+    [(status, headers, body)] = run_client(service, get)
+    assert status == "HTTP/1.1 200 OK"
+    assert body.decode("utf8") == expected(db)
+
+    # keep-alive: conditional request, and a request body consumed before the next request
+    conditional = "GET {0} HTTP/1.1\r\nIf-None-Match: {1}\r\n\r\n".format(target, headers["etag"]).encode()
+    post = b"POST /custom.bib HTTP/1.1\r\nContent-Length: 11\r\n\r\nGET / HTTP/"
+    [(status1, _, _), (status2, _, _), (status3, _, body3)] = run_client(service, conditional, post, get)
+    assert status1 == "HTTP/1.1 304 Not Modified"
+    assert status2 == "HTTP/1.1 405 Method Not Allowed"
+    assert status3 == "HTTP/1.1 200 OK"
+    assert body3 == body
+
+
+def test_start_server_request_body_too_large(db):
+    service = web_service.BibService(db, confs)
+    [(status, headers, _)] = run_client(service, b"POST / HTTP/1.1\r\nContent-Length: 100000000\r\n\r\n")
+    assert status == "HTTP/1.1 413 Payload Too Large"
+    assert headers["connection"] == "close"
+
+
+def test_start_server_shards(db, tmp_path):
+    shards.build_shards(str(tmp_path), db)
+    with shards.Shards(str(tmp_path)) as s:
+        service = web_service.BibService(db, confs, shards=s, header="% header\n")
+        get = "GET {0} HTTP/1.1\r\nAccept-Encoding: gzip\r\n\r\n".format(target).encode()
+        head = "HEAD {0} HTTP/1.0\r\n\r\n".format(target).encode()
+        [(status, headers, body), (_, head_headers, _)] = run_client(service, get, head)
+    assert status == "HTTP/1.1 200 OK"
+    assert "content-encoding" not in headers
+    assert body.decode("utf8") == "% header\n" + expected(db)
+    assert head_headers["etag"] == headers["etag"]
+
+
+def test_concurrent_requests_render_once(db):
+    service = web_service.BibService(db, confs)
+    render = service.render
+    rendering = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_render(selection):
+        calls.append(selection)
+        rendering.set()
+        release.wait()
+        return render(selection)
+
+    service.render = slow_render
+    (_, selection, _) = service.parse_target(target)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get(selection))) for _ in range(4)]
+    threads[0].start()
+    rendering.wait()
+    for thread in threads[1:]:
+        thread.start()
+    assert service.get_in_flight(selection) is not None
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(cached is results[0] for cached in results)
+    assert service.get_in_flight(selection) is None
@@ -10,6 +10,42 @@ import re
 re_years = re.compile(r"^\s*(\d*)\s*(-\s*(\d*)\s*)?$")
 
 
+def _parse_years(years_conf: str):
+    """ Parse a years string "a", "a-", "-c", "a-c"... into (a, b, c) as in get_years
+    (b is the optional part "-c"), or return None if the string is invalid """
+    r = re_years.match(years_conf)
+    if r is None:
+        return None
+    a = r.group(1)
+    b = r.group(2)
+    c = r.group(3)
+
+    a = None if a == "" else a
+    b = None if b == "" else b
+    c = None if c == "" else c
+    return a, b, c
+
+
+def _resolve_years(parsed, conf_start_year: int, conf_end_year: int):
+    """ Return the (start year, end year) selected by parsed (output of _parse_years) for a conference
+    covering conf_start_year to conf_end_year, None if nothing is selected, or False if the range is empty """
+    (a, b, c) = parsed
+
+    start_year = int(a) if a is not None else a
+    end_year = int(c) if c is not None else c
+    end_year = start_year if b is not None else end_year
+
+    if a is None and b is None:
+        return None
+
+    start_year = max(start_year, conf_start_year) if start_year != None else conf_start_year
+    end_year = min(end_year, conf_end_year) if end_year != None else conf_end_year
+
+    if start_year > end_year:
+        return False
+    return start_year, end_year
+
+
 def get_years(confs: iter, vars: dict) -> Tuple[dict, dict, int]:
     errors = {}
     years = {}
@@ -17,31 +53,77 @@ def get_years(confs: iter, vars: dict) -> Tuple[dict, dict, int]:
 
     for conf in confs:
         years_conf = vars["years" + conf["key"]]
-        r = re_years.match(years_conf)
-        if r is not None:
-            a = r.group(1)
-            b = r.group(2)
-            c = r.group(3)
+        parsed = _parse_years(years_conf)
+        if parsed is not None:
+            res = _resolve_years(parsed, conf["start_year"], conf["end_year"])
+            if res is False:
+                errors[conf["key"]] = True
+                continue
+            if res is not None:
+                nb += 1
+                years[conf["key"]] = res
+        else:
+            errors[conf["key"]] = True
 
-            a = None if a == "" else a
-            b = None if b == "" else b
-            c = None if c == "" else c
+    return errors, years, nb
 
-            start_year = int(a) if a is not None else a
-            end_year = int(c) if c is not None else c
-            end_year = start_year if b is not None else end_year
 
-            if a is not None or b is not None:
-                start_year = max(start_year, conf["start_year"]) if start_year != None else conf["start_year"]
-                end_year = min(end_year, conf["end_year"]) if end_year != None else conf["end_year"]
+BASE_YEAR = 1970
+""" first year of bitsets of years: bit i is set iff year BASE_YEAR + i is selected
+(same as mybibtex.tools.BASE_YEAR, this module does not depend on mybibtex) """
 
-                if start_year > end_year:
-                    errors[conf["key"]] = True
-                    continue
 
-                nb += 1
-                years[conf["key"]] = (start_year, end_year)
-        else:
-            errors[conf["key"]] = True
+def years_to_bits(start_year: int, end_year: int) -> int:
+    """ Return the bitset of the years start_year to end_year (years before BASE_YEAR are ignored) """
+    start = max(start_year - BASE_YEAR, 0)
+    end = end_year - BASE_YEAR
+    if end < start:
+        return 0
+    return ((1 << (end + 1)) - 1) ^ ((1 << start) - 1)
 
-    return errors, years, nb
+
+class CoverageTable(object):
+    """ Precomputed coverage of conferences (rows with fields key, start_year and end_year), for resolve_years """
+
+    def __init__(self, confs: iter):
+        self.confs = [(conf["key"], "years" + conf["key"], conf["start_year"], conf["end_year"]) for conf in confs]
+        self.cache = {}
+        """ cache of resolved selections: (years string, start year, end year) -> bitset or False """
+
+    def resolve(self, years_conf: str, conf_start_year: int, conf_end_year: int):
+        """ Return the bitset of years selected by the string years_conf (0 if nothing is selected),
+        or False in case of error """
+        cache_key = (years_conf, conf_start_year, conf_end_year)
+        bits = self.cache.get(cache_key)
+        if bits is None:
+            parsed = _parse_years(years_conf)
+            res = _resolve_years(parsed, conf_start_year, conf_end_year) if parsed is not None else False
+            if res is False:
+                bits = False
+            elif res is None:
+                bits = 0
+            else:
+                bits = years_to_bits(*res)
+            if len(self.cache) < 100000:
+                self.cache[cache_key] = bits
+        return bits
+
+
+def resolve_years(table: CoverageTable, vars: dict) -> Tuple[dict, dict, int]:
+    """ Batch version of get_years: return (errors, selection, nb)
+    where selection is a dictionary conference key -> bitset of selected years (see years_to_bits).
+    Strings are parsed once and cached in the table, so that requests cost a few dictionary lookups per conference. """
+    errors = {}
+    selection = {}
+
+    for (key, var_name, start_year, end_year) in table.confs:
+        years_conf = vars.get(var_name, "")
+        if years_conf == "":
+            continue
+        bits = table.resolve(years_conf, start_year, end_year)
+        if bits is False:
+            errors[key] = True
+        elif bits != 0:
+            selection[key] = bits
+
+    return errors, selection, len(selection)
@@ -0,0 +1,371 @@
+"""
+Lightweight asyncio HTTP service serving custom bibliographies
+
+The parsed database (and its indexes) stays in memory: a request only resolves the years<conf> parameters
+(the ones understood by web2py_ctrl_default.get_years), selects entries through the index
+and renders them with a RenderCache (shared by the rendering threads).
+Rendered responses are cached by selection (concurrent requests for the same selection wait for a single rendering),
+and support ETag / If-None-Match (digest of the content) and gzip.
+With pre-rendered shards (see shards.py), responses are sent from the shards data file with sendfile instead
+(without gzip, their ETag being a digest of the data file identity and of the spans sent).
+
+Example:
+
+>>> service = BibService(db, confs)  # confs: rows with key, start_year and end_year
+>>> serve(service, "127.0.0.1", 8080)
+
+and then: GET /custom.bib?yearsC=2000-2010&yearsEC=2015-
+
+BibService.handle does not depend on asyncio and can be used directly in tests,
+start_server can be used to serve on a free local port within an event loop.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import os
+import threading
+import urllib.parse
+
+from mybibtex import generator
+from mybibtex.query import Index, Paper, QueryFilter, YearSelection
+import web2py_ctrl_default
+
+_reasons = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class Response(object):
+    def __init__(self, status, body=b"", headers=None, content_length=None, file=None, spans=()):
+        self.status = status
+        self.body = body
+        self.headers = headers if headers is not None else []
+        self.content_length = content_length if content_length is not None else len(body)
+        """ Content-Length header (differs from the length of body for HEAD requests and file spans) """
+        self.file = file
+        self.spans = spans
+        """ list of (offset, length) of file sent after body """
+
+    def head(self):
+        """ Return the status line and headers of the response as bytes """
+        lines = ["HTTP/1.1 {0} {1}".format(self.status, _reasons[self.status])]
+        lines.extend("{0}: {1}".format(name, value) for (name, value) in self.headers)
+        lines.append("Content-Length: {0}".format(self.content_length))
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class _CachedBody(object):
+    """ Rendered bibliography with its ETag and (lazily) its gzip version """
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"{0}"'.format(hashlib.sha256(body).hexdigest()[:32])
+        self._gzip = None
+
+    def gzip(self):
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzip
+
+
+class _ShardsBody(object):
+    """ Custom bibliography made of the header and of spans of the shards data file """
+
+    def __init__(self, header, shards, spans):
+        self.header = header
+        self.spans = spans
+        self.length = len(header) + sum(length for (_, length) in spans)
+        stat = os.fstat(shards.fd)
+        digest = hashlib.sha256(header)
+        digest.update(repr((stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, spans)).encode("utf8"))
+        self.etag = '"{0}"'.format(digest.hexdigest()[:32])
+
+
+def _etag_matches(if_none_match, etag):
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+def _accepts_gzip(accept_encoding):
+    for coding in accept_encoding.split(","):
+        parts = coding.strip().split(";")
+        if parts[0].strip().lower() == "gzip":
+            return not any(p.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for p in parts[1:])
+    return False
+
+
+class BibService(object):
+    def __init__(self, db, confs, shards=None, header="", max_cached_responses=1024, **bibtex_options):
+        """
+        @arg db: parsed database (BibliographyData, or mmapdb.MappedBibliographyData shared by the workers)
+        @arg confs: conferences that can be selected (rows with key, start_year and end_year)
+        @arg shards: shards.Shards to use instead of rendering entries (has to be built with the same options)
+        @arg header: bytes or string prepended to each bibliography
+        @arg bibtex_options: options of bibtex_gen (expand_crossrefs, include_crossrefs, ...)
+        """
+        self.db = db
+        self.table = web2py_ctrl_default.CoverageTable(confs)
+        self.shards = shards
+        self.header = header.encode("utf8") if isinstance(header, str) else header
+        self.bibtex_options = bibtex_options
+        self.index = db.index() if hasattr(db, "index") else Index(db.entries)
+        self.render_cache = generator.RenderCache()
+        self.entry_sort = generator.SortConfYearPage()
+        # the render cache and the sort are shared by the rendering threads
+        self.max_cached_responses = max_cached_responses
+        self._responses = collections.OrderedDict()
+        self._in_flight = {}
+        """ selection -> concurrent.futures.Future of the body being rendered """
+        self._lock = threading.Lock()
+        """ lock of _responses and _in_flight """
+        if shards is not None:
+            # only used by loop.sendfile, which sends from explicit offsets
+            self._shards_file = open(shards.fd, "rb", buffering=0, closefd=False)
+
+    def render(self, selection):
+        """ Return the bibliography (bytes) of the selection (conference key -> bitset of years) """
+        if self.shards is not None:
+            return self.header + self.shards.read(selection)
+        s = generator.bibtex_gen_str(
+            self.db,
+            entry_filter=QueryFilter(YearSelection(selection) & Paper(), index=self.index),
+            entry_sort=self.entry_sort,
+            cache=self.render_cache,
+            **self.bibtex_options
+        )
+        return self.header + s.encode("utf8")
+
+    def get_cached(self, selection):
+        """ Return the cached body of the selection or None """
+        cache_key = frozenset(selection.items())
+        with self._lock:
+            cached = self._responses.get(cache_key)
+            if cached is not None:
+                self._responses.move_to_end(cache_key)
+        return cached
+
+    def get_in_flight(self, selection):
+        """ Return the future of the body of the selection if it is being rendered, None otherwise """
+        with self._lock:
+            return self._in_flight.get(frozenset(selection.items()))
+
+    def get(self, selection):
+        """ Return the cached body of the selection, rendering it if needed
+        (or waiting for the rendering started by another thread) """
+        if self.shards is not None:
+            return _ShardsBody(self.header, self.shards, self.shards.spans(selection))
+        cache_key = frozenset(selection.items())
+        with self._lock:
+            cached = self._responses.get(cache_key)
+            if cached is not None:
+                self._responses.move_to_end(cache_key)
+                return cached
+            future = self._in_flight.get(cache_key)
+            if future is None:
+                future = self._in_flight[cache_key] = concurrent.futures.Future()
+                rendering = True
+            else:
+                rendering = False
+        if not rendering:
+            return future.result()
+
+        try:
+            cached = _CachedBody(self.render(selection))
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[cache_key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._responses[cache_key] = cached
+            while len(self._responses) > self.max_cached_responses:
+                self._responses.popitem(last=False)
+            del self._in_flight[cache_key]
+        future.set_result(cached)
+        return cached
+
+    def parse_target(self, target):
+        """ Return (path, selection, errors) from a request target "/custom.bib?yearsC=..." """
+        url = urllib.parse.urlsplit(target)
+        params = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        variables = {name: values[-1] for (name, values) in params.items()}
+        (errors, selection, nb) = web2py_ctrl_default.resolve_years(self.table, variables)
+        return url.path, selection, errors
+
+    def response(self, cached, headers, head_only=False):
+        """ Return the Response for the cached body given request headers (lower-case names) """
+        response_headers = [
+            ("Content-Type", "application/x-bibtex; charset=utf-8"),
+            ("ETag", cached.etag),
+            ("Vary", "Accept-Encoding"),
+            ("Cache-Control", "no-cache"),
+        ]
+        if _etag_matches(headers.get("if-none-match", ""), cached.etag):
+            return Response(304, headers=response_headers)
+        if isinstance(cached, _ShardsBody):
+            if head_only:
+                return Response(200, b"", response_headers, content_length=cached.length)
+            return Response(200, cached.header, response_headers, content_length=cached.length,
+                            file=self._shards_file, spans=cached.spans)
+        if _accepts_gzip(headers.get("accept-encoding", "")):
+            body = cached.gzip()
+            response_headers.append(("Content-Encoding", "gzip"))
+        else:
+            body = cached.body
+        if head_only:
+            return Response(200, b"", response_headers, content_length=len(body))
+        return Response(200, body, response_headers)
+
+    def handle(self, method, target, headers):
+        """ Handle a request synchronously and return a Response (headers: dictionary with lower-case names) """
+        if method not in ("GET", "HEAD"):
+            return Response(405, b"method not allowed\n", [("Allow", "GET, HEAD")])
+        (path, selection, errors) = self.parse_target(target)
+        if path not in ("/", "/custom.bib"):
+            return Response(404, b"not found\n")
+        if len(errors) > 0:
+            return Response(400, "invalid years for: {0}\n".format(", ".join(sorted(errors))).encode("utf8"))
+        return self.response(self.get(selection), headers, head_only=(method == "HEAD"))
+
+    async def handle_async(self, method, target, headers):
+        """ Same as handle, but renders cache misses in a thread (or waits for the rendering in progress),
+        so that the event loop keeps serving requests """
+        if method in ("GET", "HEAD") and self.shards is None:
+            (path, selection, errors) = self.parse_target(target)
+            if path in ("/", "/custom.bib") and len(errors) == 0 and self.get_cached(selection) is None:
+                future = self.get_in_flight(selection)
+                if future is not None:
+                    await asyncio.wrap_future(future)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(None, self.get, selection)
+        return self.handle(method, target, headers)
+
+
+class _RequestError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+async def _read_request(reader, max_body_size=1 << 16):
+    """ Return (method, target, version, headers) or None if the connection is closed.
+    The body of the request (if any, see Content-Length) is read and discarded. """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise _RequestError(400, "invalid request line")
+    (method, target, version) = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        (name, _, value) = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    # the body has to be consumed for the next request of the connection to be read
+    if "transfer-encoding" in headers:
+        raise _RequestError(400, "transfer-encoding is not supported")
+    content_length = headers.get("content-length", "0")
+    if not content_length.isdigit():
+        raise _RequestError(400, "invalid content-length")
+    content_length = int(content_length)
+    if content_length > max_body_size:
+        raise _RequestError(413, "request body too large")
+    if content_length > 0:
+        try:
+            await reader.readexactly(content_length)
+        except asyncio.IncompleteReadError:
+            return None
+    return method, target, version, headers
+
+
+async def _send_file(writer, file, spans, chunk_size):
+    """ Send the spans (offset, length) of file with sendfile, or by chunks if the transport does not support it """
+    loop = asyncio.get_running_loop()
+    for (offset, length) in spans:
+        try:
+            await loop.sendfile(writer.transport, file, offset, length, fallback=False)
+        except asyncio.SendfileNotAvailableError:
+            while length > 0:
+                data = os.pread(file.fileno(), min(length, chunk_size), offset)
+                if len(data) == 0:
+                    raise ConnectionError("shards data file truncated")
+                writer.write(data)
+                await writer.drain()
+                offset += len(data)
+                length -= len(data)
+
+
+async def _handle_connection(service, reader, writer, chunk_size=1 << 16):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except _RequestError as e:
+                response = Response(e.status, "{0}\n".format(e).encode("utf8"), [("Connection", "close")])
+                writer.write(response.head() + response.body)
+                break
+            except (ValueError, asyncio.LimitOverrunError): # line too long
+                response = Response(400, b"bad request\n", [("Connection", "close")])
+                writer.write(response.head() + response.body)
+                break
+            if request is None:
+                break
+            (method, target, version, headers) = request
+            try:
+                response = await service.handle_async(method, target, headers)
+            except Exception:
+                response = Response(500, b"internal server error\n")
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            if not keep_alive:
+                response.headers.append(("Connection", "close"))
+            writer.write(response.head())
+            body = response.body
+            for i in range(0, len(body), chunk_size):
+                writer.write(body[i:i+chunk_size])
+                await writer.drain()
+            await writer.drain()
+            if len(response.spans) > 0:
+                await _send_file(writer, response.file, response.spans, chunk_size)
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(service, host="127.0.0.1", port=8080):
+    """ Start serving service on host:port and return the asyncio server (port=0 picks a free port) """
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer),
+        host, port
+    )
+
+
+async def _serve_forever(service, host, port):
+    server = await start_server(service, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def serve(service, host="127.0.0.1", port=8080):
+    """ Serve service forever on host:port """
+    asyncio.run(_serve_forever(service, host, port))